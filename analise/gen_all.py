@@ -1,15 +1,97 @@
-from gen_features import gen_features
-from sys import argv
+from sys import argv, path
 from typing import Any
+import json
 import os
+path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "make_features"))
+from feature_generators.fzn2feat_generator import Fzn2feat_generator
 
+MANIFEST_NAME = "manifest.jsonl"
+FEATURES_NAME = "features.jsonl"
 
-def gen_all(eprime_file, param_folder, file_folder="features", save=True, verbose=True):
-    
-    files = [f for f in os.listdir(param_folder) if os.path.isfile(os.path.join(param_folder, f)) and ".param" in f]
-    for param in files:
-        instance = os.path.join(param_folder, param)
-        gen_features(eprime_file, instance, save=save, verbose=verbose, file_name=f"{os.path.join(file_folder, param)}.json")
+def read_jsonl(file_name:'str') -> 'dict[str,dict]':
+    """
+    Reads a json lines file keeping, for each instance, only its last entry
+    """
+    entries = {}
+    if not os.path.exists(file_name):
+        return entries
+    f = open(file_name)
+    for line in f:
+        try:
+            entry = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        entries[entry["inst"]] = entry
+    f.close()
+    return entries
+
+def write_jsonl(file_name:'str', entries:'list[dict]') -> None:
+    f = open(f"{file_name}.tmp", "w")
+    for entry in entries:
+        f.write(json.dumps(entry) + "\n")
+    f.close()
+    os.replace(f"{file_name}.tmp", file_name)
+
+def append_jsonl(file, entry:'dict') -> None:
+    file.write(json.dumps(entry) + "\n")
+    file.flush()
+
+def gen_all(eprime_file, param_folder, file_folder="features", save=True, verbose=True, jobs=None):
+    """
+    Generates the fzn2feat features of every param file in param_folder, running the instances concurrently.
+    When save is True, the progress is tracked in a manifest (one entry per instance with its status, error and timings)
+    and the features are merged in a single json lines file. Running it again on the same folder only processes the pending and failed instances.
+    """
+    files = sorted([f for f in os.listdir(param_folder) if os.path.isfile(os.path.join(param_folder, f)) and ".param" in f])
+    manifest_file = os.path.join(file_folder, MANIFEST_NAME)
+    features_file = os.path.join(file_folder, FEATURES_NAME)
+    manifest = read_jsonl(manifest_file) if save else {}
+    features = read_jsonl(features_file) if save else {}
+    to_do = [param for param in files if not (param in manifest and manifest[param]["status"] == "done" and param in features)]
+    print_verbose(f"{len(files) - len(to_do)} instances already done, {len(to_do)} to generate", verbose)
+
+    if save:
+        os.makedirs(file_folder, exist_ok=True)
+        for param in to_do:
+            manifest[param] = {"inst": param, "status": "pending"}
+        write_jsonl(manifest_file, list(manifest.values()))
+        manifest_out = open(manifest_file, "a")
+        features_out = open(features_file, "a")
+
+    generator = Fzn2feat_generator(eprime_file)
+    instances = {os.path.join(param_folder, param): param for param in to_do}
+    done, failed = 0, 0
+    for result in generator.generate_batch(list(instances.keys()), jobs):
+        param = instances[result["inst"]]
+        entry = {"inst": param, "time": result["time"]}
+        if "error" in result:
+            failed += 1
+            entry["status"] = "failed"
+            entry["error"] = result["error"]
+            print_verbose(f"{param}: failed ({result['error'].strip()})", verbose)
+        else:
+            done += 1
+            entry["status"] = "done"
+            entry["stages"] = result["stages"]
+            print_verbose(f"{param}: done in {result['time']:,.2f}s ({done + failed}/{len(to_do)})", verbose)
+        if save:
+            if entry["status"] == "done":
+                features[param] = {"inst": param, "features": result["features"]}
+                append_jsonl(features_out, features[param])
+            manifest[param] = entry
+            append_jsonl(manifest_out, entry)
+
+    if save:
+        manifest_out.close()
+        features_out.close()
+        write_jsonl(manifest_file, [manifest[param] for param in files if param in manifest])
+        write_jsonl(features_file, [features[param] for param in files if param in features])
+    print_verbose(f"generated {done} instances, {failed} failed", verbose)
+
+def print_verbose(string:'str', verbose:'bool') -> None:
+    if not verbose:
+        return
+    print(string)
 
 def parse_args():
     args: dict[str,Any] = {
@@ -23,6 +105,8 @@ def parse_args():
             args["save"] = True
         elif "--folder" in arg:
             args["file_folder"] = arg.replace("--folder=","")
+        elif "--jobs" in arg:
+            args["jobs"] = int(arg.replace("--jobs=",""))
         elif arg == "--verbose" or arg == "-v":
             args["verbose"] = True
         elif not "eprime_file" in args:
@@ -38,8 +122,10 @@ def main():
         return
     if argv[1] == "--help" or argv[1] == "-h":
         print(f"""usage: {argv[0]} [options] eprime_file param_folder
---save/-s       save the features as a file (default False)
---folder        personalize the saved file name (default is "features")
+--save/-s       save the features in a single file with a manifest of the done, failed and pending instances.
+                Running again with the same folder resumes from the pending and failed instances (default False)
+--folder        personalize the folder of the saved files (default is "features")
+--jobs          the maximum number of instances to generate at the same time (default is the number of cores, capped by the memory)
 --verbose/-v    print the results (default False)
 --help/-h       shows this message""")
         return
@@ -3,8 +3,10 @@ from devtools import pprint
 from json import loads
 from re import compile
 from typing import Any
-from sys import argv
+from sys import argv, path
 import os
+path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "make_features"))
+from feature_generators.artifact_cache import Artifact_cache
 
 TEAMP_FILENAME = "feat-temp"
 TEMP_FILE = f"./.cache/{TEAMP_FILENAME}"
@@ -26,6 +28,7 @@ def call_savilerow(eprime, param):
         match = prog.match(line)
         if match:
             return match.group(1)
+    raise Exception(process.stdout)
 
 def call_conjure(eprime, param):
     command = ["conjure", "translate-parameter", f"--eprime={eprime}", f"--essence-param={param}", f"--eprime-param={TEMP_FILE}.eprime-param"]
@@ -38,13 +41,26 @@ def call_fzn2feat(model_file):
     process = run(command, stdout=PIPE, stderr=STDOUT, check=True, encoding="UTF-8")
     return process.stdout
 
-def gen_features(eprime_file, param_file, file_name=None, save=True, verbose=True):
+def gen_features(eprime_file, param_file, file_name=None, save=True, verbose=True, use_cache=True):
 
     if not os.path.exists(".cache"):
         os.mkdir(".cache")
 
-    call_conjure(eprime_file, param_file)
-    generated_file = call_savilerow(eprime_file, f"{TEMP_FILE}.eprime-param")
+    eprime_param = f"{TEMP_FILE}.eprime-param"
+    generated_file = f"{eprime_param}.fzn"
+    if use_cache:
+        cache = Artifact_cache()
+        conjure_key = cache.key("conjure", [eprime_file, param_file], ["conjure"])
+        if not cache.get(conjure_key, ".eprime-param", eprime_param):
+            call_conjure(eprime_file, param_file)
+            cache.put(conjure_key, ".eprime-param", eprime_param)
+        savilerow_key = cache.key("savilerow", [eprime_file, eprime_param], ["savilerow"])
+        if not cache.get(savilerow_key, ".fzn", generated_file):
+            generated_file = call_savilerow(eprime_file, eprime_param)
+            cache.put(savilerow_key, ".fzn", generated_file)
+    else:
+        call_conjure(eprime_file, param_file)
+        generated_file = call_savilerow(eprime_file, eprime_param)
     res = call_fzn2feat(generated_file)
     res = res.replace("'", '"')
 
@@ -70,6 +86,8 @@ def parse_args():
             args["file_name"] = arg.replace("--name","")
         elif arg == "--verbose" or arg == "-v":
             args["verbose"] = True
+        elif arg == "--no-cache":
+            args["use_cache"] = False
         elif not "eprime_file" in args:
             args["eprime_file"] = arg
         else:
@@ -85,6 +103,7 @@ def main():
 --save/-s       save the features as a file (default False)
 --name          personalize the saved file name
 --verbose/-v    print the results (default False)
+--no-cache      do not reuse the cached conjure and savilerow outputs
 --help/-h       shows this message""")
         return
     if len(argv) < 3:
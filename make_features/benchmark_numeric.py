@@ -0,0 +1,71 @@
+import argparse
+import json
+import os
+from sys import path
+from time import time
+import numpy as np
+path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "network"))
+from helper import get_dataloader
+from autotune import problem_name
+
+def get_split(n_instances:'int', fold:'int') -> 'tuple[list[int],list[int]]':
+    """
+    Returns the train and test indexes of the fold, as split by the training scripts
+    """
+    train_loader, _, test_loader = get_dataloader(list(range(n_instances)), list(range(n_instances)), 1, [fold])
+    return train_loader.dataset.x, test_loader.dataset.x
+
+def evaluate(generator, data:'list[dict]', names:'list[str]', order:'list[int]', test:'list[int]') -> 'dict[str,float]':
+    """
+    Measures the latency of the generator on the test instances and the time of the options it selects:
+    the options predicted as non competitive are discarded and the best remaining one in the single best order is chosen
+    """
+    latencies, selection_time = [], 0
+    for idx in test:
+        start_time = time()
+        features = generator.generate(data[idx]["instance_value_json"])
+        latencies.append(time() - start_time)
+        times = {t["combination"]: t["time"] for t in data[idx]["all_times"]}
+        remaining = [option for option in order if features[names[option]] < .5]
+        if len(remaining) == 0:
+            remaining = order
+        selection_time += times[names[remaining[0]]]
+    latencies = np.array(latencies) * 1000
+    return {"mean_latency_ms": float(np.mean(latencies)), "p95_latency_ms": float(np.percentile(latencies, 95)), "selection_time": selection_time}
+
+parser = argparse.ArgumentParser(description="Compares, for each problem class, the latency and the selection quality of the numeric generator against the dnn one")
+parser.add_argument("datasets", nargs="+", help="The datasets to use, one per problem class")
+parser.add_argument("--numeric", nargs="+", required=True, help="The weights of the numeric model of each dataset, in the same order")
+parser.add_argument("--dnn", nargs="+", help="The weights of the dnn of each dataset, in the same order. If not given, only the numeric generator is evaluated")
+parser.add_argument("-c", "--config", type=str, help="The local config of the dnn")
+parser.add_argument("-s", "--serializer", type=str, help="The serializer of the dnn. Default = json", default="json")
+parser.add_argument("-f", "--fold", type=int, help="The fold used as test set, as in the training. Default = 0", default=0)
+
+def main():
+    args = parser.parse_args()
+    if len(args.numeric) != len(args.datasets) or (args.dnn is not None and len(args.dnn) != len(args.datasets)):
+        raise Exception("one numeric (and dnn) weights file per dataset is needed")
+    from feature_generators.numeric_generator import Numeric_features_generator
+    if args.dnn is not None:
+        from feature_generators.dnn_generator import Language_features_generator
+    print("problem,generator,instances,mean_latency_ms,p95_latency_ms,selection_time,virtual_best,single_best,selection/vb,selection/sb")
+    for i, dataset in enumerate(args.datasets):
+        f = open(dataset)
+        data = json.load(f)
+        f.close()
+        names = sorted([t["combination"] for t in data[0]["all_times"]])
+        train, test = get_split(len(data), args.fold)
+        times = np.array([[{t["combination"]: t["time"] for t in d["all_times"]}[name] for name in names] for d in data])
+        order = [int(o) for o in np.argsort(times[train].sum(axis=0), kind="stable")]
+        vb = float(times[test].min(axis=1).sum())
+        sb = float(times[test].sum(axis=0).min())
+        generators = {"numeric": lambda: Numeric_features_generator(names, args.numeric[i], probabilities_only=True)}
+        if args.dnn is not None:
+            generators["dnn"] = lambda: Language_features_generator(names, args.dnn[i], True, args.config, args.serializer)
+        for generator_name, get_generator in generators.items():
+            res = evaluate(get_generator(), data, names, order, test)
+            print(f"{problem_name(dataset)},{generator_name},{len(test)},{res['mean_latency_ms']:.3f},{res['p95_latency_ms']:.3f},"+
+                  f"{res['selection_time']:.2f},{vb:.2f},{sb:.2f},{res['selection_time']/vb:.3f},{res['selection_time']/sb:.3f}")
+
+if __name__ == "__main__":
+    main()
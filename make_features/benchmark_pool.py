@@ -0,0 +1,50 @@
+import argparse
+import json
+import os
+from time import time
+import psutil
+
+def memory_usage(process:'psutil.Process') -> 'float':
+    """
+    The proportional set size (MB) of the process and its children: the pages shared by the workers are counted once
+    """
+    processes = [process] + process.children(recursive=True)
+    return sum([p.memory_full_info().pss for p in processes]) / 1024**2
+
+parser = argparse.ArgumentParser(description="Measures the throughput and the memory of the dnn worker pool for several splits of the cores between workers and threads")
+parser.add_argument("-d", "--dataset", type=str, help="The dataset whose instances are used", required=True)
+parser.add_argument("-n", "--names", type=str, help="The names of the probability features", required=True)
+parser.add_argument("-w", "--weights", type=str, help="The weights of the dnn", required=True)
+parser.add_argument("-c", "--config", type=str, help="The local config of the dnn")
+parser.add_argument("-s", "--serializer", type=str, help="The serializer of the dnn. Default = json", default="json")
+parser.add_argument("--splits", type=str, help="A comma separated list of workers x threads splits. Default = 1x{cores},{cores}x1", default=None)
+parser.add_argument("-b", "--batch-sizes", type=str, help="A comma separated list of batch sizes. Default = 1", default="1")
+parser.add_argument("-l", "--limit", type=int, help="The maximum number of instances to use. Default = all", default=None)
+
+def main():
+    args = parser.parse_args()
+    from feature_generators.dnn_generator import Language_features_generator
+    from feature_generators.dnn_pool import Language_features_pool
+    f = open(args.dataset)
+    data = json.load(f)
+    f.close()
+    instances = [d["instance_value_json"] for d in data][:args.limit]
+    cores = os.cpu_count() or 1
+    splits = args.splits if args.splits is not None else f"1x{cores},{cores}x1"
+    generator = Language_features_generator(args.names.split(","), args.weights, config=args.config, serializer=args.serializer)
+    process = psutil.Process()
+    print("workers,threads,batch_size,instances,seconds,instances_per_second,memory_mb")
+    for split in splits.split(","):
+        workers, threads = [int(v) for v in split.split("x")]
+        for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+            with Language_features_pool(generator, workers, threads, batch_size) as pool:
+                # the first batches start the workers and warm up the model
+                pool.generate_batch(instances[:workers * batch_size])
+                start_time = time()
+                pool.generate_batch(instances)
+                end_time = time() - start_time
+                memory = memory_usage(process)
+            print(f"{workers},{threads},{batch_size},{len(instances)},{end_time:.3f},{len(instances) / end_time:.2f},{memory:.1f}")
+
+if __name__ == "__main__":
+    main()
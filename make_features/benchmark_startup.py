@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import subprocess
+from sys import executable, stderr
+from time import time
+import numpy as np
+
+GENERATE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generate.py")
+
+def time_to_first_feature(command:'list[str]', mode:'str') -> 'float':
+    """
+    Runs generate.py and returns its wall time. A run counts as failed if it exits with an error or if it returns no features:
+    generate.py reports a failed fzn2feat generation on stderr but exits normally with empty features and stages
+    """
+    start_time = time()
+    process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="UTF-8")
+    end_time = time() - start_time
+    if process.returncode != 0:
+        raise Exception(process.stderr)
+    try:
+        output = json.loads(process.stdout.strip().split("\n")[-1])
+    except ValueError:
+        raise Exception(f"unreadable output:\n{process.stdout}\n{process.stderr}")
+    if len(output["features"]) == 0 or (mode in ["fzn2feat", "all"] and len(output.get("stages", {})) == 0):
+        raise Exception(f"no features were generated:\n{process.stderr}")
+    return end_time
+
+def get_command(mode:'str', args) -> 'list[str]':
+    instance = args.dnn_instance if mode in ["dnn", "numeric"] and args.dnn_instance is not None else args.instance
+    # with json and time the features and the fzn2feat stages can be checked: both are empty when the generation fails
+    command = [executable, GENERATE_SCRIPT, "--type", mode, "--instance", instance, "--output", "json", "--time"]
+    if mode in ["dnn", "numeric", "all"]:
+        if args.names is None or args.weights is None:
+            raise Exception(f"mode {mode} needs the names and the weights")
+        command += ["--names", args.names, "--weights", args.weights]
+        if args.config is not None and mode != "numeric":
+            command += ["--config", args.config]
+    if mode in ["fzn2feat", "all"]:
+        if args.eprime is None:
+            raise Exception(f"mode {mode} needs the eprime file")
+        command += ["--eprime", args.eprime]
+    if mode == "all":
+        if args.dnn_instance is None:
+            raise Exception(f"mode {mode} needs the dnn instance")
+        command += ["--dnn-instance", args.dnn_instance]
+    return command
+
+parser = argparse.ArgumentParser(description="Measures the time-to-first-feature (process start up, imports, model loading and generation) of generate.py for each mode")
+parser.add_argument("-m", "--modes", type=str, help="A comma separated list of the modes to benchmark. Default = fzn2feat", default="fzn2feat")
+parser.add_argument("-r", "--repetitions", type=int, help="The number of cold starts per mode. Default = 5", default=5)
+parser.add_argument("-i", "--instance", type=str, help="The instance to use (the essence param file for fzn2feat and all, the json instance for dnn if dnn-instance is not given)", required=True)
+parser.add_argument("-j", "--dnn-instance", type=str, help="The json instance to use with the dnn and all modes")
+parser.add_argument("-n", "--names", type=str, help="The names of the probability features (dnn and all)")
+parser.add_argument("-w", "--weights", type=str, help="The weights of the dnn (dnn and all)")
+parser.add_argument("-c", "--config", type=str, help="The local config of the dnn (dnn and all)")
+parser.add_argument("-e", "--eprime", type=str, help="The eprime file (fzn2feat and all)")
+
+def main():
+    args = parser.parse_args()
+    print("mode,repetitions,mean,median,min,max")
+    for mode in args.modes.split(","):
+        command = get_command(mode, args)
+        times = []
+        for _ in range(args.repetitions):
+            try:
+                times.append(time_to_first_feature(command, mode))
+            except Exception as e:
+                print(f"mode {mode} failed. Reason:\n{e}", file=stderr)
+                break
+        if len(times) == 0:
+            continue
+        print(f"{mode},{len(times)},{np.mean(times):.3f},{np.median(times):.3f},{np.min(times):.3f},{np.max(times):.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import hashlib
+import threading
+import shutil
+import os
+
+class Artifact_cache:
+    """
+    A content addressed on-disk cache for the intermediate files of the fzn2feat toolchain (.eprime-param and .fzn files).
+    The entries are keyed by the hash of the input files and of the tools that produced them.
+    When the total size exceeds max_size, the least recently used entries are evicted.
+    """
+
+    CACHE_DIR = os.path.join(".cache", "artifacts")
+    MAX_SIZE = 10 * 1024 ** 3
+
+    def __init__(self, cache_dir:'str' = CACHE_DIR, max_size:'int' = MAX_SIZE) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.tool_versions = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def tool_version(self, tool:'str') -> 'str':
+        """
+        Identifies the installed version of a tool through its resolved executable, without launching it
+        (launching conjure or savilerow costs as much as a cache miss).
+        """
+        if tool not in self.tool_versions:
+            path = shutil.which(tool)
+            if path is None:
+                self.tool_versions[tool] = tool
+            else:
+                path = os.path.realpath(path)
+                stats = os.stat(path)
+                self.tool_versions[tool] = f"{path}:{stats.st_size}:{stats.st_mtime_ns}"
+        return self.tool_versions[tool]
+
+    def key(self, stage:'str', files:'list[str]', tools:'list[str]') -> 'str':
+        digest = hashlib.sha256(stage.encode())
+        for file in files:
+            f = open(file, "rb")
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+            f.close()
+            digest.update(b"\0")
+        for tool in tools:
+            digest.update(self.tool_version(tool).encode())
+        return digest.hexdigest()
+
+    def __path(self, key:'str', suffix:'str') -> 'str':
+        return os.path.join(self.cache_dir, f"{key}{suffix}")
+
+    def get(self, key:'str', suffix:'str', destination:'str') -> 'bool':
+        """
+        Places the cached artifact at destination. Returns False on a cache miss.
+        """
+        path = self.__path(key, suffix)
+        try:
+            os.utime(path)
+            self.__link(path, destination)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put(self, key:'str', suffix:'str', source:'str') -> None:
+        path = self.__path(key, suffix)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        for file in os.listdir(self.cache_dir):
+            if file.endswith(".tmp"):
+                continue
+            try:
+                stats = os.stat(os.path.join(self.cache_dir, file))
+            except FileNotFoundError:
+                continue
+            entries.append((stats.st_mtime, stats.st_size, file))
+        total_size = sum([size for _, size, _ in entries])
+        for _, size, file in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, file))
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def __link(self, source:'str', destination:'str') -> None:
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copyfile(source, destination)
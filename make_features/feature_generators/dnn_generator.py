@@ -1,42 +1,129 @@
 from .base_generator import Generator
+from sys import path
+import os
 import torch.nn as nn
 import torch.nn.functional as F
-from torch import load, device, cuda
-from transformers import AutoModel, AutoTokenizer, logging
+from torch import device, cuda, no_grad, tensor
+from transformers import AutoModel, AutoTokenizer, AutoConfig, logging
+try:
+    from transformers.modeling_utils import no_init_weights
+except ImportError:
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:
+        from contextlib import nullcontext as no_init_weights
 logging.set_verbosity_error()
+path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "network"))
+from serializers import get_serializer
+from models import chunked_tokenize, encode, encode_with_early_exit, read_weights, Exit_head
+from autotune import load_tuning, Tuned_threads
+
+BASE_MODEL = "tororoin/longformer-8bitadam-2048-main"
 
 class Model(nn.Module):
-    def __init__(self, num_classes) -> None:
+    def __init__(self, num_classes, config:'str|None' = None, exit_layers:'list[int]|None' = None) -> None:
         super().__init__()
-        self.bert = AutoModel.from_pretrained("tororoin/longformer-8bitadam-2048-main")
+        if config is None:
+            self.bert = AutoModel.from_pretrained(BASE_MODEL)
+        else:
+            with no_init_weights():
+                self.bert = AutoModel.from_config(AutoConfig.from_pretrained(config, local_files_only=True))
         self.output_layer = nn.Linear(self.bert.config.hidden_size, num_classes)
+        if exit_layers is not None:
+            self.exits = nn.ModuleList([Exit_head(self.bert.config.hidden_size, num_classes) for _ in exit_layers])
+            self.register_buffer("exit_layers", tensor(exit_layers))
 
-    def forward(self, inputs):
-        _, encoded_input = self.bert(**inputs, return_dict = False)
-        out = self.output_layer(encoded_input)
+    def forward(self, inputs, exit_threshold:'float|None' = None):
+        layers = self.bert.config.num_hidden_layers
+        if exit_threshold is None:
+            encoded_input = encode(self.bert, inputs)
+            out = self.output_layer(encoded_input)
+        else:
+            encoded_input, out, layers = encode_with_early_exit(self.bert, self.exits, self.exit_layers.tolist(), inputs, exit_threshold)
+            if out is None:
+                out = self.output_layer(encoded_input)
         out = F.sigmoid(out)
-        return {"out": out.cpu().tolist()[0], "language_model":encoded_input.cpu().tolist()[0]}
+        return {"out": out.cpu().tolist(), "language_model":encoded_input.cpu().tolist(), "layers": layers}
 
 class Language_features_generator(Generator):
-    def __init__(self, names:'list', pre_trained_weights:'str', probabilities_only:'bool'=False) -> None:
+    def __init__(self, names:'list', pre_trained_weights:'str', probabilities_only:'bool'=False, config:'str|None' = None, 
+                 serializer:'str' = "json", max_chunks:'int|None' = None, chunk_size:'int|None' = None, 
+                 exit_threshold:'float|None' = None, tuning_problem:'str|None' = None) -> None:
+        """
+        initialize an instance of the class Language_features_generator.
+        ---------
+        Parameters
+            names:list.
+                The names to use for the probability features
+            pre_trained_weights:str.
+                The fine-tuned weights (torch or safetensors file)
+            probabilities_only:bool. Default=False
+                If the features should be only the predicted probabilities
+            config:str|None. Default=None
+                A directory created by network/export_weights.py. If given, the model and the tokenizer are built from it, 
+                without network access nor loading the base weights, and the fine-tuned weights are memory mapped directly into the model
+            serializer:str. Default="json"
+                How the instance is turned into text before the tokenization (see network/serializers.py). It must be the one used in training
+            max_chunks:int|None. Default=None
+                If given, instances longer than the model window are split in up to max_chunks windows, encoded as a batch and averaged, 
+                instead of being truncated (see network/models.py chunked_tokenize)
+            chunk_size:int|None. Default=None
+                The number of tokens of each window when max_chunks is given. If None, the maximum length of the tokenizer is used
+            exit_threshold:float|None. Default=None
+                If given, the weights must come from a training with exit heads (network/competitive_network.py --exits): the encoder stops 
+                at the first exit head whose probabilities are all above exit_threshold or below 1 - exit_threshold. 
+                The number of layers executed for each instance is stored in layers_executed. It needs probabilities_only: 
+                the encoding of an exit head is not the one of the whole encoder that the predictors are trained on
+            tuning_problem:str|None. Default=None
+                If given and the weights were tuned for this problem on this host with network/autotune.py, generate_batch runs 
+                batches of the tuned size with the tuned number of threads
+        """
         super().__init__()
         self.device = device("cuda:0" if cuda.is_available() else "cpu")
-        self.model = Model(len(names))
-        self.model.load_state_dict(load(pre_trained_weights))
+        state_dict = read_weights(pre_trained_weights)
+        exit_layers = state_dict["exit_layers"].tolist() if "exit_layers" in state_dict else None
+        if exit_threshold is not None and not probabilities_only:
+            raise Exception("the early exit can be used only with probabilities_only: the encodings of the exit heads are not comparable with the one of the whole encoder")
+        if exit_threshold is not None and exit_layers is None:
+            raise Exception("the weights have no exit heads, the early exit cannot be used")
+        self.model = Model(len(names), config, exit_layers)
+        self.model.load_state_dict(state_dict, assign=True)
         self.model = self.model.to(self.device)
+        self.model.eval()
         self.names = names
-        self.tokenizer = AutoTokenizer.from_pretrained("tororoin/longformer-8bitadam-2048-main")
+        self.tokenizer = AutoTokenizer.from_pretrained(config if config is not None else BASE_MODEL)
         self.probabilities_only = probabilities_only
+        self.serializer = get_serializer(serializer)
+        self.max_chunks = max_chunks
+        self.chunk_size = chunk_size
+        self.exit_threshold = exit_threshold
+        self.layers_executed = []
+        self.tuning = load_tuning(pre_trained_weights, tuning_problem) if tuning_problem is not None else None
+        self.batch_size = self.tuning["batch_size"] if self.tuning is not None else None
 
     def generate(self, instance: 'str') -> 'dict[str,float]':
-        tokenized_instance = self.tokenizer(instance, truncation=True, return_tensors="pt")
-        tokenized_instance = {k:tokenized_instance[k].to(self.device) for k in tokenized_instance.keys()}
-        model_output = self.model(tokenized_instance)
-        if self.probabilities_only:
-            return {self.names[i]: model_output["out"][i] for i in range(len(self.names))}
-        else:
-            out = {self.names[i]: model_output["out"][i] for i in range(len(self.names))}
-            for i in range(len(model_output["language_model"])):
-                out[f"feat{i}"] = model_output["language_model"][i]
-            return out
+        return self.generate_batch([instance])[0]
 
+    def generate_batch(self, instances:'list[str]') -> 'list[dict[str,float]]':
+        """
+        Generates the features of several instances with a single (padded) forward pass, or with batches of the tuned size if there is one
+        """
+        if self.batch_size is not None and len(instances) > self.batch_size:
+            return [features for i in range(0, len(instances), self.batch_size) for features in self.generate_batch(instances[i:i + self.batch_size])]
+        serialized = [self.serializer.serialize(instance) for instance in instances]
+        if self.max_chunks is None:
+            tokenized_instances = self.tokenizer(serialized, padding=True, truncation=True, return_tensors="pt")
+        else:
+            tokenized_instances = chunked_tokenize(self.tokenizer, serialized, self.max_chunks, self.chunk_size)
+        tokenized_instances = {k:tokenized_instances[k].to(self.device) for k in tokenized_instances.keys()}
+        with no_grad(), Tuned_threads(self.tuning if self.device.type == "cpu" else None):
+            model_output = self.model(tokenized_instances, self.exit_threshold)
+        self.layers_executed += [model_output["layers"]] * len(instances)
+        features = []
+        for out, language_model in zip(model_output["out"], model_output["language_model"]):
+            instance_features = {self.names[i]: out[i] for i in range(len(self.names))}
+            if not self.probabilities_only:
+                for i in range(len(language_model)):
+                    instance_features[f"feat{i}"] = language_model[i]
+            features.append(instance_features)
+        return features
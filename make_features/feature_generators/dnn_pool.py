@@ -0,0 +1,69 @@
+import multiprocessing
+import os
+import torch
+from .dnn_generator import Language_features_generator
+
+# the generator of the pool being created: the workers are forked after it is set, so they inherit it without loading nor copying the model
+_generator = None
+
+def _init_worker(threads:'int') -> None:
+    torch.set_num_threads(threads)
+
+def _generate_batch(instances:'list[str]') -> 'list[dict[str,float]]':
+    return _generator.generate_batch(instances)
+
+class Language_features_pool:
+    def __init__(self, generator:'Language_features_generator', workers:'int|None' = None, threads_per_worker:'int' = 1, batch_size:'int|None' = None) -> None:
+        """
+        initialize an instance of the class Language_features_pool.
+        It runs a loaded Language_features_generator in several processes on the cpu. The weights are moved to shared memory and the workers
+        are forked after the loading, so the model and the tokenizer exist only once in memory whatever the number of workers.
+        Each worker uses threads_per_worker intra-op threads, to avoid oversubscribing the cores, and takes a new batch as soon as it is free.
+        ---------
+        Parameters
+            generator:Language_features_generator.
+                The generator to run. It must be on the cpu
+            workers:int|None. Default=None
+                The number of processes. If None, the number of cores divided by threads_per_worker
+            threads_per_worker:int. Default=1
+                The number of torch threads of each worker
+            batch_size:int|None. Default=None
+                The number of instances given to a worker at a time. If None, the batch size tuned for the generator (see network/autotune.py) or 1
+        -----
+        Usage
+        ```py
+        generator = Language_features_generator(names, weights, config=config)
+        with Language_features_pool(generator, workers=4, threads_per_worker=2, batch_size=8) as pool:
+            features = pool.generate_batch(instances)
+        ```
+        """
+        global _generator
+        if generator.device.type != "cpu":
+            raise Exception("the pool can only run generators on the cpu")
+        self.generator = generator
+        self.generator.model.share_memory()
+        self.threads_per_worker = threads_per_worker
+        self.workers = workers if workers is not None else max(1, (os.cpu_count() or 1) // threads_per_worker)
+        self.batch_size = batch_size if batch_size is not None else (generator.batch_size if generator.batch_size is not None else 1)
+        _generator = generator
+        self.pool = multiprocessing.get_context("fork").Pool(self.workers, initializer=_init_worker, initargs=(threads_per_worker,))
+
+    def generate_batch(self, instances:'list[str]') -> 'list[dict[str,float]]':
+        """
+        Generates the features of the instances, in the same order
+        """
+        batches = [instances[i:i + self.batch_size] for i in range(0, len(instances), self.batch_size)]
+        features = []
+        for batch_features in self.pool.imap(_generate_batch, batches):
+            features += batch_features
+        return features
+
+    def close(self) -> None:
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self) -> 'Language_features_pool':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -1,62 +1,184 @@
 from .base_generator import Generator
-from subprocess import run, PIPE, STDOUT
+from .artifact_cache import Artifact_cache
+from subprocess import Popen, PIPE, STDOUT
+import concurrent.futures
+import threading
+import signal
 import json
 from re import compile
+from time import time
+import tempfile
+import shutil
 import os
 
 class Fzn2feat_generator(Generator):
 
     TEAMP_FILENAME = "feat-temp"
-    TEMP_FILE = f"./.cache/{TEAMP_FILENAME}"
-    
-    def __init__(self, eprime) -> None:
+    CACHE_DIR = ".cache"
+    MEMORY_LIMIT = 16384
+    STAGES = ["conjure", "savilerow", "fzn2feat"]
+
+    def __init__(self, eprime, use_cache:'bool' = True, cache_size:'int' = Artifact_cache.MAX_SIZE, 
+                 timeouts:'dict[str,float]|None' = None) -> None:
+        """
+        initialize an instance of the class Fzn2feat_generator.
+        ---------
+        Parameters
+            eprime:str.
+                The eprime model to use to translate the instances
+            use_cache:bool. Default=True
+                Whether to reuse the cached conjure and savilerow outputs
+            cache_size:int. Default=Artifact_cache.MAX_SIZE
+                The maximum size (in bytes) of the artifact cache
+            timeouts:dict[str,float]|None. Default=None
+                The maximum wall time (in seconds) of each stage (conjure, savilerow, fzn2feat). Stages not in the dict have no limit
+        """
         super().__init__()
         self.eprime = eprime
+        self.cache = Artifact_cache(max_size=cache_size) if use_cache else None
+        self.timeouts = timeouts if timeouts is not None else {}
+        for stage in self.timeouts.keys():
+            if stage not in self.STAGES:
+                raise Exception(f"stage {stage} unrecognised. Possible stages are {self.STAGES}")
 
     def generate(self, instance:'str') -> 'dict[str,float]':
-        features = self.__gen_features(self.eprime, instance)
+        features, _ = self.__gen_features(self.eprime, instance)
         return json.loads(features)
-    
-    def __clean(self):
-        current_dir = os.path.join(os.getcwd(), ".cache")
-
-        files = [f for f in os.listdir(current_dir) if os.path.isfile(os.path.join(current_dir, f))]
-        for file in files:
-            if self.TEAMP_FILENAME in file:
-                os.remove(os.path.join(current_dir, file))
-
-    def __call_savilerow(self, eprime, param):
-        command = ["runsolver", "-R", "16384", "savilerow", eprime, param, "-chuffed"]
-        process = run(command, stdout=PIPE, stderr=STDOUT, check=True, encoding="UTF-8")
+
+    def generate_with_stats(self, instance:'str') -> 'tuple[dict[str,float],dict[str,dict]]':
+        """
+        Like generate but also returns, for each stage of the toolchain, the wall time, the cpu time (seconds) and the peak memory (MB).
+        Stages served from the artifact cache are marked as cached.
+        """
+        features, stats = self.__gen_features(self.eprime, instance)
+        return json.loads(features), stats
+
+    def generate_batch(self, instances:'list[str]', max_workers:'int|None' = None):
+        """
+        Generate the features of many instances concurrently. Each job runs in its own scratch directory,
+        so the jobs never share intermediate files. The results are yielded as soon as they are ready.
+        ---------
+        Parameters
+            instances:list[str].
+                The param files to generate the features for
+            max_workers:int|None. Default=None
+                The maximum number of concurrent jobs. It is always capped so that MEMORY_LIMIT per job fits in the host memory
+        -----
+        Output
+            A generator of dicts with, for each instance, the instance name, the features (empty if the generation failed),
+            the time required and, in case of failure, the error message
+        """
+        workers = self.max_workers(max_workers)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = {executor.submit(self.__timed_generate, instance): instance for instance in instances}
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+
+    def max_workers(self, max_workers:'int|None' = None) -> 'int':
+        total_memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+        memory_bound = max(1, total_memory // self.MEMORY_LIMIT)
+        cpu_bound = os.cpu_count() or 1
+        if max_workers is None:
+            max_workers = cpu_bound
+        return max(1, min(max_workers, memory_bound))
+
+    def __timed_generate(self, instance:'str') -> 'dict':
+        start = time()
+        try:
+            features, stats = self.generate_with_stats(instance)
+            return {"inst": instance, "features": features, "time": time() - start, "stages": stats}
+        except Exception as e:
+            return {"inst": instance, "features": {}, "time": time() - start, "error": str(e)}
+
+    def __run_stage(self, stage:'str', command:'list[str]', stats:'dict') -> 'tuple[int,str]':
+        timeout = self.timeouts.get(stage)
+        timed_out = threading.Event()
+        def kill():
+            timed_out.set()
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        start = time()
+        process = Popen(command, stdout=PIPE, stderr=STDOUT, encoding="UTF-8", start_new_session=True)
+        timer = threading.Timer(timeout, kill) if timeout is not None else None
+        if timer is not None:
+            timer.start()
+        try:
+            output = process.stdout.read()
+            _, status, usage = os.wait4(process.pid, 0)
+        finally:
+            if timer is not None:
+                timer.cancel()
+            process.stdout.close()
+        process.returncode = os.waitstatus_to_exitcode(status)
+        stats[stage] = {
+            "wall_time": time() - start, 
+            "cpu_time": usage.ru_utime + usage.ru_stime, 
+            "peak_memory": usage.ru_maxrss / 1024,
+            "cached": False
+        }
+        if timed_out.is_set():
+            raise Exception(f"stage {stage} timed out after {timeout} seconds")
+        return process.returncode, output
+
+    def __call_savilerow(self, eprime, param, stats):
+        command = ["runsolver", "-R", str(self.MEMORY_LIMIT), "savilerow", eprime, param, "-chuffed"]
+        returncode, output = self.__run_stage("savilerow", command, stats)
+        if returncode != 0:
+            raise Exception(output)
         pattern = "Created output file (.*fzn)"
         prog = compile(pattern)
-        for line in process.stdout.splitlines():
+        for line in output.splitlines():
             match = prog.match(line)
             if match:
                 return match.group(1)
-        raise Exception(process.stdout)
+        raise Exception(output)
 
-    def __call_conjure(self, eprime, param):
-        command = ["conjure", "translate-parameter", f"--eprime={eprime}", f"--essence-param={param}", f"--eprime-param={self.TEMP_FILE}.eprime-param"]
-        process = run(command, stdout=PIPE, stderr=STDOUT, encoding="UTF-8")
-        if process.returncode != 0:
-            raise Exception(process.stdout)
+    def __call_conjure(self, eprime, param, eprime_param, stats):
+        command = ["conjure", "translate-parameter", f"--eprime={eprime}", f"--essence-param={param}", f"--eprime-param={eprime_param}"]
+        returncode, output = self.__run_stage("conjure", command, stats)
+        if returncode != 0:
+            raise Exception(output)
 
-    def __call_fzn2feat(self, model_file):
+    def __call_fzn2feat(self, model_file, stats):
         command = ["fzn2feat", model_file, "dict"]
-        process = run(command, stdout=PIPE, stderr=STDOUT, check=True, encoding="UTF-8")
-        return process.stdout
+        returncode, output = self.__run_stage("fzn2feat", command, stats)
+        if returncode != 0:
+            raise Exception(output)
+        return output
 
-    def __gen_features(self, eprime_file, param_file):
-        if not os.path.exists(".cache"):
-            os.mkdir(".cache")
-
-        self.__call_conjure(eprime_file, param_file)
-        run(['ls', '.cache'])
-        generated_file = self.__call_savilerow(eprime_file, f"{self.TEMP_FILE}.eprime-param")
-        res = self.__call_fzn2feat(generated_file)
-        res = res.replace("'", '"')
-        self.__clean()
-        return res
+    def __cached_stage(self, stage:'str', stats:'dict', start:'float') -> None:
+        stats[stage] = {"wall_time": time() - start, "cpu_time": 0., "peak_memory": 0., "cached": True}
 
+    def __gen_features(self, eprime_file, param_file):
+        os.makedirs(self.CACHE_DIR, exist_ok=True)
+        scratch_dir = tempfile.mkdtemp(prefix=f"{self.TEAMP_FILENAME}-", dir=self.CACHE_DIR)
+        stats = {}
+        try:
+            eprime_param = os.path.join(scratch_dir, f"{self.TEAMP_FILENAME}.eprime-param")
+            generated_file = f"{eprime_param}.fzn"
+            if self.cache is None:
+                self.__call_conjure(eprime_file, param_file, eprime_param, stats)
+                generated_file = self.__call_savilerow(eprime_file, eprime_param, stats)
+            else:
+                start = time()
+                conjure_key = self.cache.key("conjure", [eprime_file, param_file], ["conjure"])
+                if self.cache.get(conjure_key, ".eprime-param", eprime_param):
+                    self.__cached_stage("conjure", stats, start)
+                else:
+                    self.__call_conjure(eprime_file, param_file, eprime_param, stats)
+                    self.cache.put(conjure_key, ".eprime-param", eprime_param)
+                start = time()
+                savilerow_key = self.cache.key("savilerow", [eprime_file, eprime_param], ["savilerow"])
+                if self.cache.get(savilerow_key, ".fzn", generated_file):
+                    self.__cached_stage("savilerow", stats, start)
+                else:
+                    generated_file = self.__call_savilerow(eprime_file, eprime_param, stats)
+                    self.cache.put(savilerow_key, ".fzn", generated_file)
+            res = self.__call_fzn2feat(generated_file, stats)
+            res = res.replace("'", '"')
+        finally:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+        return res, stats
 
@@ -0,0 +1,42 @@
+from .base_generator import Generator
+from sys import path
+import os
+import torch.nn.functional as F
+from torch import no_grad, from_numpy
+path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "network"))
+from numeric_features import load_numeric_model
+
+class Numeric_features_generator(Generator):
+    def __init__(self, names:'list', pre_trained_weights:'str', probabilities_only:'bool'=False) -> None:
+        """
+        initialize an instance of the class Numeric_features_generator.
+        A fast alternative to Language_features_generator for problems whose instances are a few numeric parameters:
+        the instance is turned into a fixed numeric vector and evaluated by a small mlp, without any tokenizer nor transformer.
+        The features have the same format of the dnn ones.
+        ---------
+        Parameters
+            names:list.
+                The names to use for the probability features
+            pre_trained_weights:str.
+                The file created by network/numeric_network.py with the encoder and the weights of the model
+            probabilities_only:bool. Default=False
+                If the features should be only the predicted probabilities
+        """
+        super().__init__()
+        self.encoder, self.model = load_numeric_model(pre_trained_weights)
+        if self.model.output_layer.out_features != len(names):
+            raise Exception(f"the model predicts {self.model.output_layer.out_features} options but {len(names)} names were given")
+        self.names = names
+        self.probabilities_only = probabilities_only
+
+    def generate(self, instance: 'str') -> 'dict[str,float]':
+        vector = from_numpy(self.encoder.transform(instance)).unsqueeze(0)
+        with no_grad():
+            encoded_input = self.model.encoder(vector)
+            out = F.sigmoid(self.model.output_layer(encoded_input)).tolist()[0]
+        features = {self.names[i]: out[i] for i in range(len(self.names))}
+        if not self.probabilities_only:
+            encoded_input = encoded_input.tolist()[0]
+            for i in range(len(encoded_input)):
+                features[f"feat{i}"] = encoded_input[i]
+        return features
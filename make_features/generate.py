@@ -1,70 +1,145 @@
 import argparse
 import json
+import concurrent.futures
 from sys import stderr
 from time import time
-from feature_generators.dnn_generator import Language_features_generator
-from feature_generators.fzn2feat_generator import Fzn2feat_generator
 
-def generate_dnn_features(args) -> "dict":
+def read_instance(file_name:'str') -> 'str':
+    f = open(file_name)
+    instance = f.read()
+    f.close()
+    return instance
+
+# the generators are imported only when needed: the dnn one loads torch and transformers, 
+# which would add seconds to the start up of the fzn2feat generation
+def get_dnn_generator(args) -> "Language_features_generator":
     if args.names is None:
         raise Exception("argument names is required with the dnn generation")
     if args.weights is None:
         raise Exception("argument weights is required with the dnn generation")
-    generator = Language_features_generator(args.names.split(","), args.weights, args.probability_only)
-    f = open(args.instance)
-    instance = f.read()
-    f.close()
+    from feature_generators.dnn_generator import Language_features_generator
+    return Language_features_generator(args.names.split(","), args.weights, args.probability_only, args.config, args.serializer, 
+                                       args.chunks, args.chunk_size, args.exit_threshold, args.tuning_problem)
+
+def get_numeric_generator(args) -> "Numeric_features_generator":
+    if args.names is None:
+        raise Exception("argument names is required with the numeric generation")
+    if args.weights is None:
+        raise Exception("argument weights is required with the numeric generation")
+    from feature_generators.numeric_generator import Numeric_features_generator
+    return Numeric_features_generator(args.names.split(","), args.weights, args.probability_only)
+
+def get_fzn2feat_generator(args) -> "Fzn2feat_generator":
+    if args.eprime is None:
+        raise Exception("argument eprime is required with the fzn2feat generation")
+    from feature_generators.fzn2feat_generator import Fzn2feat_generator
+    return Fzn2feat_generator(args.eprime, use_cache=not args.no_cache, timeouts=parse_timeouts(args.timeouts))
+
+def generate_dnn_features(args) -> "dict":
+    generator = get_dnn_generator(args) if args.type == "dnn" else get_numeric_generator(args)
+    instance = read_instance(args.instance)
     start_time = time()
     features = generator.generate(instance)
     end_time = time() - start_time
     if args.time:
         features = {"time": end_time, "features":features}
+        if args.type == "dnn" and args.exit_threshold is not None:
+            features["stages"] = {"dnn": {"layers": generator.layers_executed[-1]}}
     return features
 
-def generate_fzn2feat_features(args) -> "dict":
-    if args.eprime is None:
-        raise Exception("argument eprime is required with the fzn2feat generation")
-    generator = Fzn2feat_generator(args.eprime)
+def parse_timeouts(timeouts:'str|None') -> 'dict[str,float]':
+    if timeouts is None:
+        return {}
+    parsed = {}
+    for timeout in timeouts.split(","):
+        if not "=" in timeout:
+            raise Exception(f"timeout {timeout} must be in the format stage=seconds")
+        stage, seconds = timeout.split("=")
+        parsed[stage.strip()] = float(seconds)
+    return parsed
+
+def timed_fzn2feat_generation(generator:'Fzn2feat_generator', instance:'str') -> 'tuple[dict,dict,float]':
     start_time = time()
     try:
-        features = generator.generate(args.instance)
-        end_time = time() - start_time
-        if args.time:
-            features = {"time": end_time, "features":features}
+        features, stages = generator.generate_with_stats(instance)
     except Exception as e:
         print(f"unable to generate the features. Reason:\n{e}", file=stderr)
-        end_time = time() - start_time
-        features = {}
-        if args.time:
-            features = {"time": end_time, "features": {}}
+        features, stages = {}, {}
+    return features, stages, time() - start_time
+
+def generate_fzn2feat_features(args) -> "dict":
+    generator = get_fzn2feat_generator(args)
+    features, stages, end_time = timed_fzn2feat_generation(generator, args.instance)
+    if args.time:
+        features = {"time": end_time, "stages": stages, "features":features}
+    return features
+
+def generate_all_features(args) -> "dict":
+    """
+    Generates both feature sets of an instance. The fzn2feat toolchain (external processes) runs in the background
+    while the dnn model is loaded and evaluated, so the total time is close to the slowest of the two instead of their sum.
+    """
+    if args.dnn_instance is None:
+        raise Exception("argument dnn-instance is required with the generation of all the features")
+    fzn2feat_generator = get_fzn2feat_generator(args)
+    start_time = time()
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        fzn2feat_future = executor.submit(timed_fzn2feat_generation, fzn2feat_generator, args.instance)
+        dnn_generator = get_dnn_generator(args)
+        instance = read_instance(args.dnn_instance)
+        dnn_start_time = time()
+        dnn_features = dnn_generator.generate(instance)
+        dnn_time = time() - dnn_start_time
+        fzn2feat_features, stages, fzn2feat_time = fzn2feat_future.result()
+    end_time = time() - start_time
+    features = {**fzn2feat_features, **dnn_features}
+    if args.time:
+        features = {"time": end_time, "times": {"dnn": dnn_time, "fzn2feat": fzn2feat_time}, "stages": stages, "features": features}
     return features
 
 parser = argparse.ArgumentParser()
-parser.add_argument("-t", "--type", choices=["dnn", "fzn2feat"], help="The type of features to get. Default = dnn", default="dnn")
-parser.add_argument("-i", "--instance", type=str, help="The file containing the instance to use to generate the features", required=True)
+parser.add_argument("-t", "--type", choices=["dnn", "numeric", "fzn2feat", "all"], help="The type of features to get. numeric replaces the dnn with a small mlp on the numeric parameters of the json instance. all generates both the dnn and the fzn2feat features at the same time. Default = dnn", default="dnn")
+parser.add_argument("-i", "--instance", type=str, help="The file containing the instance to use to generate the features (the essence param file with the all type)", required=True)
+parser.add_argument("-j", "--dnn-instance", type=str, help="The file containing the instance in json format to use for the dnn features (all only)")
 parser.add_argument("-n", "--names", type=str, help="A comma separated list of names to use as names for the probability features with the dnn features")
 parser.add_argument("-p", "--probability-only", help="If the features should be only the predicted probabilities (dnn only). Default = False", 
                     default=False, action='store_true')
-parser.add_argument("-w", "--weights", type=str, help="The weights to load for the dnn")
+parser.add_argument("-w", "--weights", type=str, help="The weights to load for the dnn (the file created by network/numeric_network.py with the numeric type)")
+parser.add_argument("-c", "--config", type=str, help="A directory created by network/export_weights.py to build the dnn without downloading the base model (dnn only)")
+parser.add_argument("-s", "--serializer", type=str, help="How the instance is turned into text for the dnn: json, compact, compact_rle, positional or positional_rle. It must be the one used in training. Default = json", default="json")
+parser.add_argument("--chunks", type=int, help="If given, instances longer than the dnn window are split in up to this number of windows whose encodings are averaged, instead of being truncated. It should match the training (dnn only)")
+parser.add_argument("--chunk-size", type=int, help="The number of tokens of each window with --chunks. Default = the maximum length of the tokenizer (dnn only)")
+parser.add_argument("--exit-threshold", type=float, help="Stop the dnn at the first exit head whose probabilities are all above the threshold or below 1 - threshold. The weights must come from a training with exit heads and it needs --probability-only. With --time, the number of layers executed is reported (dnn only)")
+parser.add_argument("--tuning-problem", type=str, help="The problem (e.g. CoveringArray) whose batch size and threads, found by network/autotune.py on this host, are used. Default = no tuning (dnn only)")
 parser.add_argument("-e", "--eprime", type=str, help="The eprime file to use to generate the features (fzn2feat only)")
 parser.add_argument("-o", "--output", choices=["json", "csv"], help="The output format. Default= csv", default="csv")
+parser.add_argument("--no-cache", help="Do not reuse the cached conjure and savilerow outputs (fzn2feat only). Default = False",
+                    default=False, action='store_true')
+parser.add_argument("--timeouts", type=str, help="A comma separated list of stage=seconds wall time limits for the fzn2feat stages (conjure, savilerow, fzn2feat). Default = no limit")
 parser.add_argument("--time", help="If the program should also report the time taken to generate the features. Default = False", 
                     default=False, action='store_true')
 
 def main():
     arguments = parser.parse_args()
     features = {}
-    if arguments.type == "dnn":
+    if arguments.type in ["dnn", "numeric"]:
         features = generate_dnn_features(arguments)
     elif arguments.type == "fzn2feat":
         features = generate_fzn2feat_features(arguments)
+    elif arguments.type == "all":
+        features = generate_all_features(arguments)
 
     if arguments.output == "json":
         print(json.dumps(features))
     elif arguments.output == "csv":
         if "time" in features:
-            keys = ",".join(["time"] + list(features["features"].keys()))
-            values = ",".join([str(features["time"])] + [str(features["features"][k]) for k in features["features"].keys()])
+            times = features["times"] if "times" in features else {}
+            stages = features["stages"] if "stages" in features else {}
+            stage_keys = [(stage, stat) for stage in stages.keys() for stat in stages[stage].keys()]
+            keys = ",".join(["time"] + [f"{source}_time" for source in times.keys()] + [f"{stage}_{stat}" for stage, stat in stage_keys] + 
+                            list(features["features"].keys()))
+            values = ",".join([str(features["time"])] + [str(times[source]) for source in times.keys()] + [str(stages[stage][stat]) for stage, stat in stage_keys] + 
+                              [str(features["features"][k]) for k in features["features"].keys()])
             output = f"{keys}\n{values}"
         else:
             keys = ",".join(list(features.keys()))
@@ -0,0 +1,160 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import re
+from time import time
+import numpy as np
+import torch
+from peak_memory import Peak_memory
+
+TUNING_FILE = os.path.join(os.path.expanduser("~"), ".cache", "efe", "autotune.json")
+
+def host_key() -> 'str':
+    # the memory is read with sysconf, so that loading a tuning does not need psutil
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    return f"{platform.node()}-{os.cpu_count()}cpu-{memory // 1024**3}GB"
+
+def model_key(weights:'str') -> 'str':
+    """
+    Identifies a weights file by its path, size and modification time, without reading it
+    """
+    path = os.path.realpath(weights)
+    stat = os.stat(path)
+    return hashlib.sha256(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:16]
+
+def problem_name(dataset:'str') -> 'str':
+    name = os.path.basename(dataset)
+    match = re.match(r"dataset_(.*?)-\d{4}-\d{2}-\d{2}\.json", name)
+    return match.group(1) if match else name
+
+def read_tunings(tuning_file:'str' = TUNING_FILE) -> 'dict[str,dict]':
+    if not os.path.exists(tuning_file):
+        return {}
+    f = open(tuning_file)
+    tunings = json.load(f)
+    f.close()
+    return tunings
+
+def load_tuning(weights:'str', problem:'str|None' = None, tuning_file:'str' = TUNING_FILE, any_problem:'bool' = False) -> 'dict|None':
+    """
+    Returns the tuned configuration ({"batch_size", "threads"}) of the model on this host for the given problem. 
+    None if the model was not tuned for the problem on this host, unless any_problem is set: then the last tuning of any problem is returned
+    """
+    if not os.path.exists(weights):
+        return None
+    tunings = read_tunings(tuning_file)
+    prefix = f"{model_key(weights)}|{host_key()}|"
+    if problem is not None and prefix + problem in tunings:
+        return tunings[prefix + problem]
+    if not any_problem:
+        return None
+    candidates = [tunings[key] for key in tunings.keys() if key.startswith(prefix)]
+    if len(candidates) == 0:
+        return None
+    return max(candidates, key=lambda tuning: tuning["tuned_at"])
+
+def save_tuning(weights:'str', problem:'str', tuning:'dict', tuning_file:'str' = TUNING_FILE) -> None:
+    tunings = read_tunings(tuning_file)
+    tunings[f"{model_key(weights)}|{host_key()}|{problem}"] = {**tuning, "tuned_at": time()}
+    if not os.path.isdir(os.path.dirname(tuning_file)):
+        os.makedirs(os.path.dirname(tuning_file))
+    f = open(f"{tuning_file}.tmp", "w")
+    json.dump(tunings, f, indent=1)
+    f.close()
+    os.replace(f"{tuning_file}.tmp", tuning_file)
+
+class Tuned_threads:
+    """
+    Sets the torch threads of a tuning for the duration of a with block
+    """
+    def __init__(self, tuning:'dict|None') -> None:
+        self.threads = tuning["threads"] if tuning is not None else None
+
+    def __enter__(self) -> None:
+        self.previous = torch.get_num_threads()
+        if self.threads is not None:
+            torch.set_num_threads(self.threads)
+
+    def __exit__(self, *args) -> None:
+        torch.set_num_threads(self.previous)
+
+def pad_batch(inputs:'list[dict[str,torch.Tensor]]') -> 'dict[str,torch.Tensor]':
+    return {key: torch.stack([i[key] for i in inputs]) for key in inputs[0].keys()}
+
+def autotune(model:'torch.nn.Module', inputs:'list[dict[str,torch.Tensor]]', batch_sizes:'list[int]', threads:'list[int]', memory_cap:'float|None', verbose:'bool' = False) -> 'tuple[dict,list[dict]]':
+    """
+    Measures the throughput of every (threads, batch size) pair on the inputs and returns the fastest one whose peak memory is under memory_cap (MB),
+    together with all the measurements. For each thread count, the batch sizes are tried in increasing order until one exceeds the cap.
+    """
+    results = []
+    model.eval()
+    with torch.no_grad():
+        for thread_count in threads:
+            with Tuned_threads({"threads": thread_count}):
+                for batch_size in sorted(batch_sizes):
+                    batches = [pad_batch(inputs[i:i + batch_size]) for i in range(0, len(inputs), batch_size)]
+                    model(batches[0])
+                    with Peak_memory() as memory:
+                        start_time = time()
+                        for batch in batches:
+                            model(batch)
+                        end_time = time() - start_time
+                    result = {"threads": thread_count, "batch_size": batch_size, "instances_per_second": len(inputs) / end_time, "peak_memory": memory.peak}
+                    results.append(result)
+                    if verbose:
+                        print(f"threads {thread_count} batch size {batch_size}: {result['instances_per_second']:,.2f} instances/s, peak memory {memory.peak:,.0f}MB")
+                    if memory_cap is not None and memory.peak > memory_cap:
+                        break
+    valid = [r for r in results if memory_cap is None or r["peak_memory"] <= memory_cap]
+    if len(valid) == 0:
+        raise Exception(f"no configuration fits in {memory_cap}MB")
+    best = max(valid, key=lambda r: r["instances_per_second"])
+    return {"batch_size": best["batch_size"], "threads": best["threads"]}, results
+
+parser = argparse.ArgumentParser(description="Finds the fastest inference batch size and number of torch threads of a model on a sample of a dataset and stores it for this host. "+
+                                 "NeuralNetwork.predict, inference.py and Language_features_generator use it automatically")
+parser.add_argument("--dataset", required=True)
+parser.add_argument("--weights", required=True, help="The fine-tuned weights")
+parser.add_argument("--config", required=False, help="A directory created by export_weights.py with the configuration and the tokenizer of the model")
+parser.add_argument("--serializer", default="json", help="How the instances are turned into text before the tokenization. Default = json")
+parser.add_argument("--chunks", type=int, required=False, help="If the model is used with chunked instances, the maximum number of windows")
+parser.add_argument("--sample", type=int, default=64, help="The number of instances used for the measurements. Default = 64")
+parser.add_argument("--batch_sizes", default="1,2,4,8,16,32", help="A comma separated list of batch sizes to try. Default = 1,2,4,8,16,32")
+parser.add_argument("--threads", default=None, help="A comma separated list of thread counts to try. Default = the powers of two up to the number of cores")
+parser.add_argument("--memory_cap", type=float, default=None, help="The maximum resident memory (MB) of the process. Default = no cap")
+parser.add_argument("--tuning_file", default=TUNING_FILE, help=f"Where the configurations are stored. Default = {TUNING_FILE}")
+parser.add_argument("-v", "--verbose", default=False, action="store_true")
+
+def main():
+    from models import BaseModel, get_tokenizer, load_weights, chunked_tokenize
+    from helper import dict_lists_to_list_of_dicts
+    from serializers import get_serializer
+    arguments = parser.parse_args()
+    bert_type = "tororoin/longformer-8bitadam-2048-main"
+    f = open(arguments.dataset)
+    data = json.load(f)
+    f.close()
+    sample = [data[i] for i in np.random.default_rng(0).permutation(len(data))[:arguments.sample]]
+    tokenizer = get_tokenizer(arguments.config if arguments.config is not None else bert_type)
+    serializer = get_serializer(arguments.serializer)
+    instances = [serializer.serialize(d["instance_value_json"]) for d in sample]
+    if arguments.chunks is None:
+        inputs = dict_lists_to_list_of_dicts(tokenizer(instances, padding=True, truncation=True, return_tensors='pt'))
+    else:
+        inputs = dict_lists_to_list_of_dicts(chunked_tokenize(tokenizer, instances, arguments.chunks))
+
+    model = BaseModel(bert_type, len(data[0]["all_times"]), config=arguments.config)
+    load_weights(model, arguments.weights)
+    cores = os.cpu_count() or 1
+    threads = [int(t) for t in arguments.threads.split(",")] if arguments.threads is not None else [2**i for i in range(int(np.log2(cores)) + 1)]
+    tuning, results = autotune(model, inputs, [int(b) for b in arguments.batch_sizes.split(",")], threads, arguments.memory_cap, arguments.verbose)
+    problem = problem_name(arguments.dataset)
+    save_tuning(arguments.weights, problem, tuning, arguments.tuning_file)
+    best = [r for r in results if r["threads"] == tuning["threads"] and r["batch_size"] == tuning["batch_size"]][0]
+    print(f"{problem} on {host_key()}: batch size {tuning['batch_size']} threads {tuning['threads']} "+
+          f"({best['instances_per_second']:,.2f} instances/s, peak memory {best['peak_memory']:,.0f}MB)")
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,9 @@ from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_sc
 from neuralNetwork import In_between_epochs
 import torch.nn.functional as F
 from helper import dict_lists_to_list_of_dicts, get_dataloader, get_time_matrix
-from models import BaseModel, get_tokenizer
+from models import BaseModel, Early_exit_model, get_tokenizer, load_weights, chunked_tokenize
+from autotune import problem_name
+from serializers import get_serializer, SERIALIZERS
 
 class Timeout_analiser(In_between_epochs):
     def __init__(self, train_dataloader, validation_dataloader, test_dataloader, order, 
@@ -165,6 +167,11 @@ parser.add_argument("--history", required=True)
 parser.add_argument("--save", required=True)
 parser.add_argument("--fold", type=int, required=True)
 parser.add_argument("--pre_trained", required=False)
+parser.add_argument("--chunks", type=int, required=False, help="If given, long instances are split in windows (up to this number) whose encodings are averaged, instead of being truncated")
+parser.add_argument("--chunk_size", type=int, required=False, help="The number of tokens of each window with --chunks. Default = the maximum length of the tokenizer")
+parser.add_argument("--exits", required=False, help="A comma separated list of encoder layers (counted from 1) followed by an exit head, trained together with the output layer to allow early exit inference")
+parser.add_argument("--serializer", choices=list(SERIALIZERS.keys()), default="json", help="How the instances are turned into text before the tokenization. Default = json")
+parser.add_argument("--config", required=False, help="A directory created by export_weights.py. The base model is built from it without downloading its weights (requires --pre_trained)")
 parser.add_argument("--multiplier", type=int, default=1, required=True)
 
 def main():
@@ -179,16 +186,23 @@ def main():
     save_weights_file = arguments.save
     fold = arguments.fold
     multiplier = arguments.multiplier
+    config = arguments.config
     print(multiplier, learning_rate)
     bert_type = "tororoin/longformer-8bitadam-2048-main"
+    if config != None and pretrained_weights == None:
+        raise Exception("config can be used only together with pre_trained weights")
     f = open(dataset)
     data = loads(f.read())
     f.close()
 
-    tokenizer = get_tokenizer(bert_type)
-    instances_and_model = [d["instance_value_json"] for d in data]
+    tokenizer = get_tokenizer(config if config != None else bert_type)
+    serializer = get_serializer(arguments.serializer)
+    instances_and_model = [serializer.serialize(d["instance_value_json"]) for d in data]
 
-    x = dict_lists_to_list_of_dicts(tokenizer(instances_and_model, padding=True, truncation=True, return_tensors='pt'))
+    if arguments.chunks is None:
+        x = dict_lists_to_list_of_dicts(tokenizer(instances_and_model, padding=True, truncation=True, return_tensors='pt'))
+    else:
+        x = dict_lists_to_list_of_dicts(chunked_tokenize(tokenizer, instances_and_model, arguments.chunks, arguments.chunk_size))
     y = []
 
     idx2comb = {idx:comb["combination"] for idx, comb in enumerate(sorted(data[0]["all_times"], key= lambda x: x["combination"]))}
@@ -212,9 +226,12 @@ def main():
     print("operating on device:", device)
 
     length = len(combinations)
-    model = BaseModel(bert_type, length, dropout=.3)
+    if arguments.exits is None:
+        model = BaseModel(bert_type, length, dropout=.3, config=config)
+    else:
+        model = Early_exit_model(bert_type, length, [int(layer) for layer in arguments.exits.split(",")], dropout=.3, config=config)
     if pretrained_weights != None:
-        model.load_state_dict(torch.load(pretrained_weights))
+        load_weights(model, pretrained_weights, problem_name(dataset))
 
     times = get_time_matrix((len(all_times), len(combinations)), all_times)
 
@@ -244,17 +261,25 @@ def main():
     print(weights)
     weights = weights.to(device)
 
-    def loss(y_pred, y_true):
+    def head_loss(y_pred, y_true):
         timeouts_out = F.sigmoid(y_pred)
         timeouts = -(multiplier * y_true["competitivness"] * torch.log(timeouts_out) + (1 - y_true["competitivness"]) * torch.log(1 - timeouts_out))
         timeouts = timeouts * weights
-        timeouts = torch.mean(timeouts)
+        return torch.mean(timeouts)
+
+    def loss(y_pred, y_true):
+        if isinstance(y_pred, dict):
+            # the exit heads are trained together with the output layer, with the same weight
+            heads = [y_pred["out"]] + y_pred["exits"]
+            timeouts = sum([head_loss(head, y_true) for head in heads]) / len(heads)
+        else:
+            timeouts = head_loss(y_pred, y_true)
         print(timeouts)
         return timeouts
 
     def extraction_function(x):
         if isinstance(x, dict):
-            x = x["competitivness"]
+            x = x["out"] if "out" in x else x["competitivness"]
         return torch.round(torch.nn.functional.sigmoid(x)).cpu().tolist()
 
     train_data, validation_data =   model.train_network(train_dataloader, 
@@ -282,4 +307,6 @@ def main():
             validation_data[key] = [float(v) for v in validation_data[key]]
     dump({"train": train_data, "validation": validation_data}, f)
     f.close()
-main()
+
+if __name__ == "__main__":
+    main()
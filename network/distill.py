@@ -0,0 +1,207 @@
+import argparse
+import os
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import numpy as np
+from json import loads, dump
+from time import time
+from safetensors.torch import save_file
+from transformers import AutoConfig, AutoModel
+from neuralNetwork import NeuralNetwork
+from helper import dict_lists_to_list_of_dicts, get_dataloader
+from models import BaseModel, get_tokenizer, load_weights, chunked_tokenize, encode
+from serializers import get_serializer, SERIALIZERS
+from export_weights import WEIGHTS_NAME
+
+class Student_model(NeuralNetwork):
+    def __init__(self, bert:'nn.Module', num_classes:'int', teacher_hidden_size:'int') -> None:
+        """
+        initialize an instance of the class Student_model.
+        It has the same bert and output_layer modules of BaseModel, so its weights (see student_state_dict) can be used by Language_features_generator.
+        When the student is narrower than the teacher, a projection (used only during the distillation) maps its encoding to the size of the teacher one.
+        """
+        super().__init__()
+        self.bert = bert
+        hidden_size = self.bert.config.hidden_size
+        self.output_layer = nn.Linear(hidden_size, num_classes)
+        self.projection = nn.Linear(hidden_size, teacher_hidden_size) if hidden_size != teacher_hidden_size else nn.Identity()
+
+    def forward(self, inputs):
+        encoded_input = encode(self.bert, inputs)
+        return {"encoding": self.projection(encoded_input), "out": self.output_layer(encoded_input)}
+
+    def student_state_dict(self) -> 'dict[str,torch.Tensor]':
+        return {key: value.contiguous() for key, value in self.state_dict().items() if not key.startswith("projection.")}
+
+def get_student_config(teacher_config, layers:'int', hidden_size:'int|None', heads:'int|None', intermediate_size:'int|None'):
+    config = teacher_config.__class__.from_dict(teacher_config.to_dict())
+    config.num_hidden_layers = layers
+    if hidden_size is not None:
+        config.hidden_size = hidden_size
+    if heads is not None:
+        config.num_attention_heads = heads
+    if intermediate_size is not None:
+        config.intermediate_size = intermediate_size
+    if isinstance(getattr(config, "attention_window", None), list):
+        config.attention_window = [config.attention_window[round(i)] for i in np.linspace(0, len(config.attention_window) - 1, layers)]
+    return config
+
+def initialize_from_teacher(student:'Student_model', teacher:'BaseModel') -> 'list[int]':
+    """
+    When the student has the width of the teacher, it starts from the teacher embeddings, pooler and output layer and from evenly spaced teacher layers.
+    Returns the teacher layers that were copied
+    """
+    if student.bert.config.hidden_size != teacher.bert.config.hidden_size or student.bert.config.num_attention_heads != teacher.bert.config.num_attention_heads \
+       or student.bert.config.intermediate_size != teacher.bert.config.intermediate_size:
+        return []
+    student.bert.embeddings.load_state_dict(teacher.bert.embeddings.state_dict())
+    if getattr(student.bert, "pooler", None) is not None and getattr(teacher.bert, "pooler", None) is not None:
+        student.bert.pooler.load_state_dict(teacher.bert.pooler.state_dict())
+    student.output_layer.load_state_dict(teacher.output_layer.state_dict())
+    teacher_layers = len(teacher.bert.encoder.layer)
+    copied = [int(round(i)) for i in np.linspace(0, teacher_layers - 1, len(student.bert.encoder.layer))]
+    for student_layer, teacher_layer in zip(student.bert.encoder.layer, copied):
+        student_layer.load_state_dict(teacher.bert.encoder.layer[teacher_layer].state_dict())
+    return copied
+
+def selection_time(probabilities:'list[float]', times:'list[float]', order:'list[int]') -> 'float':
+    remaining = [option for option in order if probabilities[option] < .5]
+    if len(remaining) == 0:
+        remaining = order
+    return times[remaining[0]]
+
+def report(teacher:'BaseModel', student:'Student_model', loader, times:'np.ndarray', order:'list[int]') -> 'dict[str,float]':
+    """
+    Compares the teacher and the student on the test instances, one instance at a time as in the feature generation:
+    the time of the forward pass and the time of the options selected discarding the options predicted as non competitive
+    """
+    teacher_time, student_time, teacher_selection, student_selection, agreement = 0, 0, 0, 0, 0
+    with torch.no_grad():
+        for x, y in loader:
+            times_i = times[int(y["index"][0])].tolist()
+            start_time = time()
+            teacher_probabilities = F.sigmoid(teacher(x))[0].tolist()
+            teacher_time += time() - start_time
+            start_time = time()
+            student_probabilities = F.sigmoid(student(x)["out"])[0].tolist()
+            student_time += time() - start_time
+            teacher_selection += selection_time(teacher_probabilities, times_i, order)
+            student_selection += selection_time(student_probabilities, times_i, order)
+            agreement += int(np.array_equal(np.round(teacher_probabilities), np.round(student_probabilities)))
+    instances = len(loader.dataset)
+    return {
+        "instances": instances,
+        "teacher_ms": teacher_time / instances * 1000,
+        "student_ms": student_time / instances * 1000,
+        "speedup": teacher_time / student_time,
+        "teacher_selection_time": teacher_selection,
+        "student_selection_time": student_selection,
+        "regret": student_selection - teacher_selection,
+        "relative_regret": student_selection / teacher_selection - 1,
+        "agreement": agreement / instances
+    }
+
+parser = argparse.ArgumentParser(description="Distills a fine-tuned model into a smaller student that can replace it in Language_features_generator")
+parser.add_argument("--dataset", required=True)
+parser.add_argument("--teacher", required=True, help="The fine-tuned weights of the teacher")
+parser.add_argument("--config", required=False, help="A directory created by export_weights.py with the teacher configuration and tokenizer")
+parser.add_argument("--output", required=True, help="The directory of the student. It can be used as config of the generator, with output/model.safetensors as weights")
+parser.add_argument("--layers", type=int, default=3, help="The number of layers of the student. Default = 3")
+parser.add_argument("--hidden_size", type=int, required=False, help="The hidden size of the student. Default = the one of the teacher, so that the features have the same size")
+parser.add_argument("--heads", type=int, required=False, help="The number of attention heads of the student. Default = the one of the teacher")
+parser.add_argument("--intermediate_size", type=int, required=False, help="The size of the feed forward layers of the student. Default = the one of the teacher")
+parser.add_argument("--epochs", type=int, default=10)
+parser.add_argument("--batch_size", type=int, default=8)
+parser.add_argument("--learning_rate", type=float, default=1e-4)
+parser.add_argument("--alpha", type=float, default=1., help="The weight of the probabilities loss with respect to the encoding one. Default = 1")
+parser.add_argument("--fold", type=int, default=0)
+parser.add_argument("--chunks", type=int, required=False, help="If given, long instances are split in windows (up to this number) whose encodings are averaged, instead of being truncated")
+parser.add_argument("--chunk_size", type=int, required=False, help="The number of tokens of each window with --chunks. Default = the maximum length of the tokenizer")
+parser.add_argument("--serializer", choices=list(SERIALIZERS.keys()), default="json", help="How the instances are turned into text before the tokenization. It must be the one of the teacher. Default = json")
+
+def main():
+
+    arguments = parser.parse_args()
+    bert_type = "tororoin/longformer-8bitadam-2048-main"
+    config = arguments.config
+    f = open(arguments.dataset)
+    data = loads(f.read())
+    f.close()
+
+    tokenizer = get_tokenizer(config if config is not None else bert_type)
+    serializer = get_serializer(arguments.serializer)
+    instances = [serializer.serialize(d["instance_value_json"]) for d in data]
+    if arguments.chunks is None:
+        x = dict_lists_to_list_of_dicts(tokenizer(instances, padding=True, truncation=True, return_tensors='pt'))
+    else:
+        x = dict_lists_to_list_of_dicts(chunked_tokenize(tokenizer, instances, arguments.chunks, arguments.chunk_size))
+    combinations = sorted([t["combination"] for t in data[0]["all_times"]])
+    times = np.array([[{t["combination"]: t["time"] for t in d["all_times"]}[c] for c in combinations] for d in data])
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    print("operating on device:", device)
+
+    teacher = BaseModel(bert_type, len(combinations), config=config)
+    load_weights(teacher, arguments.teacher)
+    teacher = teacher.to(device)
+    teacher.eval()
+
+    # the targets are the teacher encoding and probabilities of every instance
+    y = []
+    with torch.no_grad():
+        for i in range(len(x)):
+            inputs = {key: x[i][key].unsqueeze(0).to(device) for key in x[i].keys()}
+            encoding = encode(teacher.bert, inputs)
+            y.append({"encoding": encoding[0].cpu(), "probabilities": F.sigmoid(teacher.output_layer(encoding))[0].cpu(), "index": torch.tensor(i)})
+
+    teacher_config = AutoConfig.from_pretrained(config if config is not None else bert_type)
+    student_config = get_student_config(teacher_config, arguments.layers, arguments.hidden_size, arguments.heads, arguments.intermediate_size)
+    student = Student_model(AutoModel.from_config(student_config), len(combinations), teacher_config.hidden_size)
+    copied = initialize_from_teacher(student, teacher.cpu())
+    print(f"student initialized from the teacher layers {copied}" if len(copied) > 0 else "student initialized randomly")
+    teacher = teacher.to(device)
+
+    train_dataloader, validation_dataloader, test_dataloader = get_dataloader(x, y, arguments.batch_size, [arguments.fold])
+
+    def loss(y_pred, y_true):
+        encoding_loss = F.mse_loss(y_pred["encoding"], y_true["encoding"])
+        probabilities_loss = F.binary_cross_entropy_with_logits(y_pred["out"], y_true["probabilities"])
+        return encoding_loss + arguments.alpha * probabilities_loss
+
+    def extraction_function(x):
+        if "out" in x:
+            return torch.round(F.sigmoid(x["out"])).detach().cpu().tolist()
+        return torch.round(x["probabilities"]).cpu().tolist()
+
+    train_data, validation_data = student.train_network(train_dataloader,
+                    validation_dataloader,
+                    torch.optim.AdamW,
+                    loss_function=loss,
+                    device=device,
+                    verbose=True,
+                    output_extraction_function=extraction_function,
+                    learning_rate=arguments.learning_rate,
+                    epochs=arguments.epochs)
+
+    if not os.path.isdir(arguments.output):
+        os.makedirs(arguments.output)
+    student = student.cpu()
+    student.eval()
+    student_config.save_pretrained(arguments.output)
+    tokenizer.save_pretrained(arguments.output)
+    save_file(student.student_state_dict(), os.path.join(arguments.output, WEIGHTS_NAME))
+
+    order = [int(o) for o in np.argsort(times[[int(d["index"]) for _, d in train_dataloader.dataset]].sum(axis=0), kind="stable")]
+    distillation_report = report(teacher.cpu(), student, torch.utils.data.DataLoader(test_dataloader.dataset, batch_size=1), times, order)
+    distillation_report["loss"] = {"train": [float(v) for v in train_data["loss"]], "validation": [float(v) for v in validation_data["loss"]]}
+    f = open(os.path.join(arguments.output, "distillation_report.json"), "w")
+    dump(distillation_report, f)
+    f.close()
+    print(f"""student saved in {arguments.output}
+    teacher: {distillation_report['teacher_ms']:,.2f}ms per instance student: {distillation_report['student_ms']:,.2f}ms per instance speedup: {distillation_report['speedup']:,.2f}
+    teacher selection time: {distillation_report['teacher_selection_time']:,.2f} student selection time: {distillation_report['student_selection_time']:,.2f}
+    regret: {distillation_report['regret']:,.2f} ({distillation_report['relative_regret']:.2%}) same predictions: {distillation_report['agreement']:.2%}""")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import torch
+import os
+from sys import argv
+from safetensors.torch import save_file
+from transformers import AutoConfig
+from models import get_tokenizer
+
+WEIGHTS_NAME = "model.safetensors"
+
+def export_weights(weights:'str', output_dir:'str', bert_type:'str' = "tororoin/longformer-8bitadam-2048-main") -> 'str':
+    """
+    Stores in output_dir everything needed to rebuild a fine-tuned model without network access:
+    the configuration and the tokenizer of the base model and the fine-tuned weights in safetensors format.
+    """
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    AutoConfig.from_pretrained(bert_type).save_pretrained(output_dir)
+    get_tokenizer(bert_type).save_pretrained(output_dir)
+    state_dict = torch.load(weights, map_location="cpu")
+    state_dict = {key: value.contiguous() for key, value in state_dict.items()}
+    weights_file = os.path.join(output_dir, WEIGHTS_NAME)
+    save_file(state_dict, weights_file)
+    return weights_file
+
+def main():
+    if len(argv) < 3 or argv[1] == '--help':
+        print(f"{argv[0]} pretrained_weights output_dir [bert_type]")
+        return
+    bert_type = argv[3] if len(argv) > 3 else "tororoin/longformer-8bitadam-2048-main"
+    weights_file = export_weights(argv[1], argv[2], bert_type)
+    print(f"use {argv[2]} as config and {weights_file} as weights")
+
+if __name__ == "__main__":
+    main()
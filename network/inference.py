@@ -1,25 +1,47 @@
 import torch.functional as F
+import argparse
 import torch
 from json import loads
 import torch.nn.functional as F
 from helper import dict_lists_to_list_of_dicts
-from models import BaseModel, get_tokenizer
-from sys import argv
+from models import BaseModel, Early_exit_model, get_tokenizer, load_weights, read_weights, chunked_tokenize, encode
+from serializers import get_serializer, SERIALIZERS
+from autotune import Tuned_threads, pad_batch, problem_name
 from tqdm import tqdm
 
 class Feature_model(BaseModel):
     def forward(self, inputs):
-        _, encoded_input = self.bert(**inputs, return_dict = False)
+        encoded_input = encode(self.bert, inputs)
         return torch.cat((encoded_input, F.sigmoid(self.output_layer(encoded_input))), dim=1)
         # return F.sigmoid(self.output_layer(encoded_input))
 
-def main():
+class Early_exit_feature_model(Early_exit_model):
+    def __init__(self, base_model_name, num_classes, exit_layers:'list[int]', threshold:'float', config:'str|None' = None) -> None:
+        super().__init__(base_model_name, num_classes, exit_layers, config=config)
+        self.threshold = threshold
+        self.layers_executed = []
+
+    def forward(self, inputs):
+        # only the probabilities: the encoding of an exit head is not comparable with the one of the whole encoder
+        encoded_input, logits, layers = self.early_exit(inputs, self.threshold)
+        self.layers_executed += [layers] * encoded_input.size()[0]
+        return F.sigmoid(logits)
 
-    if argv[1] == '--help':
-        print(f"{argv[0]} dataset batch_size pretrained_weights")
-        return
+parser = argparse.ArgumentParser()
+parser.add_argument("dataset")
+parser.add_argument("pretrained_weights")
+parser.add_argument("save_file")
+parser.add_argument("--config", required=False, help="A directory created by export_weights.py. The base model is built from it without downloading its weights")
+parser.add_argument("--chunks", type=int, required=False, help="If given, long instances are split in windows (up to this number) whose encodings are averaged, instead of being truncated")
+parser.add_argument("--chunk_size", type=int, required=False, help="The number of tokens of each window with --chunks. Default = the maximum length of the tokenizer")
+parser.add_argument("--exit_threshold", type=float, required=False, help="If given, the weights must come from a training with --exits: the encoder stops at the first exit head whose probabilities are all above the threshold or below 1 - threshold. Only the probabilities are written")
+parser.add_argument("--serializer", choices=list(SERIALIZERS.keys()), default="json", help="How the instances are turned into text before the tokenization. It must be the one used in training. Default = json")
+
+def main():
 
-    dataset, pretrained_weights, save_file = argv[1], argv[2], argv[3]
+    arguments = parser.parse_args()
+    dataset, pretrained_weights, save_file = arguments.dataset, arguments.pretrained_weights, arguments.save_file
+    config = arguments.config
 
     bert_type = "tororoin/longformer-8bitadam-2048-main"
     if bert_type == "1":
@@ -34,37 +56,47 @@ def main():
     data = loads(f.read())
     f.close()
 
-    tokenizer = get_tokenizer(bert_type)
-    instances = [d["instance_value_json"] for d in data]
+    tokenizer = get_tokenizer(config if config is not None else bert_type)
+    serializer = get_serializer(arguments.serializer)
+    instances = [serializer.serialize(d["instance_value_json"]) for d in data]
     y = [d["instance_name"] for d in data]
-    for i in range(len(y)):
-        assert data[i]["instance_name"] == y[i] and data[i]["instance_value_json"] == instances[i]
-    x = dict_lists_to_list_of_dicts(tokenizer(instances, padding=True, truncation=True, return_tensors='pt'))
+    if arguments.chunks is None:
+        x = dict_lists_to_list_of_dicts(tokenizer(instances, padding=True, truncation=True, return_tensors='pt'))
+    else:
+        x = dict_lists_to_list_of_dicts(chunked_tokenize(tokenizer, instances, arguments.chunks, arguments.chunk_size))
 
     device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
     print("operating on device:", device)
 
     length = len(data[0]["all_times"])
-    model = Feature_model(bert_type, length, dropout=.3)
-    model.load_state_dict(torch.load(pretrained_weights))
-    heading = ["inst"] + [f"feat_{i}" for i in range(model.bert.config.hidden_size)] + [f"prob_{i}" for i in range(length)]
+    if arguments.exit_threshold is None:
+        model = Feature_model(bert_type, length, dropout=.3, config=config)
+    else:
+        exit_layers = read_weights(pretrained_weights)["exit_layers"].tolist()
+        model = Early_exit_feature_model(bert_type, length, exit_layers, arguments.exit_threshold, config=config)
+    load_weights(model, pretrained_weights, problem_name(dataset))
+    batch_size = model.tuning["batch_size"] if model.tuning is not None else 1
+    encoding_size = model.bert.config.hidden_size if arguments.exit_threshold is None else 0
+    heading = ["inst"] + [f"feat_{i}" for i in range(encoding_size)] + [f"prob_{i}" for i in range(length)]
     # heading = ["inst"] + [f"prob_{i}" for i in range(length)]
     heading = ",".join(heading)
     final_csv = f"{heading}\n"
     model.eval()
     model = model.to(device)
-    with torch.no_grad():
-        for i in tqdm(range(len(x))):
-            input = x[i]
-            input = {key: input[key].to(device).reshape((1, input[key].size()[0])) for key in input.keys()}
-            result = model(input)
-            result = result.tolist()[0]
-            assert len(result) == model.bert.config.hidden_size + length
-            # assert len(result) == length
-            final_csv += y[i] + "," + ",".join([str(r) for r in result]) + "\n"
+    with torch.no_grad(), Tuned_threads(model.tuning):
+        for i in tqdm(range(0, len(x), batch_size)):
+            input = pad_batch(x[i:i + batch_size])
+            input = {key: input[key].to(device) for key in input.keys()}
+            results = model(input).tolist()
+            for j, result in enumerate(results):
+                assert len(result) == encoding_size + length
+                # assert len(result) == length
+                final_csv += y[i + j] + "," + ",".join([str(r) for r in result]) + "\n"
     f = open(save_file, "w")
     f.write(final_csv)
     f.close()
+    if arguments.exit_threshold is not None:
+        print(f"{dataset}: {len(model.layers_executed)} instances, average layers executed {sum(model.layers_executed) / len(model.layers_executed):.2f} of {model.bert.config.num_hidden_layers}")
 
 
 main()
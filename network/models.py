@@ -1,21 +1,188 @@
-from transformers import BertTokenizer, BertModel, RobertaTokenizer, RobertaModel, LongformerModel, LongformerTokenizer, AutoTokenizer, AutoModel
+from transformers import BertTokenizer, BertModel, RobertaTokenizer, RobertaModel, LongformerModel, LongformerTokenizer, AutoTokenizer, AutoModel, AutoConfig
+from safetensors.torch import load_file
 import torch.nn as nn
 import torch
+import numpy as np
 from neuralNetwork import NeuralNetwork
+from autotune import load_tuning
+try:
+    from transformers.modeling_utils import no_init_weights
+except ImportError:
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:
+        from contextlib import nullcontext as no_init_weights
+
+def get_base_model(base_model_name:'str', config:'str|None' = None) -> 'nn.Module':
+    """
+    Returns the encoder to use as base model. If config (a local directory created by export_weights.py) is given, 
+    only the architecture is built, without downloading nor initializing the pre-trained weights: they are expected to be loaded with load_weights.
+    """
+    if config is not None:
+        with no_init_weights():
+            return AutoModel.from_config(AutoConfig.from_pretrained(config, local_files_only=True))
+    if "FacebookAI/roberta-base" == base_model_name:
+        return RobertaModel.from_pretrained(base_model_name)
+    elif "bert-base-uncased" == base_model_name:
+        return BertModel.from_pretrained(base_model_name)
+    elif "allenai/longformer-base-4096" == base_model_name:
+        return LongformerModel.from_pretrained(pretrained_model_name_or_path = base_model_name)
+    elif "microsoft/codebert-base" == base_model_name:
+        return AutoModel.from_pretrained("microsoft/codebert-base")
+    else:
+        return AutoModel.from_pretrained(base_model_name)
+
+def load_weights(model:'nn.Module', weights:'str', problem:'str|None' = None) -> 'nn.Module':
+    """
+    Loads the fine-tuned weights into the model. The weights are memory mapped (safetensors or torch files) and assigned 
+    to the model instead of being copied into its parameters, so they are never held twice in memory.
+    The inference configuration found by autotune.py for these weights on this host (if any) is stored in model.tuning.
+    The exit heads of weights trained with early exits (see Early_exit_model) are dropped when the model has none.
+    """
+    state_dict = read_weights(weights)
+    if not hasattr(model, "exits"):
+        state_dict = {k:v for k, v in state_dict.items() if not (k.startswith("exits.") or k == "exit_layers")}
+    model.load_state_dict(state_dict, assign=True)
+    model.tuning = load_tuning(weights, problem)
+    return model
+
+def read_weights(weights:'str') -> 'dict[str,torch.Tensor]':
+    """
+    Returns the memory mapped state dict of a safetensors or torch weights file
+    """
+    if weights.endswith(".safetensors"):
+        return load_file(weights)
+    return torch.load(weights, map_location="cpu", mmap=True)
+
+def chunked_tokenize(tokenizer, instances:'list[str]', max_chunks:'int', chunk_size:'int|None' = None) -> 'dict[str,torch.Tensor]':
+    """
+    Tokenizes the instances without truncating them: each instance is split in windows of chunk_size tokens (default: the tokenizer maximum length).
+    Instances with more than max_chunks windows keep max_chunks evenly spaced windows.
+    -------
+    Output
+        A dictionary with the input_ids and the attention_mask of shape (instances, chunks, chunk_size) and the chunk_mask of shape (instances, chunks), 
+        that indicates which chunks are real and which ones are padding
+    """
+    chunk_size = chunk_size if chunk_size is not None else tokenizer.model_max_length
+    # the special tokens added around a sequence, found by tokenizing a single character with and without them
+    plain = tokenizer("a", add_special_tokens=False)["input_ids"]
+    full = tokenizer("a")["input_ids"]
+    start = [i for i in range(len(full)) if full[i:i + len(plain)] == plain][0]
+    prefix, suffix = full[:start], full[start + len(plain):]
+    body_size = chunk_size - len(prefix) - len(suffix)
+    encoded = tokenizer(instances, add_special_tokens=False, truncation=False)["input_ids"]
+    chunks = []
+    for ids in encoded:
+        instance_chunks = [ids[i:i + body_size] for i in range(0, max(len(ids), 1), body_size)]
+        if len(instance_chunks) > max_chunks:
+            kept = np.linspace(0, len(instance_chunks) - 1, max_chunks).round().astype(int)
+            instance_chunks = [instance_chunks[i] for i in kept]
+        chunks.append([prefix + chunk + suffix for chunk in instance_chunks])
+    n_chunks = max([len(instance_chunks) for instance_chunks in chunks])
+    length = max([len(chunk) for instance_chunks in chunks for chunk in instance_chunks])
+    input_ids = torch.full((len(instances), n_chunks, length), tokenizer.pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(instances), n_chunks, length), dtype=torch.long)
+    chunk_mask = torch.zeros((len(instances), n_chunks), dtype=torch.long)
+    for i, instance_chunks in enumerate(chunks):
+        for j, chunk in enumerate(instance_chunks):
+            input_ids[i, j, :len(chunk)] = torch.tensor(chunk)
+            attention_mask[i, j, :len(chunk)] = 1
+            chunk_mask[i, j] = 1
+    return {"input_ids": input_ids, "attention_mask": attention_mask, "chunk_mask": chunk_mask}
+
+def get_windows(inputs:'dict[str,torch.Tensor]') -> 'tuple[dict[str,torch.Tensor],torch.Tensor|None]':
+    """
+    Returns the inputs to give to the encoder and the chunk mask. Chunked inputs (see chunked_tokenize) become a single batch with the real windows only
+    """
+    if not "chunk_mask" in inputs:
+        return inputs, None
+    chunk_mask = inputs["chunk_mask"]
+    batch_size, n_chunks = chunk_mask.size()
+    valid = chunk_mask.reshape(-1).bool()
+    return {key: inputs[key].reshape(batch_size * n_chunks, -1)[valid] for key in inputs.keys() if key != "chunk_mask"}, chunk_mask
+
+def pool_windows(encoded_windows:'torch.Tensor', chunk_mask:'torch.Tensor|None') -> 'torch.Tensor':
+    """
+    Averages the encodings of the windows of each instance. Without chunk mask the encodings are returned as they are
+    """
+    if chunk_mask is None:
+        return encoded_windows
+    batch_size, n_chunks = chunk_mask.size()
+    encoded_chunks = encoded_windows.new_zeros((batch_size * n_chunks, encoded_windows.size()[-1]))
+    encoded_chunks[chunk_mask.reshape(-1).bool()] = encoded_windows
+    encoded_chunks = encoded_chunks.reshape(batch_size, n_chunks, -1)
+    weights = chunk_mask.unsqueeze(-1).to(encoded_chunks.dtype)
+    return (encoded_chunks * weights).sum(dim=1) / weights.sum(dim=1).clamp(min=1)
+
+def encode(bert:'nn.Module', inputs:'dict[str,torch.Tensor]') -> 'torch.Tensor':
+    """
+    Returns the pooled encoding of a batch. Chunked inputs (see chunked_tokenize) are encoded as a single batch of windows, 
+    skipping the padding chunks, and the encodings of the windows of each instance are averaged.
+    """
+    windows, chunk_mask = get_windows(inputs)
+    _, encoded_windows = bert(**windows, return_dict = False)
+    return pool_windows(encoded_windows, chunk_mask)
+
+class Exit_head(nn.Module):
+    def __init__(self, hidden_size:'int', num_classes:'int') -> None:
+        """
+        A classifier on the output of an intermediate layer of the encoder. It pools the first token as the pooler of the encoder does
+        """
+        super().__init__()
+        self.dense = nn.Linear(hidden_size, hidden_size)
+        self.activation = nn.Tanh()
+        self.output_layer = nn.Linear(hidden_size, num_classes)
+
+    def encode(self, hidden_states:'torch.Tensor') -> 'torch.Tensor':
+        return self.activation(self.dense(hidden_states[:, 0]))
+
+    def forward(self, hidden_states:'torch.Tensor') -> 'torch.Tensor':
+        return self.output_layer(self.encode(hidden_states))
+
+class Early_exit(Exception):
+    def __init__(self, encoding:'torch.Tensor', logits:'torch.Tensor', layers:'int') -> None:
+        super().__init__()
+        self.encoding = encoding
+        self.logits = logits
+        self.layers = layers
+
+def encode_with_early_exit(bert:'nn.Module', exits:'nn.ModuleList', exit_layers:'list[int]', inputs:'dict[str,torch.Tensor]', 
+                           threshold:'float') -> 'tuple[torch.Tensor,torch.Tensor|None,int]':
+    """
+    Encodes the batch stopping after the first exit layer where every probability of every instance is at least threshold or at most 1 - threshold.
+    The layers are left untouched: a hook after each exit layer evaluates its head and interrupts the forward pass when it is confident.
+    -------
+    Output
+        The encoding, the logits of the exit head that stopped the encoder (None if no exit was taken) and the number of layers executed.
+        When an exit is taken, the encoding is the one of the exit head on its intermediate layer, not the pooled output of the whole encoder,
+        so it must not be used as features in place of the latter
+    """
+    windows, chunk_mask = get_windows(inputs)
+
+    def get_hook(head:'Exit_head', layer:'int'):
+        def hook(module, args, output):
+            hidden_states = output[0] if isinstance(output, tuple) else output
+            encoding = pool_windows(head.encode(hidden_states), chunk_mask)
+            logits = head.output_layer(encoding)
+            probabilities = torch.sigmoid(logits)
+            if torch.all((probabilities >= threshold) | (probabilities <= 1 - threshold)):
+                raise Early_exit(encoding, logits, layer)
+        return hook
+
+    handles = [bert.encoder.layer[layer - 1].register_forward_hook(get_hook(head, layer)) for head, layer in zip(exits, exit_layers)]
+    try:
+        _, encoded_windows = bert(**windows, return_dict = False)
+        return pool_windows(encoded_windows, chunk_mask), None, len(bert.encoder.layer)
+    except Early_exit as e:
+        return e.encoding, e.logits, e.layers
+    finally:
+        for handle in handles:
+            handle.remove()
 
 class Timeout_and_selection_model(NeuralNetwork):
-    def __init__(self, base_model_name, num_classes, dropout=.1) -> None:
+    def __init__(self, base_model_name, num_classes, dropout=.1, config:'str|None' = None) -> None:
         super().__init__()
-        if "FacebookAI/roberta-base" == base_model_name:
-            self.bert = RobertaModel.from_pretrained(base_model_name)
-        elif "bert-base-uncased" == base_model_name:
-            self.bert = BertModel.from_pretrained(base_model_name)
-        elif "allenai/longformer-base-4096" == base_model_name:
-            self.bert = LongformerModel.from_pretrained(pretrained_model_name_or_path = base_model_name)
-        elif "microsoft/codebert-base" == base_model_name:
-            self.bert = AutoModel.from_pretrained("microsoft/codebert-base")
-        else:
-            self.bert = AutoModel.from_pretrained(base_model_name)
+        self.bert = get_base_model(base_model_name, config)
         self.dropout = nn.Dropout(dropout)
 
 
@@ -44,28 +211,49 @@ class Timeout_and_selection_model(NeuralNetwork):
 
 
 class BaseModel(NeuralNetwork):
-    def __init__(self, base_model_name, num_classes, dropout=.1) -> None:
+    def __init__(self, base_model_name, num_classes, dropout=.1, config:'str|None' = None) -> None:
         super().__init__()
-        if "FacebookAI/roberta-base" == base_model_name:
-            self.bert = RobertaModel.from_pretrained(base_model_name)
-        elif "bert-base-uncased" == base_model_name:
-            self.bert = BertModel.from_pretrained(base_model_name)
-        elif "allenai/longformer-base-4096" == base_model_name:
-            self.bert = LongformerModel.from_pretrained(pretrained_model_name_or_path = base_model_name)
-        elif "microsoft/codebert-base" == base_model_name:
-            self.bert = AutoModel.from_pretrained("microsoft/codebert-base")
-        else:
-            self.bert = AutoModel.from_pretrained(base_model_name)
+        self.bert = get_base_model(base_model_name, config)
         self.dropout = nn.Dropout(dropout)
 
         self.output_layer = nn.Linear(self.bert.config.hidden_size, num_classes)
 
 
     def forward(self, inputs):
-        _, encoded_input = self.bert(**inputs, return_dict = False)
+        encoded_input = encode(self.bert, inputs)
         encoded_input = self.dropout(encoded_input)
         return self.output_layer(encoded_input)
 
+class Early_exit_model(BaseModel):
+    def __init__(self, base_model_name, num_classes, exit_layers:'list[int]', dropout=.1, config:'str|None' = None) -> None:
+        """
+        A BaseModel with an exit head after each of the exit_layers (counted from 1), trained together with the final output layer.
+        The exit layers are stored in the weights, so that the generator can rebuild the heads.
+        """
+        super().__init__(base_model_name, num_classes, dropout, config)
+        if min(exit_layers) < 1 or max(exit_layers) >= self.bert.config.num_hidden_layers:
+            raise Exception(f"the exit layers must be between 1 and {self.bert.config.num_hidden_layers - 1}")
+        self.exits = nn.ModuleList([Exit_head(self.bert.config.hidden_size, num_classes) for _ in exit_layers])
+        self.register_buffer("exit_layers", torch.tensor(exit_layers))
+
+    def forward(self, inputs):
+        windows, chunk_mask = get_windows(inputs)
+        output = self.bert(**windows, output_hidden_states = True, return_dict = True)
+        encoded_input = self.dropout(pool_windows(output.pooler_output, chunk_mask))
+        exits = [head.output_layer(self.dropout(pool_windows(head.encode(output.hidden_states[layer]), chunk_mask)))
+                 for head, layer in zip(self.exits, self.exit_layers.tolist())]
+        return {"out": self.output_layer(encoded_input), "exits": exits}
+
+    def early_exit(self, inputs, threshold:'float') -> 'tuple[torch.Tensor,torch.Tensor,int]':
+        """
+        Returns the encoding, the logits and the number of layers executed, stopping at the first confident exit head (see encode_with_early_exit).
+        Only the logits are comparable with the ones of a full forward pass
+        """
+        encoding, logits, layers = encode_with_early_exit(self.bert, self.exits, self.exit_layers.tolist(), inputs, threshold)
+        if logits is None:
+            logits = self.output_layer(encoding)
+        return encoding, logits, layers
+
 def get_tokenizer(bert_type:str):
     if "FacebookAI/roberta-base" == bert_type:
         return RobertaTokenizer.from_pretrained(bert_type)
@@ -3,6 +3,7 @@ import torch
 import torch.optim.lr_scheduler as lr_scheduler
 from typing import Any, Tuple, Callable
 from sys import stdout
+from autotune import Tuned_threads
 
 class In_between_epochs:
     def __call__(self, model:torch.nn.Module, loaders:dict[str,torch.utils.data.DataLoader], device:'torch.device|str', output_extraction_function:Callable, losses:dict) -> bool:
@@ -207,11 +208,18 @@ class NeuralNetwork(nn.Module):
     return mean_metrics_scores, average_loss
 
   def predict(self, loader:torch.utils.data.DataLoader, output_extraction_function:Callable, device:'str|torch.device|None' = None) -> list:
+    """
+      Returns the predictions of the network on the loader. If the network has a tuning (set by load_weights from autotune.py), 
+      the loader is batched with the tuned batch size and the tuned number of threads is used
+    """
     net = self.to(device)
     net.eval()
     automatically_handle_gpu_memory = not device == None
     predictions = []
-    with torch.no_grad():
+    tuning = getattr(self, "tuning", None)
+    if tuning is not None:
+      loader = torch.utils.data.DataLoader(loader.dataset, batch_size=tuning["batch_size"], collate_fn=loader.collate_fn)
+    with torch.no_grad(), Tuned_threads(tuning):
         for _, data in enumerate(loader):
           labels = data[1]
           inputs = data[0]
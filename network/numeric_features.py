@@ -0,0 +1,154 @@
+import json
+import numpy as np
+import torch
+import torch.nn as nn
+from neuralNetwork import NeuralNetwork
+
+ARRAY_STATS = ["len", "size", "sum", "mean", "std", "min", "max"]
+
+class Numeric_encoder:
+    def __init__(self, schema:'list[list[str]]|None' = None, mean:'list[float]|None' = None, std:'list[float]|None' = None) -> None:
+        """
+        initialize an instance of the class Numeric_encoder.
+        It turns the json value of an instance (instance_value_json) into a fixed size vector: every numeric parameter is a feature
+        and every array (of any depth) is summarised by its length, number of elements, sum, mean, standard deviation, minimum and maximum.
+        Strings are ignored. The parameters and their kind are learned with fit, so that every instance of a problem gets the same vector layout.
+        ---------
+        Parameters
+            schema:list[list[str]]|None. Default=None
+                The (parameter, kind) pairs of a fitted encoder, where kind is scalar or array
+            mean:list[float]|None. Default=None
+                The mean of each feature, used to standardise the vectors
+            std:list[float]|None. Default=None
+                The standard deviation of each feature, used to standardise the vectors
+        -----
+        Usage
+        ```py
+        encoder = Numeric_encoder().fit([d["instance_value_json"] for d in data])
+        encoder.transform('{"b": 51, "g": 42, "k": 22, "t": 1}')
+        ```
+        """
+        self.schema = schema
+        self.mean = np.array(mean, dtype=np.float32) if mean is not None else None
+        self.std = np.array(std, dtype=np.float32) if std is not None else None
+
+    def fit(self, instances:'list[str]') -> 'Numeric_encoder':
+        kinds = {}
+        parsed = [json.loads(instance) for instance in instances]
+        for value in parsed:
+            for name, kind, _ in self.__flatten(value, ""):
+                if name in kinds and kinds[name] != kind:
+                    kind = "array"
+                kinds[name] = kind
+        self.schema = [[name, kinds[name]] for name in sorted(kinds.keys())]
+        vectors = np.array([self.__vector(value) for value in parsed], dtype=np.float32)
+        self.mean = vectors.mean(axis=0)
+        self.std = vectors.std(axis=0)
+        self.std[self.std == 0] = 1
+        return self
+
+    def size(self) -> 'int':
+        if self.schema is None:
+            raise Exception("the encoder must be fitted first")
+        return sum([1 if kind == "scalar" else len(ARRAY_STATS) for _, kind in self.schema])
+
+    def names(self) -> 'list[str]':
+        if self.schema is None:
+            raise Exception("the encoder must be fitted first")
+        names = []
+        for name, kind in self.schema:
+            names += [name] if kind == "scalar" else [f"{name}_{stat}" for stat in ARRAY_STATS]
+        return names
+
+    def transform(self, instance:'str') -> 'np.ndarray':
+        if self.schema is None or self.mean is None or self.std is None:
+            raise Exception("the encoder must be fitted first")
+        return (self.__vector(json.loads(instance)) - self.mean) / self.std
+
+    def to_dict(self) -> 'dict':
+        if self.schema is None or self.mean is None or self.std is None:
+            raise Exception("the encoder must be fitted first")
+        return {"schema": self.schema, "mean": self.mean.tolist(), "std": self.std.tolist()}
+
+    @staticmethod
+    def from_dict(encoder:'dict') -> 'Numeric_encoder':
+        return Numeric_encoder(encoder["schema"], encoder["mean"], encoder["std"])
+
+    def __vector(self, value) -> 'np.ndarray':
+        values = {name: v for name, _, v in self.__flatten(value, "")}
+        vector = []
+        for name, kind in self.schema:
+            v = values[name] if name in values else None
+            if kind == "scalar":
+                vector.append(float(v) if isinstance(v, (int, float)) else 0.)
+            else:
+                vector += self.__array_stats(v)
+        return np.array(vector, dtype=np.float32)
+
+    def __array_stats(self, value) -> 'list[float]':
+        if value is None:
+            return [0.] * len(ARRAY_STATS)
+        if not isinstance(value, list):
+            value = [value]
+        elements = np.array(self.__numbers(value), dtype=np.float64)
+        if len(elements) == 0:
+            return [float(len(value))] + [0.] * (len(ARRAY_STATS) - 1)
+        return [float(len(value)), float(len(elements)), float(elements.sum()), float(elements.mean()),
+                float(elements.std()), float(elements.min()), float(elements.max())]
+
+    def __numbers(self, value) -> 'list[float]':
+        if isinstance(value, bool):
+            return [float(value)]
+        elif isinstance(value, (int, float)):
+            return [value]
+        elif isinstance(value, list):
+            return [n for v in value for n in self.__numbers(v)]
+        elif isinstance(value, dict):
+            return [n for v in value.values() for n in self.__numbers(v)]
+        return []
+
+    def __flatten(self, value, prefix:'str') -> 'list[tuple[str,str,object]]':
+        if isinstance(value, dict):
+            return [leaf for key in value.keys() for leaf in self.__flatten(value[key], f"{prefix}.{key}" if prefix != "" else str(key))]
+        elif isinstance(value, bool) or isinstance(value, (int, float)):
+            return [(prefix, "scalar", value)]
+        elif isinstance(value, list):
+            return [(prefix, "array", value)]
+        return []
+
+class Numeric_model(NeuralNetwork):
+    def __init__(self, input_size:'int', num_classes:'int', hidden_size:'int' = 64, dropout:'float' = .1) -> None:
+        super().__init__()
+        self.encoder = nn.Sequential(
+            nn.Linear(input_size, hidden_size),
+            nn.ReLU(),
+            nn.Linear(hidden_size, hidden_size),
+            nn.ReLU()
+        )
+        self.dropout = nn.Dropout(dropout)
+        self.output_layer = nn.Linear(hidden_size, num_classes)
+
+    def forward(self, inputs):
+        encoded_input = self.encoder(inputs)
+        encoded_input = self.dropout(encoded_input)
+        return self.output_layer(encoded_input)
+
+def save_numeric_model(file_name:'str', encoder:'Numeric_encoder', model:'Numeric_model') -> None:
+    """
+    Stores the encoder and the weights of a numeric model in a single file, loadable with load_numeric_model
+    """
+    torch.save({
+        "encoder": encoder.to_dict(),
+        "input_size": model.encoder[0].in_features,
+        "hidden_size": model.encoder[0].out_features,
+        "num_classes": model.output_layer.out_features,
+        "state_dict": model.state_dict()
+    }, file_name)
+
+def load_numeric_model(file_name:'str') -> 'tuple[Numeric_encoder,Numeric_model]':
+    checkpoint = torch.load(file_name, map_location="cpu", weights_only=True)
+    encoder = Numeric_encoder.from_dict(checkpoint["encoder"])
+    model = Numeric_model(checkpoint["input_size"], checkpoint["num_classes"], checkpoint["hidden_size"])
+    model.load_state_dict(checkpoint["state_dict"])
+    model.eval()
+    return encoder, model
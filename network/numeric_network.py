@@ -0,0 +1,98 @@
+import argparse
+import torch
+import numpy as np
+from json import loads, dump
+import torch.nn.functional as F
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+from helper import get_dataloader, get_time_matrix
+from numeric_features import Numeric_encoder, Numeric_model, save_numeric_model
+
+def is_competitive(vb, option):
+    return (option < 10 or vb * 2 <= option) and option < 3600
+
+parser = argparse.ArgumentParser(description="Trains the numeric model (a small mlp on the numeric parameters of the instances) with the same competitiveness labels of competitive_network.py")
+parser.add_argument("--dataset", required=True)
+parser.add_argument("--batch_size", type=int, default=32)
+parser.add_argument("--epochs", type=int, required=True)
+parser.add_argument("--learning_rate", type=float, default=1e-3)
+parser.add_argument("--hidden_size", type=int, default=64)
+parser.add_argument("--history", required=True)
+parser.add_argument("--save", required=True, help="The file where the encoder and the weights are stored. It is the weights file of the numeric generator")
+parser.add_argument("--fold", type=int, required=True)
+parser.add_argument("--multiplier", type=int, default=1)
+
+def main():
+
+    arguments = parser.parse_args()
+    multiplier = arguments.multiplier
+    f = open(arguments.dataset)
+    data = loads(f.read())
+    f.close()
+
+    # the encoder is fitted on the training instances of the fold only, split as get_dataloader splits the encoded instances below
+    train_indexes = get_dataloader(list(range(len(data))), list(range(len(data))), 1, [arguments.fold])[0].dataset.x
+    encoder = Numeric_encoder().fit([data[i]["instance_value_json"] for i in train_indexes])
+    x = [torch.tensor(encoder.transform(d["instance_value_json"])) for d in data]
+    y = []
+
+    combinations = [d["combination"] for d in sorted(data[0]["all_times"], key= lambda x: x["combination"])]
+    for datapoint in data:
+        y_datapoint = sorted(datapoint["all_times"], key= lambda x: x["combination"])
+        datapoint["all_times"] = y_datapoint
+        vb = min([d["time"] for d in y_datapoint])
+        competitivness = [0 if is_competitive(vb, d["time"]) else 1 for d in y_datapoint]
+        y.append({
+            "competitivness":torch.Tensor(competitivness),
+            "times": {d["combination"]:d["time"] for d in y_datapoint}
+        })
+
+    all_times = [datapoint["all_times"] for datapoint in data]
+    train_dataloader, validation_dataloader, _ = get_dataloader(x, y, arguments.batch_size, [arguments.fold])
+
+    device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    print("operating on device:", device)
+
+    model = Numeric_model(encoder.size(), len(combinations), arguments.hidden_size)
+
+    times = get_time_matrix((len(all_times), len(combinations)), all_times)
+    len_train = len(train_dataloader.dataset)
+    timeouts = [sum([1 if times[i, j] >= 3600 else 0 for i in range(len_train)]) for j in range(len(combinations))]
+    max_timeouts = max(max(timeouts), 1)
+    weights = torch.tensor([1 + (1 - (timeout / max_timeouts)) for timeout in timeouts]).to(device)
+
+    def loss(y_pred, y_true):
+        timeouts_out = F.sigmoid(y_pred)
+        timeouts = -(multiplier * y_true["competitivness"] * torch.log(timeouts_out) + (1 - y_true["competitivness"]) * torch.log(1 - timeouts_out))
+        timeouts = timeouts * weights
+        return torch.mean(timeouts)
+
+    def extraction_function(x):
+        if isinstance(x, dict):
+            x = x["competitivness"]
+        return torch.round(torch.nn.functional.sigmoid(x)).cpu().tolist()
+
+    train_data, validation_data = model.train_network(train_dataloader,
+                    validation_dataloader,
+                    torch.optim.Adam,
+                    loss_function=loss,
+                    device=device,
+                    verbose=True,
+                    output_extraction_function= extraction_function,
+                    metrics={
+                     "accuracy": lambda y_true, y_pred: accuracy_score(np.ravel(y_true), np.ravel(y_pred)),
+                     "f1_score": lambda y_true, y_pred: f1_score(np.ravel(y_true), np.ravel(y_pred), average="macro", zero_division=0),
+                     "precision": lambda y_true, y_pred: precision_score(np.ravel(y_true), np.ravel(y_pred), average="macro", zero_division=0),
+                     "recall": lambda y_true, y_pred: recall_score(np.ravel(y_true), np.ravel(y_pred), average="macro", zero_division=0)},
+                    learning_rate=arguments.learning_rate,
+                    epochs=arguments.epochs)
+
+    save_numeric_model(arguments.save, encoder, model.cpu())
+    f = open(arguments.history, 'w')
+    for key in train_data:
+            train_data[key] = [float(v) for v in train_data[key]]
+            validation_data[key] = [float(v) for v in validation_data[key]]
+    dump({"train": train_data, "validation": validation_data}, f)
+    f.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import threading
+
+class Peak_memory:
+    """
+    Samples the resident memory (MB) of the process while a with block runs
+    """
+    def __init__(self, interval:'float' = .01) -> None:
+        import psutil
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+
+    def __sample(self) -> None:
+        while not self.stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss / 1024**2)
+            self.stop.wait(self.interval)
+
+    def __enter__(self) -> 'Peak_memory':
+        self.stop = threading.Event()
+        self.peak = self.process.memory_info().rss / 1024**2
+        self.thread = threading.Thread(target=self.__sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss / 1024**2)
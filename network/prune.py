@@ -0,0 +1,202 @@
+import argparse
+import os
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import numpy as np
+from json import loads, dump
+from time import time
+from safetensors.torch import save_file
+from torch.utils.data import DataLoader
+from helper import dict_lists_to_list_of_dicts, get_dataloader, get_time_matrix
+from models import BaseModel, get_tokenizer, load_weights, chunked_tokenize
+from serializers import get_serializer, SERIALIZERS
+from competitive_network import Timeout_analiser, is_competitive
+from export_weights import WEIGHTS_NAME
+
+def evaluate(model:'BaseModel', loader:'DataLoader', analiser:'Timeout_analiser') -> 'dict[str,float]':
+    """
+    Returns the validation loss (binary cross entropy of the competitiveness), the time of the options selected by the Timeout_analiser order oracle
+    and the time of the forward passes
+    """
+    losses, predictions, forward_time = [], [], 0
+    with torch.no_grad():
+        for x, y in loader:
+            start_time = time()
+            out = model(x)
+            forward_time += time() - start_time
+            losses.append(F.binary_cross_entropy_with_logits(out, y["competitivness"], reduction="sum").item())
+            predictions += torch.round(F.sigmoid(out)).tolist()
+    res = analiser.analyse_prediction(predictions, loader, analiser.idx2comb, analiser.order)
+    return {"loss": sum(losses) / (len(loader.dataset) * len(analiser.idx2comb)), "predicted_time": res["order_oracle"],
+            "undetected_timeouts": res["undetected_timeouts"], "forward_time": forward_time}
+
+def skip_layer(layer:'nn.Module'):
+    """
+    Makes the layer return its input, as if it was removed. Returns the handle of the hook
+    """
+    def hook(module, args, output):
+        return (args[0],) + tuple(output[1:]) if isinstance(output, tuple) else args[0]
+    return layer.register_forward_hook(hook)
+
+def mask_head(layer:'nn.Module', head:'int', head_size:'int'):
+    """
+    Removes the contribution of an attention head zeroing its slice of the attention output. Returns the handle of the hook
+    """
+    def hook(module, args):
+        context = args[0].clone()
+        context[..., head * head_size:(head + 1) * head_size] = 0
+        return (context,) + tuple(args[1:])
+    return layer.attention.output.dense.register_forward_pre_hook(hook)
+
+def score(model:'BaseModel', loader:'DataLoader', analiser:'Timeout_analiser', baseline:'dict[str,float]', verbose:'bool') -> 'tuple[list[dict],list[dict]]':
+    """
+    Scores every layer and every attention head by how much the validation loss and the predicted time grow without it
+    """
+    layers = model.bert.encoder.layer
+    heads = model.bert.config.num_attention_heads
+    head_size = model.bert.config.hidden_size // heads
+    layer_scores, head_scores = [], []
+    for i, layer in enumerate(layers):
+        handle = skip_layer(layer)
+        res = evaluate(model, loader, analiser)
+        handle.remove()
+        layer_scores.append({"layer": i, "loss": res["loss"] - baseline["loss"], "predicted_time": res["predicted_time"] - baseline["predicted_time"]})
+        if verbose:
+            print(f"layer {i}: loss {layer_scores[-1]['loss']:+.4f} predicted time {layer_scores[-1]['predicted_time']:+,.2f}")
+        for head in range(heads):
+            handle = mask_head(layer, head, head_size)
+            res = evaluate(model, loader, analiser)
+            handle.remove()
+            head_scores.append({"layer": i, "head": head, "loss": res["loss"] - baseline["loss"], "predicted_time": res["predicted_time"] - baseline["predicted_time"]})
+    return layer_scores, head_scores
+
+def remove_layers(model:'BaseModel', removed:'list[int]') -> None:
+    """
+    Removes the layers from the encoder and from its configuration, so that the model can be rebuilt from the configuration
+    """
+    config = model.bert.config
+    model.bert.encoder.layer = nn.ModuleList([layer for i, layer in enumerate(model.bert.encoder.layer) if i not in removed])
+    if isinstance(getattr(config, "attention_window", None), list):
+        config.attention_window = [window for i, window in enumerate(config.attention_window) if i not in removed]
+    config.num_hidden_layers = len(model.bert.encoder.layer)
+
+def zero_heads(model:'BaseModel', heads:'list[tuple[int,int]]') -> 'list[tuple[nn.Parameter,torch.Tensor]]':
+    """
+    Zeroes the columns of the attention output of the heads, given as (layer, head) with the indexes of the pruned model.
+    Returns the parameters and the masks to keep them at zero during the fine-tuning
+    """
+    head_size = model.bert.config.hidden_size // model.bert.config.num_attention_heads
+    masks = {}
+    for layer, head in heads:
+        dense = model.bert.encoder.layer[layer].attention.output.dense
+        if layer not in masks:
+            masks[layer] = torch.ones_like(dense.weight)
+        masks[layer][:, head * head_size:(head + 1) * head_size] = 0
+    masked = []
+    with torch.no_grad():
+        for layer, mask in masks.items():
+            weight = model.bert.encoder.layer[layer].attention.output.dense.weight
+            weight.mul_(mask)
+            masked.append((weight, mask))
+    return masked
+
+def sort_key(criterion:'str'):
+    if criterion == "loss":
+        return lambda s: (s["loss"], s["predicted_time"])
+    return lambda s: (s["predicted_time"], s["loss"])
+
+parser = argparse.ArgumentParser(description="Scores the layers and the attention heads of a fine-tuned model by their effect on the validation loss and on the predicted time, and prunes the least useful ones")
+parser.add_argument("--dataset", required=True)
+parser.add_argument("--weights", required=True, help="The fine-tuned weights")
+parser.add_argument("--config", required=False, help="A directory created by export_weights.py with the configuration and the tokenizer of the model")
+parser.add_argument("--output", required=True, help="The directory of the pruned model. It can be used as config of the generator, with output/model.safetensors as weights")
+parser.add_argument("--fold", type=int, default=0)
+parser.add_argument("--prune_layers", type=int, default=0, help="The number of layers to remove. Default = 0")
+parser.add_argument("--prune_heads", type=int, default=0, help="The number of attention heads to mask in the remaining layers. Default = 0")
+parser.add_argument("--criterion", choices=["loss", "time"], default="loss", help="The score used to choose what to prune first: the validation loss or the predicted time. Default = loss")
+parser.add_argument("--epochs", type=int, default=0, help="The epochs of fine-tuning after the pruning. Default = 0")
+parser.add_argument("--learning_rate", type=float, default=1e-5)
+parser.add_argument("--batch_size", type=int, default=8)
+parser.add_argument("--chunks", type=int, required=False, help="If given, long instances are split in windows (up to this number) whose encodings are averaged, instead of being truncated")
+parser.add_argument("--chunk_size", type=int, required=False, help="The number of tokens of each window with --chunks. Default = the maximum length of the tokenizer")
+parser.add_argument("--serializer", choices=list(SERIALIZERS.keys()), default="json", help="How the instances are turned into text before the tokenization. It must be the one used in training. Default = json")
+parser.add_argument("-v", "--verbose", default=False, action="store_true")
+
+def main():
+
+    arguments = parser.parse_args()
+    bert_type = "tororoin/longformer-8bitadam-2048-main"
+    config = arguments.config
+    f = open(arguments.dataset)
+    data = loads(f.read())
+    f.close()
+
+    tokenizer = get_tokenizer(config if config is not None else bert_type)
+    serializer = get_serializer(arguments.serializer)
+    instances = [serializer.serialize(d["instance_value_json"]) for d in data]
+    if arguments.chunks is None:
+        x = dict_lists_to_list_of_dicts(tokenizer(instances, padding=True, truncation=True, return_tensors='pt'))
+    else:
+        x = dict_lists_to_list_of_dicts(chunked_tokenize(tokenizer, instances, arguments.chunks, arguments.chunk_size))
+    y = []
+    idx2comb = {idx:comb["combination"] for idx, comb in enumerate(sorted(data[0]["all_times"], key= lambda x: x["combination"]))}
+    for datapoint in data:
+        y_datapoint = sorted(datapoint["all_times"], key= lambda x: x["combination"])
+        datapoint["all_times"] = y_datapoint
+        vb = min([d["time"] for d in y_datapoint])
+        y.append({
+            "competitivness":torch.Tensor([0 if is_competitive(vb, d["time"]) else 1 for d in y_datapoint]),
+            "times": {d["combination"]:d["time"] for d in y_datapoint}
+        })
+    train_dataloader, validation_dataloader, _ = get_dataloader(x, y, arguments.batch_size, [arguments.fold])
+    validation_dataloader = DataLoader(validation_dataloader.dataset, batch_size=arguments.batch_size)
+
+    times = get_time_matrix((len(data), len(idx2comb)), [d["all_times"] for d in data])
+    len_train = len(train_dataloader.dataset)
+    order = sorted([(i, np.sum(times[:len_train, i])) for i in range(len(idx2comb))], key=lambda x: x[1])
+    val_times = times[len_train:len_train + len(validation_dataloader.dataset)]
+    analiser = Timeout_analiser(train_dataloader, validation_dataloader, None, order, idx2comb, np.sum(np.min(times[:len_train], axis=1)), order[0][1],
+                                np.sum(np.min(val_times, axis=1)), np.min(np.sum(val_times, axis=0)), 0, 0)
+
+    model = BaseModel(bert_type, len(idx2comb), config=config)
+    load_weights(model, arguments.weights)
+    model.eval()
+
+    baseline = evaluate(model, validation_dataloader, analiser)
+    print(f"baseline: loss {baseline['loss']:.4f} predicted time {baseline['predicted_time']:,.2f} forward time {baseline['forward_time']:,.2f}s")
+    layer_scores, head_scores = score(model, validation_dataloader, analiser, baseline, arguments.verbose)
+
+    removed_layers = sorted([s["layer"] for s in sorted(layer_scores, key=sort_key(arguments.criterion))[:arguments.prune_layers]])
+    kept_layers = [i for i in range(len(model.bert.encoder.layer)) if i not in removed_layers]
+    remaining_heads = [s for s in head_scores if s["layer"] not in removed_layers]
+    masked_heads = [(s["layer"], s["head"]) for s in sorted(remaining_heads, key=sort_key(arguments.criterion))[:arguments.prune_heads]]
+    remove_layers(model, removed_layers)
+    masked = zero_heads(model, [(kept_layers.index(layer), head) for layer, head in masked_heads])
+
+    if arguments.epochs > 0:
+        # the masked heads are kept at zero during the fine-tuning
+        for weight, mask in masked:
+            weight.register_hook(lambda grad, mask=mask: grad * mask)
+        model.train_network(train_dataloader, validation_dataloader, torch.optim.SGD,
+                            loss_function=lambda y_pred, y_true: F.binary_cross_entropy_with_logits(y_pred, y_true["competitivness"]),
+                            output_extraction_function=lambda x: torch.round(F.sigmoid(x if not isinstance(x, dict) else x["competitivness"])).detach().cpu().tolist(),
+                            learning_rate=arguments.learning_rate, epochs=arguments.epochs, verbose=arguments.verbose)
+        model = model.cpu()
+    model.eval()
+    pruned = evaluate(model, validation_dataloader, analiser)
+    print(f"""removed layers: {removed_layers} masked heads: {masked_heads}
+pruned: loss {pruned['loss']:.4f} predicted time {pruned['predicted_time']:,.2f} forward time {pruned['forward_time']:,.2f}s speedup {baseline['forward_time'] / pruned['forward_time']:,.2f}""")
+
+    if not os.path.isdir(arguments.output):
+        os.makedirs(arguments.output)
+    model.bert.config.save_pretrained(arguments.output)
+    tokenizer.save_pretrained(arguments.output)
+    save_file({key: value.contiguous() for key, value in model.state_dict().items()}, os.path.join(arguments.output, WEIGHTS_NAME))
+    f = open(os.path.join(arguments.output, "pruning_report.json"), "w")
+    dump({"baseline": baseline, "pruned": pruned, "removed_layers": removed_layers, "masked_heads": masked_heads,
+          "layer_scores": layer_scores, "head_scores": head_scores}, f)
+    f.close()
+
+if __name__ == "__main__":
+    main()
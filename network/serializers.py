@@ -0,0 +1,133 @@
+import argparse
+import json
+import re
+from itertools import groupby
+import numpy as np
+
+class Serializer:
+    """
+    Turns the json value of an instance (instance_value_json) into the text given to the tokenizer.
+    The same serializer must be used to train a model and to generate its features.
+    """
+    def serialize(self, instance:'str') -> 'str':
+        raise Exception("Not implemented")
+
+class Json_serializer(Serializer):
+    def serialize(self, instance:'str') -> 'str':
+        return instance
+
+class Compact_serializer(Serializer):
+
+    IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+    def __init__(self, keys:'bool' = True, run_length:'bool' = False, float_precision:'int|None' = None) -> None:
+        """
+        initialize an instance of the class Compact_serializer.
+        ---------
+        Parameters
+            keys:bool. Default=True
+                Whether to keep the names of the instance parameters. If False, only their values are written, in order
+            run_length:bool. Default=False
+                Whether to compress runs of 3 or more equal consecutive elements (numbers or whole matrix rows) of a list as element*count
+            float_precision:int|None. Default=None
+                The number of significant digits of the floats. If None, the shortest exact representation is used
+        -----
+        Usage
+        ```py
+        serializer = Compact_serializer(keys=False, run_length=True)
+        serializer.serialize('{"n": 3, "m": [[0, 0, 0, 1], [0, 0, 0, 1], [0, 0, 0, 1]]}') # '3 [[0*3,1]*3]'
+        ```
+        """
+        super().__init__()
+        self.keys = keys
+        self.run_length = run_length
+        self.float_precision = float_precision
+
+    def serialize(self, instance:'str') -> 'str':
+        value = json.loads(instance)
+        if not self.keys and isinstance(value, dict):
+            return " ".join([self.__encode(v) for v in value.values()])
+        return self.__encode(value)
+
+    def __encode(self, value) -> 'str':
+        if isinstance(value, bool):
+            return json.dumps(value)
+        elif isinstance(value, int):
+            return str(value)
+        elif isinstance(value, float):
+            if value.is_integer():
+                return str(int(value))
+            if self.float_precision is not None:
+                return format(value, f".{self.float_precision}g")
+            return repr(value)
+        elif isinstance(value, str):
+            return value if self.IDENTIFIER.match(value) else json.dumps(value)
+        elif isinstance(value, list):
+            return "[" + ",".join(self.__encode_list(value)) + "]"
+        elif isinstance(value, dict):
+            return "{" + ",".join([f"{self.__encode(k)}:{self.__encode(v)}" for k, v in value.items()]) + "}"
+        return json.dumps(value)
+
+    def __encode_list(self, values:'list') -> 'list[str]':
+        encoded = [self.__encode(v) for v in values]
+        if not self.run_length:
+            return encoded
+        compressed = []
+        for element, group in groupby(encoded):
+            count = len(list(group))
+            if count >= 3:
+                compressed.append(f"{element}*{count}")
+            else:
+                compressed += [element] * count
+        return compressed
+
+SERIALIZERS = {
+    "json": Json_serializer(),
+    "compact": Compact_serializer(),
+    "compact_rle": Compact_serializer(run_length=True),
+    "positional": Compact_serializer(keys=False),
+    "positional_rle": Compact_serializer(keys=False, run_length=True),
+}
+
+def get_serializer(serializer:'str|Serializer') -> 'Serializer':
+    if isinstance(serializer, Serializer):
+        return serializer
+    if serializer not in SERIALIZERS:
+        raise Exception(f"serializer {serializer} unrecognised. Possible serializers are {list(SERIALIZERS.keys())}")
+    return SERIALIZERS[serializer]
+
+def token_stats(instances:'list[str]', tokenizer, serializer:'Serializer') -> 'dict':
+    """
+    Returns the statistics of the number of tokens per instance with a given serializer,
+    including how many instances exceed the maximum length of the tokenizer (and would be truncated)
+    """
+    serialized = [serializer.serialize(instance) for instance in instances]
+    lengths = np.array([len(ids) for ids in tokenizer(serialized, truncation=False)["input_ids"]])
+    return {
+        "mean": float(np.mean(lengths)),
+        "median": float(np.median(lengths)),
+        "max": int(np.max(lengths)),
+        "truncated": int(np.sum(lengths > tokenizer.model_max_length)),
+        "characters": float(np.mean([len(s) for s in serialized]))
+    }
+
+parser = argparse.ArgumentParser(description="Reports the number of tokens per instance of a dataset with each serializer")
+parser.add_argument("--dataset", required=True)
+parser.add_argument("--tokenizer", default="tororoin/longformer-8bitadam-2048-main", help="The tokenizer (or a directory created by export_weights.py) to use")
+parser.add_argument("--serializers", default=",".join(SERIALIZERS.keys()), help="A comma separated list of serializers to compare. Default = all")
+
+def main():
+    from models import get_tokenizer
+    arguments = parser.parse_args()
+    f = open(arguments.dataset)
+    data = json.load(f)
+    f.close()
+    tokenizer = get_tokenizer(arguments.tokenizer)
+    instances = [d["instance_value_json"] for d in data]
+    print("serializer,mean_tokens,median_tokens,max_tokens,truncated,mean_characters")
+    for name in arguments.serializers.split(","):
+        stats = token_stats(instances, tokenizer, get_serializer(name))
+        print(f"{name},{stats['mean']:.1f},{stats['median']:.1f},{stats['max']},{stats['truncated']},{stats['characters']:.1f}")
+
+if __name__ == "__main__":
+    main()
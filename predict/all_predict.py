@@ -1,14 +1,14 @@
 import argparse
 from time import time
-import pandas as pd
 import json
 from helper import get_dataloader, is_competitive, get_sb_vb, positive_int, get_predictor, pad
 from predictor.autofolio_predictor import Autofolio_predictor
+from predictor.feature_store import Feature_store
 
-def get_features(instances, features) -> 'list[dict]':
+def get_features(instances, features:'Feature_store') -> 'list[dict]':
     return [{
         "inst": inst[0], 
-        "features": features[features["inst"] == inst[0]].to_numpy()[0][1:].tolist(), 
+        "features": features.row(inst[0]).tolist(), 
         "times": {t["combination"]: t["time"] for t in inst[1]}
     } for inst in instances]
 
@@ -37,6 +37,19 @@ def build_kwargs(parser, idx2comb, features):
         args["pre_trained_model"] = parser.pre_trained_model
     if not parser.metrics_type is None:
         args["metrics_type"] = parser.metrics_type
+    if not parser.workers is None:
+        args["workers"] = parser.workers
+    args["search"] = parser.search
+    if not parser.seed_hyperparameters is None:
+        args["seeds"] = parser.seed_hyperparameters
+    if not parser.warm_start is None:
+        args["warm_starts"] = parser.warm_start
+    if not parser.cache_dir is None:
+        args["cache_dir"] = parser.cache_dir
+    args["backend"] = parser.backend
+    if not parser.components is None:
+        args["components"] = parser.components
+    args["chunk_size"] = parser.chunk_size
     args["filter"] = parser.filter
     return args
 
@@ -44,10 +57,18 @@ parser = argparse.ArgumentParser()
 parser.add_argument("-t", "--type", choices=["static", "kmeans", "autofolio", "metric"], help="the heuristic to use to make a choiche", required=True)
 parser.add_argument("-o", "--ordering", choices=["single_best", "wins"], help="the heuristic to use to make a choiche in the static ordering")
 parser.add_argument("--filter", default=False, help="Whether if the model should use the feature to pre-filter the options or not. Default = False", action='store_true')
-parser.add_argument("-f", "--features", type=str, help="The features to use (in csv format) with the heuristic", required=True)
+parser.add_argument("-f", "--features", type=str, help="The features to use with the heuristic: a csv, a binary bundle created by convert_features.py or a parquet file", required=True)
 parser.add_argument("-d", "--dataset", type=str, help="The dataset to use (in json format)", required=True)
 parser.add_argument("-s", "--split-fold", type=positive_int, help="The fold to use to split the dataset", required=True)
 parser.add_argument("--hyperparameters", type=str, help="A json file containing the hyperparameters to use with the kmeans clustering.", required=False)
+parser.add_argument("--workers", type=int, help="The number of processes of the kmeans hyperparameter search. Default is the number of cores", required=False)
+parser.add_argument("--search", choices=["halving", "grid"], default="halving", help="How the kmeans hyperparameters are searched: successive halving or the whole grid on the whole training set. Default = halving")
+parser.add_argument("--seed_hyperparameters", type=str, help="A comma separated list of json files (or directories of json files) with kmeans hyperparameters that the search always evaluates, e.g. data/kmeans_hyperparameters/CoveringArray", required=False)
+parser.add_argument("--cache_dir", type=str, help="A directory where the clusterings fitted by the kmeans search are stored and reused when the same fold is trained again. It does not change the result. Default = no cache", required=False)
+parser.add_argument("--warm_start", type=str, help="A comma separated list of kmeans predictors (or their kmeans.pkl) trained on other folds of the same features. The seed hyperparameters with the same number of clusters start the search from their centroids. Default = no warm start", required=False)
+parser.add_argument("--backend", choices=["kmeans", "minibatch"], default="kmeans", help="The clustering of the kmeans predictor: a KMeans fitted on all the training rows at once or a MiniBatchKMeans fitted a chunk of rows at a time. Default = kmeans")
+parser.add_argument("--components", type=int, help="If given, the features are reduced to this number of components with an incremental PCA before the clustering. Default = no reduction", required=False)
+parser.add_argument("--chunk_size", type=int, default=4096, help="The number of rows the clustering reads at a time. Default = 4096")
 parser.add_argument("--max_threads", type=int, help="The maximum number of threads to use with Autofolio. Default is 12", required=False)
 parser.add_argument("--pre_trained_model", type=str, help="The path to a pre-trained Autofolio model", required=False)
 parser.add_argument("-m", "--metrics_type", type=str, help="The metric to maximise in the metric ordering", choices=["recall", "accuracy", "precision", "f1"], required=False)
@@ -59,7 +80,7 @@ def main():
     dataset = json.load(f)
     f.close()
     fold = arguments.split_fold
-    original_features = pd.read_csv(arguments.features)
+    original_features = Feature_store.load(arguments.features)
     (x_train, _), (x_validation, _), (x_test, _) = get_dataloader(dataset, dataset, [fold])
     train_instances = [(x["instance_name"], x["all_times"]) for x in x_train]
     validation_instances = [(x["instance_name"], x["all_times"]) for x in x_validation]
@@ -87,28 +108,19 @@ def main():
     predictor = get_predictor(arguments.type, train_data, **args)
     assert isinstance(predictor, Autofolio_predictor)
 
-    train_features = [{"inst": inst[0], "features": original_features[original_features["inst"] == inst[0]].to_numpy()[0].tolist()} for inst in train_instances]
-    for i in range(len(train_features)):
-        train_features[i]["features"].pop(train_features[i]["features"].index(train_features[i]["inst"]))
-        _ = [float(e) for e in train_features[i]["features"]]
+    train_features = [{"inst": inst[0], "features": original_features.row(inst[0]).tolist()} for inst in train_instances]
     predictions = predictor.predict_sequential(train_features)
     f = open(f"train_predictions_fold_{fold}", "w")
     json.dump(predictions, f)
     f.close()
 
-    val_features = [{"inst": inst[0], "features": original_features[original_features["inst"] == inst[0]].to_numpy()[0].tolist()} for inst in validation_instances]
-    for i in range(len(val_features)):
-        val_features[i]["features"].pop(val_features[i]["features"].index(val_features[i]["inst"]))
-        _ = [float(e) for e in val_features[i]["features"]]
+    val_features = [{"inst": inst[0], "features": original_features.row(inst[0]).tolist()} for inst in validation_instances]
     predictions = predictor.predict_sequential(val_features)
     f = open(f"validation_predictions_fold_{fold}", "w")
     json.dump(predictions, f)
     f.close()
 
-    test_features = [{"inst": inst[0], "features": original_features[original_features["inst"] == inst[0]].to_numpy()[0].tolist()} for inst in test_instances]
-    for i in range(len(test_features)):
-        test_features[i]["features"].pop(test_features[i]["features"].index(test_features[i]["inst"]))
-        _ = [float(e) for e in test_features[i]["features"]]
+    test_features = [{"inst": inst[0], "features": original_features.row(inst[0]).tolist()} for inst in test_instances]
     predictions = predictor.predict_sequential(test_features)
     f = open(f"test_predictions_fold_{fold}", "w")
     json.dump(predictions, f)
@@ -0,0 +1,104 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import time
+import numpy as np
+from predictor.clustering_predictor import Row_subset, fit_clustering, fit_reduction, reduce_chunks, predict_chunks
+from predictor.feature_store import Feature_store
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "network"))
+from peak_memory import Peak_memory
+
+# the configurations that can be measured: the backend of the clustering and whether the features are reduced with a PCA first
+CONFIGURATIONS = {
+    "kmeans": {"backend": "kmeans", "reduction": False},
+    "minibatch": {"backend": "minibatch", "reduction": False},
+    "kmeans_pca": {"backend": "kmeans", "reduction": True},
+    "minibatch_pca": {"backend": "minibatch", "reduction": True}
+}
+
+def generate_features(file:'str', rows:'int', dims:'int', clusters:'int', chunk_size:'int' = 10000) -> 'None':
+    """
+    Writes a bundle of rows datapoints with dims features drawn around clusters random centers, a chunk at a time
+    """
+    rng = np.random.default_rng(0)
+    centers = rng.normal(0, 5, (clusters, dims)).astype(np.float32)
+    matrix = np.lib.format.open_memmap(file, mode="w+", dtype=np.float32, shape=(rows, dims))
+    for start in range(0, rows, chunk_size):
+        end = min(start + chunk_size, rows)
+        matrix[start:end] = centers[rng.integers(0, clusters, end - start)] + rng.normal(0, 1, (end - start, dims)).astype(np.float32)
+    matrix.flush()
+    f = open(Feature_store.index_file(file), "w")
+    json.dump({"instances": [str(i) for i in range(rows)], "columns": [f"f{i}" for i in range(dims)]}, f)
+    f.close()
+
+def measure(configuration:'str', file:'str', params:'dict', components:'int', chunk_size:'int') -> 'dict':
+    """
+    Fits the clustering of the configuration on the features as Kmeans_predictor does and returns the time, the peak memory and the inertia
+    """
+    store = Feature_store.load(file)
+    indexes = np.arange(len(store))
+    backend = CONFIGURATIONS[configuration]["backend"]
+    with Peak_memory() as memory:
+        start_time = time()
+        if CONFIGURATIONS[configuration]["reduction"]:
+            reduction = fit_reduction(Row_subset(store.matrix, indexes), components, chunk_size)
+            features = reduce_chunks(reduction, Row_subset(store.matrix, indexes), chunk_size)
+        elif backend == "minibatch":
+            features = Row_subset(store.matrix, indexes)
+        else:
+            features = store.matrix[indexes]
+        clustering = fit_clustering(params, features, backend=backend, chunk_size=chunk_size)
+        fit_time = time() - start_time
+        labels = predict_chunks(clustering, features, chunk_size)
+    # the inertia is computed on the features the clustering was fitted on, so it is comparable only between configurations with the same reduction
+    inertia = sum(float(np.sum((np.asarray(features[s:e], dtype=np.float64) - clustering.cluster_centers_[labels[s:e]]) ** 2))
+                  for s, e in [(s, min(s + chunk_size, len(features))) for s in range(0, len(features), chunk_size)])
+    return {"configuration": configuration, "fit_seconds": fit_time, "peak_mb": memory.peak, "iterations": int(clustering.n_iter_), "inertia": inertia}
+
+parser = argparse.ArgumentParser(description="Measures the fit time and the peak memory of the clustering backends of the kmeans predictor, each one in its own process")
+parser.add_argument("-f", "--features", type=str, help="The features to cluster (a csv, a binary bundle or a parquet file). Default = a generated bundle", required=False)
+parser.add_argument("--rows", type=int, help="The number of datapoints of the generated bundle. Default = 200000", default=200000)
+parser.add_argument("--dims", type=int, help="The number of features of the generated bundle. Default = 256", default=256)
+parser.add_argument("--configurations", type=str, help=f"A comma separated list of configurations among {', '.join(CONFIGURATIONS.keys())}. Default = all of them",
+                    default=",".join(CONFIGURATIONS.keys()))
+parser.add_argument("--hyperparameters", type=str, help="A json file with the hyperparameters of the clustering. Default = 16 clusters", required=False)
+parser.add_argument("--components", type=int, help="The number of components of the PCA configurations. Default = 16", default=16)
+parser.add_argument("--chunk_size", type=int, help="The number of rows read at a time. Default = 4096", default=4096)
+parser.add_argument("--run", choices=list(CONFIGURATIONS.keys()), help=argparse.SUPPRESS, required=False)
+
+def main():
+    args = parser.parse_args()
+    if args.hyperparameters is not None:
+        f = open(args.hyperparameters)
+        params = json.load(f)
+        f.close()
+    else:
+        params = {"n_clusters": 16, "init": "k-means++", "max_iter": 100, "tol": 1e-4, "n_init": 1, "random_state": 42, "verbose": 0}
+    if args.run is not None:
+        print(json.dumps(measure(args.run, args.features, params, args.components, args.chunk_size)))
+        return
+
+    directory = None
+    features = args.features
+    if features is None:
+        directory = tempfile.TemporaryDirectory()
+        features = os.path.join(directory.name, "features.npy")
+        generate_features(features, args.rows, args.dims, params["n_clusters"])
+    command = [sys.executable, os.path.abspath(__file__), "-f", features, "--components", str(args.components), "--chunk_size", str(args.chunk_size)]
+    if args.hyperparameters is not None:
+        command += ["--hyperparameters", args.hyperparameters]
+    print("configuration,fit_seconds,peak_mb,iterations,inertia")
+    for configuration in args.configurations.split(","):
+        if not configuration in CONFIGURATIONS:
+            raise Exception(f"configuration {configuration} unrecognised")
+        output = subprocess.run(command + ["--run", configuration], capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().split("\n")[-1])
+        print(f"{configuration},{result['fit_seconds']:.2f},{result['peak_mb']:.0f},{result['iterations']},{result['inertia']:.4g}")
+    if directory is not None:
+        directory.cleanup()
+
+if __name__ == "__main__":
+    main()
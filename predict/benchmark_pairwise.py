@@ -0,0 +1,84 @@
+import argparse
+from time import time
+import numpy as np
+import pandas as pd
+from predict import load
+from predictor.autofolio_predictor import Autofolio_predictor
+from predictor.pairwise_predictor import Pairwise_predictor
+from predictor.feature_store import Feature_store
+
+parser = argparse.ArgumentParser(description="Trains the pairwise selector on part of the instances and compares, on the others, its choices, their total time "+
+                                 "and the prediction latency with the single best option, the virtual best one and, if given, a trained AutoFolio predictor")
+parser.add_argument("-t", "--times", type=str, help="The times of each option (an inst column and a column for each option)", required=True)
+parser.add_argument("-f", "--features", type=str, help="The features (a csv, a binary bundle created by convert_features.py or a parquet file)", required=True)
+parser.add_argument("-a", "--autofolio", type=str, help="An autofolio predictor created by predict.py, trained on the same instances. Default = no comparison", required=False)
+parser.add_argument("--test_instances", type=str, help="A file with the instances to test, one per line. Default = a random 10%% of the instances", required=False)
+parser.add_argument("--selector_type", choices=["pairwise", "regression"], default="pairwise", help="The pairwise selector to train. Default = pairwise")
+parser.add_argument("--max_threads", type=int, help="The number of threads of each random forest. Default = 1", required=False)
+parser.add_argument("--row_limit", type=int, help="The maximum number of datapoints predicted one at a time. Default = 200", default=200)
+
+def main():
+    args = parser.parse_args()
+    times = pd.read_csv(args.times).set_index("inst")
+    features = Feature_store.load(args.features)
+    combinations = list(times.columns)
+    idx2comb = {idx:comb for idx, comb in enumerate(combinations)}
+    instances = [inst for inst in features.instances if inst in times.index]
+    if args.test_instances is not None:
+        f = open(args.test_instances)
+        test = set(line.strip() for line in f if line.strip() != "")
+        f.close()
+    else:
+        rng = np.random.default_rng(0)
+        test = set(rng.choice(instances, max(1, len(instances) // 10), replace=False).tolist())
+    train_instances = [inst for inst in instances if not inst in test]
+    test_instances = [inst for inst in instances if inst in test]
+    train_data = [{"inst": inst, "times": times.loc[inst, combinations]} for inst in train_instances]
+
+    start_time = time()
+    predictor = Pairwise_predictor(train_data, idx2comb, features, selector_type=args.selector_type, max_threads=args.max_threads)
+    train_time = time() - start_time
+
+    matrix = features.rows(test_instances)
+    test_times = times.loc[test_instances, combinations].to_numpy()
+    start_time = time()
+    chosen = predictor.predict_batch(matrix)
+    batch_time = time() - start_time
+    single_rows = min(len(matrix), args.row_limit)
+    start_time = time()
+    for i in range(single_rows):
+        predictor.predict_batch(matrix[i:i + 1])
+    single_time = (time() - start_time) / single_rows
+
+    single_best = int(np.argmin(times.loc[train_instances, combinations].to_numpy().sum(axis=0)))
+    print(f"{len(train_instances)} training instances, {len(test_instances)} test instances, training time {train_time:.2f}s")
+    print("selector,total_time,instances_with_the_best_option,seconds_per_instance")
+    print(f"virtual_best,{test_times.min(axis=1).sum():.2f},{len(test_instances)},")
+    print(f"single_best,{test_times[:, single_best].sum():.2f},{int(np.sum(test_times[:, single_best] == test_times.min(axis=1)))},")
+    rows = np.arange(len(test_instances))
+    print(f"{args.selector_type},{test_times[rows, chosen].sum():.2f},{int(np.sum(test_times[rows, chosen] == test_times.min(axis=1)))},"+
+          f"{single_time:.6f} (batch {batch_time / len(test_instances):.6f})")
+
+    if args.autofolio is not None:
+        autofolio = load(args.autofolio)
+        assert isinstance(autofolio, Autofolio_predictor)
+        comb2idx = {v:k for k,v in idx2comb.items()}
+        try:
+            start_time = time()
+            predictions = autofolio.predict_sequential([{"inst": inst, "features": features.row(inst).tolist()} for inst in test_instances])
+            autofolio_time = (time() - start_time) / len(test_instances)
+            predicted = np.array([p["chosen_option"] is not None for p in predictions])
+            autofolio_chosen = np.array([comb2idx[p["chosen_option"]] if p["chosen_option"] is not None else 0 for p in predictions])
+            start_time = time()
+            for i in range(single_rows):
+                autofolio.predict_batch(matrix[i:i + 1])
+            autofolio_single_time = (time() - start_time) / single_rows
+        finally:
+            autofolio.close()
+        print(f"autofolio,{test_times[rows[predicted], autofolio_chosen[predicted]].sum():.2f},"+
+              f"{int(np.sum(test_times[rows[predicted], autofolio_chosen[predicted]] == test_times[predicted].min(axis=1)))},"+
+              f"{autofolio_single_time:.6f} (batch {autofolio_time:.6f})")
+        print(f"same choice as autofolio on {int(np.sum(chosen[predicted] == autofolio_chosen[predicted]))} out of {int(predicted.sum())} instances")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+from time import time
+import numpy as np
+from predict import load
+from predictor.clustering_predictor import Kmeans_predictor
+from predictor.feature_store import Feature_store
+
+def get_matrix(predictor, features:'Feature_store|None', rows:'int', rng:'np.random.Generator') -> 'np.ndarray':
+    """
+    Returns rows datapoints sampled from the features or, if they are not given, random probabilities of the right width
+    """
+    if features is not None:
+        return features.matrix[rng.integers(0, len(features), rows)]
+    width = predictor.clustering_model.n_features_in_ if isinstance(predictor, Kmeans_predictor) else len(predictor.idx2comb)
+    return rng.random((rows, width), dtype=np.float32)
+
+parser = argparse.ArgumentParser(description="Measures the time of the predictions of a trained predictor with predict_batch, with the list of dicts of predict and one datapoint at a time")
+parser.add_argument("-n", "--name", help="The predictor created by predict.py", type=str, required=True)
+parser.add_argument("-f", "--features", type=str, help="A features file to sample the datapoints from. Default = random probabilities", required=False)
+parser.add_argument("--sizes", type=str, help="A comma separated list of numbers of datapoints. Default = 1000,100000,1000000", default="1000,100000,1000000")
+parser.add_argument("--row_limit", type=int, help="The maximum number of datapoints predicted one at a time, the time of the others is extrapolated. Default = 1000", default=1000)
+parser.add_argument("--filter", default=False, help="Whether the options are pre-filtered with the features or not. Default = False", action='store_true')
+
+def main():
+    args = parser.parse_args()
+    predictor = load(args.name)
+    features = Feature_store.load(args.features) if args.features is not None else None
+    rng = np.random.default_rng(0)
+    # the first call initializes the thread pools of the predictor (e.g. the ones of KMeans): it is not timed
+    predictor.predict_batch(get_matrix(predictor, features, 8, np.random.default_rng(1)), args.filter)
+    print("rows,batch_seconds,dict_seconds,single_seconds,batch_rows_per_second,speedup_over_single")
+    for rows in [int(s) for s in args.sizes.split(",")]:
+        matrix = get_matrix(predictor, features, rows, rng)
+        start_time = time()
+        predictor.predict_batch(matrix, args.filter)
+        batch_time = time() - start_time
+
+        dataset = [{"inst": str(i), "features": row.tolist()} for i, row in enumerate(matrix)]
+        start_time = time()
+        predictor.predict(dataset, args.filter)
+        dict_time = time() - start_time
+
+        single_rows = min(rows, args.row_limit)
+        start_time = time()
+        for i in range(single_rows):
+            predictor.predict_batch(matrix[i:i + 1], args.filter)
+        single_time = (time() - start_time) * rows / single_rows
+        print(f"{rows},{batch_time:.4f},{dict_time:.4f},{single_time:.4f},{rows / batch_time:.0f},{single_time / batch_time:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+from predictor.feature_store import Feature_store
+
+def count_rows(file:'str') -> 'int':
+    f = open(file, "rb")
+    rows = sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(1 << 20), b""))
+    f.seek(-1, os.SEEK_END)
+    if f.read(1) != b"\n":
+        rows += 1
+    f.close()
+    return rows - 1
+
+def csv_to_bundle(csv_file:'str', output:'str', chunk_size:'int' = 10000) -> 'int':
+    """
+    Converts a features csv into a binary bundle (see Feature_store.from_bundle) reading chunk_size rows at a time,
+    so that the csv never needs to fit in memory. Returns the number of instances
+    """
+    rows = count_rows(csv_file)
+    columns = None
+    instances = []
+    matrix = None
+    for chunk in pd.read_csv(csv_file, chunksize=chunk_size):
+        if columns is None:
+            if not "inst" in chunk.columns:
+                raise Exception(f"The features file {csv_file} does not include a inst column.")
+            columns = [c for c in chunk.columns if c != "inst"]
+            matrix = np.lib.format.open_memmap(output, mode="w+", dtype=np.float32, shape=(rows, len(columns)))
+        matrix[len(instances):len(instances) + len(chunk)] = chunk[columns].to_numpy(dtype=np.float32)
+        instances += chunk["inst"].tolist()
+    if matrix is None:
+        raise Exception(f"The features file {csv_file} is empty")
+    if len(instances) != rows:
+        raise Exception(f"The features file {csv_file} has {rows} lines but {len(instances)} instances")
+    matrix.flush()
+    f = open(Feature_store.index_file(output), "w")
+    json.dump({"instances": instances, "columns": columns}, f)
+    f.close()
+    return len(instances)
+
+parser = argparse.ArgumentParser(description="Converts a features csv (an inst column and a column for each feature) into a binary bundle that predict.py, all_predict.py "+
+                                 "and the predictors open with a memory map: a float32 .npy matrix and an .index.json file with the instance and feature names. "+
+                                 "If the output ends with .parquet, a parquet file is written instead (it needs pyarrow or fastparquet)")
+parser.add_argument("-f", "--features", type=str, help="The features csv", required=True)
+parser.add_argument("-o", "--output", type=str, help="The bundle to create (.npy or .parquet)", required=True)
+parser.add_argument("--chunk_size", type=int, help="The number of rows read from the csv at a time. Default = 10000", default=10000)
+
+def main():
+    args = parser.parse_args()
+    extension = os.path.splitext(args.output)[1]
+    if extension == ".parquet":
+        store = Feature_store.from_csv(args.features)
+        store.save(args.output)
+        instances = len(store)
+    elif extension == ".npy":
+        instances = csv_to_bundle(args.features, args.output, args.chunk_size)
+    else:
+        raise Exception(f"unrecognised output format {extension}. It must be .npy or .parquet")
+    print(f"{instances} instances written to {args.output}")
+
+if __name__ == "__main__":
+    main()
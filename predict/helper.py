@@ -1,9 +1,10 @@
 import argparse
 from predictor.base_predictor import Predictor
-from predictor.clustering_predictor import Kmeans_predictor
+from predictor.clustering_predictor import Kmeans_predictor, load_hyperparameters, load_clusterings
 from predictor.order_predictor import Static_ordering_predictor
 from predictor.autofolio_predictor import Autofolio_predictor
 from predictor.order_metrics import Metrics_predictor
+from predictor.pairwise_predictor import Pairwise_predictor
 
 def get_predictor(predictor_type:'str', 
                   train_data:'list[dict]', 
@@ -19,15 +20,40 @@ def get_predictor(predictor_type:'str',
             raise Exception(f"predictor_type {predictor_type} needs idx2comb. idx2comb cannot be None")
         if "features" not in kwargs:
             raise Exception(f"predictor_type {predictor_type} needs features. features cannot be None")
-        hyperparameters =  kwargs["hperparameters"] if "hyperparameters" in kwargs else None
+        hyperparameters =  kwargs["hyperparameters"] if "hyperparameters" in kwargs else None
+        if isinstance(hyperparameters, str):
+            hyperparameters = load_hyperparameters([hyperparameters])[0]
+        workers = kwargs["workers"] if "workers" in kwargs else None
+        halving = kwargs["search"] == "halving" if "search" in kwargs else True
+        seeds = kwargs["seeds"] if "seeds" in kwargs else None
+        if isinstance(seeds, str):
+            seeds = load_hyperparameters(seeds.split(","))
+        warm_starts = kwargs["warm_starts"] if "warm_starts" in kwargs else None
+        if isinstance(warm_starts, str):
+            warm_starts = load_clusterings(warm_starts.split(","))
+        cache_dir = kwargs["cache_dir"] if "cache_dir" in kwargs else None
+        backend = kwargs["backend"] if "backend" in kwargs else "kmeans"
+        components = kwargs["components"] if "components" in kwargs else None
+        chunk_size = kwargs["chunk_size"] if "chunk_size" in kwargs else 4096
         return Kmeans_predictor(training_data=train_data, idx2comb=kwargs["idx2comb"], features=kwargs["features"], 
-                                    filter=kwargs["filter"], hyperparameters=hyperparameters) 
+                                    filter=kwargs["filter"], hyperparameters=hyperparameters, workers=workers, halving=halving, 
+                                    seeds=seeds, cache_dir=cache_dir, backend=backend, components=components, chunk_size=chunk_size,
+                                    warm_starts=warm_starts) 
+    elif predictor_type == "pairwise":
+        if "idx2comb" not in kwargs:
+            raise Exception(f"predictor_type {predictor_type} needs idx2comb. idx2comb cannot be None")
+        if "features" not in kwargs:
+            raise Exception(f"predictor_type {predictor_type} needs features. features cannot be None")
+        selector_type = kwargs["selector_type"] if "selector_type" in kwargs else "pairwise"
+        max_threads = kwargs["max_threads"] if "max_threads" in kwargs else None
+        return Pairwise_predictor(training_data=train_data, idx2comb=kwargs["idx2comb"], features=kwargs["features"], selector_type=selector_type, max_threads=max_threads)
     elif predictor_type == "autofolio":
         if "features" not in kwargs:
             raise Exception(f"predictor_type {predictor_type} needs features. features cannot be None")
         max_threads = kwargs["max_threads"] if "max_threads" in kwargs else 12
         pre_trained_model = kwargs["pre_trained_model"] if "pre_trained_model" in kwargs else None
-        return Autofolio_predictor(training_data=train_data, features=kwargs["features"], max_threads=max_threads, pre_trained_model=pre_trained_model)
+        idx2comb = kwargs["idx2comb"] if "idx2comb" in kwargs else None
+        return Autofolio_predictor(training_data=train_data, features=kwargs["features"], max_threads=max_threads, pre_trained_model=pre_trained_model, idx2comb=idx2comb)
     elif predictor_type == "metric":
         if "features" not in kwargs:
             raise Exception(f"predictor_type {predictor_type} needs features. features cannot be None")
@@ -8,9 +8,11 @@ import json
 from helper import is_competitive
 from predictor.base_predictor import Predictor
 from predictor.autofolio_predictor import Autofolio_predictor, Autofolio_initializer
-from predictor.clustering_predictor import Kmeans_predictor, kmeans_initializer
+from predictor.clustering_predictor import Kmeans_predictor, kmeans_initializer, load_hyperparameters, load_clusterings
 from predictor.order_predictor import Static_ordering_predictor, Static_ordering_initializer
 from predictor.order_metrics import Metrics_predictor, Metrics_initializer
+from predictor.pairwise_predictor import Pairwise_predictor, Pairwise_initializer
+from predictor.feature_store import Feature_store
 
 CONFIG_NAME = "config"
 
@@ -18,7 +20,7 @@ def load(name) -> Predictor:
     f = open(os.path.join(name, CONFIG_NAME))
     config = json.load(f)
     if config["predictor_type"] == "autofolio":
-        initializer = Autofolio_initializer(os.path.join(name, Autofolio_predictor.MODEL_NAME), config["max_threads"])
+        initializer = Autofolio_initializer(os.path.join(name, Autofolio_predictor.MODEL_NAME), config["max_threads"], config.get("idx2comb"))
         return Autofolio_predictor.from_pretrained(initializer)
     elif config["predictor_type"] == "static":
         initializer = Static_ordering_initializer(config["order"], config["idx2comb"])
@@ -29,13 +31,16 @@ def load(name) -> Predictor:
     elif config["predictor_type"] == "kmeans":
         initializer = kmeans_initializer(os.path.join(name, Kmeans_predictor.MODEL_NAME), config["order"], config["idx2comb"])
         return Kmeans_predictor.from_pretrained(initializer)
+    elif config["predictor_type"] == "pairwise":
+        initializer = Pairwise_initializer(os.path.join(name, Pairwise_predictor.MODEL_NAME), config["idx2comb"])
+        return Pairwise_predictor.from_pretrained(initializer)
     else:
         raise Exception(f"predictor_type {config['predictor_type']} unrecognised")
 
-def get_features(instances, features) -> 'list[dict]':
+def get_features(instances, features:'Feature_store') -> 'list[dict]':
     return [{
         "inst": inst[0], 
-        "features": features[features["inst"] == inst[0]].to_numpy()[0][1:].tolist(), 
+        "features": features.row(inst[0]).tolist(), 
         "times": {t["combination"]: t["time"] for t in inst[1]}
     } for inst in instances]
 
@@ -51,7 +56,7 @@ def dnn_filtering(dataset:'list[dict]') -> 'list[dict]':
 
 def train(arguments):
     times = pd.read_csv(arguments.times)
-    features = pd.read_csv(arguments.features)
+    features = Feature_store.load(arguments.features)
 
     combinations = list(times.columns)
     if not "inst" in combinations:
@@ -61,13 +66,13 @@ def train(arguments):
     idx2comb = {idx:comb for idx, comb in enumerate(combinations)}
     predictor_type = arguments.type
 
-    if arguments.type in ["static", "metric"] and not len(times.columns) == len(features.columns):
+    if arguments.type in ["static", "metric"] and not len(combinations) == len(features.columns):
         raise Exception(f"predictor of type {arguments.type} must filter out the options and to do so, the features must be the same as the number of options")
     train_data = []
 
-    for i in range(len(features)):
-        inst = features[i]["inst"]
-        true_times = times[times["inst"] == inst].iloc[0][combinations]
+    times = times.set_index("inst")
+    for inst in features.instances:
+        true_times = times.loc[inst, combinations]
         vb = min(true_times)
 
         train_data.append({
@@ -84,16 +89,24 @@ def train(arguments):
         predictor = Static_ordering_predictor(idx2comb=idx2comb, training_data=train_data, ordering_type=arguments.ordering)
         data_to_save["order"] = predictor.order
     elif predictor_type == "kmeans":
-        predictor = Kmeans_predictor(training_data=train_data, idx2comb=idx2comb, features=features,filter=arguments.filter) 
+        predictor = Kmeans_predictor(training_data=train_data, idx2comb=idx2comb, features=features,filter=arguments.filter, 
+                                     workers=arguments.workers, halving=arguments.search == "halving", cache_dir=arguments.cache_dir,
+                                     backend=arguments.backend, components=arguments.components, chunk_size=arguments.chunk_size,
+                                     seeds=load_hyperparameters(arguments.seed_hyperparameters.split(",")) if arguments.seed_hyperparameters is not None else None,
+                                     warm_starts=load_clusterings(arguments.warm_start.split(",")) if arguments.warm_start is not None else None) 
         data_to_save["order"] = predictor.order
     elif predictor_type == "autofolio":
-        predictor = Autofolio_predictor(training_data=train_data, features=features, max_threads=arguments.max_threads)
+        predictor = Autofolio_predictor(training_data=train_data, features=features, max_threads=arguments.max_threads, idx2comb=idx2comb)
         data_to_save["max_threads"] = predictor.max_threads
     elif predictor_type == "metric":
         if arguments.metrics_type is None:
             raise Exception(f"predictor_type {predictor_type} needs a metric type. metrics_type cannot be None")
         predictor = Metrics_predictor(training_data=train_data, idx2comb=idx2comb, features=features, metrics_type=arguments.metrics_type)
         data_to_save["order"] = predictor.order
+    elif predictor_type == "pairwise":
+        predictor = Pairwise_predictor(training_data=train_data, idx2comb=idx2comb, features=features, selector_type=arguments.selector_type, 
+                                       max_threads=arguments.max_threads)
+        data_to_save["selector_type"] = predictor.selector_type
     else:
         raise Exception(f"predictor_type {predictor_type} unrecognised")
 
@@ -108,9 +121,18 @@ def train(arguments):
         shutil.copy(predictor.model, os.path.join(arguments.name, Autofolio_predictor.MODEL_NAME))
     if predictor_type == "kmeans":
         joblib.dump(predictor.clustering_model, os.path.join(arguments.name, Kmeans_predictor.MODEL_NAME))
+    if predictor_type == "pairwise":
+        predictor.save(os.path.join(arguments.name, Pairwise_predictor.MODEL_NAME))
 
 def predict(args):
     predictor = load(args.name)
+    try:
+        print_predictions(predictor, args)
+    finally:
+        if isinstance(predictor, Autofolio_predictor):
+            predictor.close()
+
+def print_predictions(predictor:'Predictor', args):
     features = args.features
     if "," in features:
         features = [float(v) for v in features.split(",")]
@@ -129,38 +151,48 @@ def predict(args):
         print(output)
 
     elif os.path.exists(features):
-        df = pd.read_csv(features)
-        instances = df["inst"].to_list()
-        features = [{"inst": inst, "features": df[df["inst"] == inst].to_numpy()[0].tolist()[1:]} for inst in instances]
-        predictions = predictor.predict(features)
-        output = {}
-        output["predictions"] = predictions
-        if not args.time:
-            del output["time"]
+        store = Feature_store.load(features)
+        start_time = time()
+        chosen_options = predictor.predict_batch(store.matrix)
+        prediction_time = time() - start_time
+        predictions = [{"chosen_option": predictor.idx2comb[int(chosen_option)], "inst": inst} for inst, chosen_option in zip(store.instances, chosen_options)]
         if args.output == "text":
             output = "predictions:"
             for prediction in predictions:
                 output += f"\n\t- {prediction['inst']}:  {prediction['chosen_option']}"
-            output += f"\nprediction time:  {output['time']}"
+            if args.time:
+                output += f"\nprediction time:  {prediction_time}"
         elif args.output == "json":
+            output = {"predictions": predictions}
+            if args.time:
+                output["time"] = prediction_time
             output = json.dumps(output)
         elif args.output == "csv":
-            output = "inst,chosen_option,total_time"
+            output = "inst,chosen_option" + (",total_time" if args.time else "")
             for prediction in predictions:
-                output += f"{prediction['inst']},{prediction['chosen_option']},{output['time']}"
+                output += f"\n{prediction['inst']},{prediction['chosen_option']}" + (f",{prediction_time}" if args.time else "")
         print(output)
     
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-m", "--mode", choices=["train", "predict"], help="mode for the script. train: train a classifier, predict (default): predict using a classifier", default="predict")
-parser.add_argument("--type", choices=["static", "kmeans", "autofolio", "metric"], help="the heuristic to use to make a choiche", required=False)
+parser.add_argument("--type", choices=["static", "kmeans", "autofolio", "metric", "pairwise"], help="the heuristic to use to make a choiche", required=False)
 parser.add_argument("-t", "--times", type=str, help="The times of each option to use in the training process", required=False)
 parser.add_argument("-o", "--ordering", choices=["single_best", "wins"], help="the heuristic to use to make a choiche in the static ordering")
 parser.add_argument("--filter", default=False, help="Whether if the model should use the feature to pre-filter the options or not. Default = False", action='store_true')
-parser.add_argument("-f", "--features", type=str, help="The features to use with the heuristic. It must be either a csv file or a comma separated list of values to use as features", required=True)
+parser.add_argument("-f", "--features", type=str, help="The features to use with the heuristic. It must be either a features file (csv, binary bundle created by convert_features.py or parquet) or a comma separated list of values to use as features", required=True)
 parser.add_argument("--metrics_type", type=str, help="The metric to maximise in the metric ordering", choices=["recall", "accuracy", "precision", "f1"], required=False)
 parser.add_argument("--output", choices=["text", "json", "csv"], help="The output format when predicting. Default: text", default="text")
-parser.add_argument("--max_threads", help="The number of threads to use during the prediction with autofolio", type=int, default=12)
+parser.add_argument("--workers", type=int, help="The number of processes of the kmeans hyperparameter search. Default is the number of cores", required=False)
+parser.add_argument("--search", choices=["halving", "grid"], default="halving", help="How the kmeans hyperparameters are searched: successive halving or the whole grid on the whole training set. Default = halving")
+parser.add_argument("--seed_hyperparameters", type=str, help="A comma separated list of json files (or directories of json files) with kmeans hyperparameters that the search always evaluates, e.g. data/kmeans_hyperparameters/CoveringArray", required=False)
+parser.add_argument("--cache_dir", type=str, help="A directory where the clusterings fitted by the kmeans search are stored and reused when the same fold is trained again. It does not change the result. Default = no cache", required=False)
+parser.add_argument("--warm_start", type=str, help="A comma separated list of kmeans predictors (or their kmeans.pkl) trained on other folds of the same features. The seed hyperparameters with the same number of clusters start the search from their centroids. Default = no warm start", required=False)
+parser.add_argument("--backend", choices=["kmeans", "minibatch"], default="kmeans", help="The clustering of the kmeans predictor: a KMeans fitted on all the training rows at once or a MiniBatchKMeans fitted a chunk of rows at a time. Default = kmeans")
+parser.add_argument("--components", type=int, help="If given, the features are reduced to this number of components with an incremental PCA before the clustering. Default = no reduction", required=False)
+parser.add_argument("--chunk_size", type=int, default=4096, help="The number of rows the clustering reads at a time. Default = 4096")
+parser.add_argument("--max_threads", help="The number of threads to use during the prediction with autofolio, and of each random forest of the pairwise selector", type=int, default=12)
+parser.add_argument("--selector_type", choices=["pairwise", "regression"], default="pairwise", help="The pairwise selector: a cost-sensitive classifier for each pair of options or a regressor of the time of each option. Default = pairwise")
 parser.add_argument("--time", default=False, help="Whether the script shoud print the time required to get the predictions or not. Default = False", action='store_true')
 parser.add_argument("-n", "--name", help="File name to use for the predictor", type=str, required=True)
 
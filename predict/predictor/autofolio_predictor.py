@@ -1,29 +1,137 @@
 from .base_predictor import Predictor, Predictor_initializer
-from tqdm import tqdm
+from .feature_store import Feature_store
 from sys import stderr
 import platform
 import concurrent.futures
-import re
+import json
+import queue
 import subprocess
+import tempfile
+import threading
 import pandas as pd
+import numpy as np
 import os
 from time import time
 
 class Autofolio_initializer(Predictor_initializer):
-    def __init__(self, model:'str', max_threads:'int') -> None:
+    def __init__(self, model:'str', max_threads:'int', idx2comb:'dict|None' = None) -> None:
         super().__init__()
         self.model = model
         self.max_threads = max_threads
+        self.idx2comb = {int(k):v for k,v in idx2comb.items()} if idx2comb is not None else None
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "autofolio_worker.py")
+
+class Autofolio_worker:
+    def __init__(self, model:'str', python:'str' = "python3", autofolio:'str' = "AutoFolio") -> None:
+        """
+        initialize an instance of the class Autofolio_worker.
+        It starts an AutoFolio process (see autofolio_worker.py) that loads the model once and predicts the feature vectors sent to it
+        through a pipe, one JSON line each.
+        ---------
+        Parameters
+            model:str.
+                The model trained with AutoFolio
+            python:str. Default="python3"
+                The interpreter of AutoFolio (python 3.6)
+            autofolio:str. Default="AutoFolio"
+                The directory of AutoFolio
+        """
+        self.process = subprocess.Popen([python, WORKER, "--autofolio", autofolio, "--load", model], 
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True, bufsize=1)
+        self.lock = threading.Lock()
+
+    def predict(self, features:'list[float]') -> 'str':
+        """
+        Returns the option chosen by AutoFolio for the feature vector
+        """
+        with self.lock:
+            if self.process.poll() is not None:
+                raise Exception(f"the AutoFolio worker exited with code {self.process.returncode}")
+            self.process.stdin.write(json.dumps({"features": [float(f) for f in features]}) + "\n")
+            self.process.stdin.flush()
+            line = self.process.stdout.readline()
+        if line == "":
+            raise Exception(f"the AutoFolio worker exited with code {self.process.wait()}")
+        response = json.loads(line)
+        if "error" in response:
+            raise Exception(response["error"])
+        return response["chosen_option"]
+
+    def close(self) -> None:
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+class Autofolio_pool:
+    def __init__(self, model:'str', max_workers:'int', python:'str' = "python3", autofolio:'str' = "AutoFolio") -> None:
+        """
+        initialize an instance of the class Autofolio_pool.
+        A set of Autofolio_worker of the same model: each prediction is answered by one of the workers that is not busy. The workers are 
+        started only when all the others are busy, so the pool never starts more workers than the predictions it answers at the same time
+        ---------
+        Parameters
+            model:str.
+                The model trained with AutoFolio
+            max_workers:int.
+                The maximum number of AutoFolio processes
+            python:str. Default="python3"
+                The interpreter of AutoFolio (python 3.6)
+            autofolio:str. Default="AutoFolio"
+                The directory of AutoFolio
+        """
+        self.model = model
+        self.max_workers = max_workers
+        self.python = python
+        self.autofolio = autofolio
+        self.workers = []
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+
+    def __get_worker(self) -> 'Autofolio_worker':
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.workers) < self.max_workers:
+                self.workers.append(Autofolio_worker(self.model, self.python, self.autofolio))
+                return self.workers[-1]
+        return self.idle.get()
+
+    def predict(self, features:'list[float]') -> 'str':
+        worker = self.__get_worker()
+        try:
+            return worker.predict(features)
+        finally:
+            self.idle.put(worker)
+
+    def close(self) -> None:
+        with self.lock:
+            for worker in self.workers:
+                worker.close()
+            self.workers = []
+            self.idle = queue.Queue()
+
+    def __enter__(self) -> 'Autofolio_pool':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
 
 class Autofolio_predictor(Predictor):
     
     MODEL_NAME = "autofolio_random_forest_model"
     CACHE_DIR = ".cache"
+    # the interpreter and the directory of AutoFolio used by the prediction workers
+    PYTHON = "python3"
+    AUTOFOLIO_DIR = "AutoFolio"
 
     def __init__(self, training_data:'list[dict]|None', 
-                 features:'pd.DataFrame|None', 
+                 features:'pd.DataFrame|Feature_store|None', 
                  max_threads:'int' = 12,
-                 pre_trained_model:'str|None' = None
+                 pre_trained_model:'str|None' = None,
+                 idx2comb:'dict[int,str]|None' = None
         ) -> 'None':
         """
         initialize an instance of the class Recall_predictor.
@@ -31,29 +139,35 @@ class Autofolio_predictor(Predictor):
         Parameters
             training_data:list[dict].
                 Indicates the data to use to create the ordering used to break ties
-            idx2comb:dict[int,str].
-                A dictionary that, for each index, returns the corresponding combination
-            features:pd.DataFrame.
-                a dataframe with a column indicating the instances and a feature set for each feature
-            hyperparameters:dict|None. Default=None
-                hyperparameters of the clustering model to use. If None, a greedy search will be done to find the best hyperparameters
+            features:pd.DataFrame|Feature_store.
+                a dataframe with a column indicating the instances and a feature set for each feature, or a Feature_store of them
+            max_threads:int. Default=12
+                The maximum number of AutoFolio worker processes that predict at the same time. They are started by the predictions 
+                when needed (see Autofolio_pool) and stopped by close
+            pre_trained_model:str|None. Default=None
+                A model already trained with AutoFolio. If None, a new model is trained
+            idx2comb:dict[int,str]|None. Default=None
+                A dictionary that, for each index, returns the corresponding combination. It is used by predict_batch to return indexes.
+                If None, the combinations of the training data in alphabetical order
         -----
         Usage
         ```py
         train_data = [{"inst": "instance name", "trues":[1,0,1,0]}]
         fatures = pd.DataFrame([{"inst": "instance name", "feat1":0, "feat2":0, "feat3":1, "feat4":1}])
-        idx2comb = {0: "combination_0", 1:"combination_1"}
-        predictor = Clustering_predictor(train_data, idx2comb, features)
+        predictor = Autofolio_predictor(train_data, features)
         ```
         """
 
         super().__init__()
+        self.pool = None
         if training_data is None or features is None:
             return
         if "3.6" not in platform.python_version():
             raise Exception(f"AUtofolio works only on python version 3.6.x. found {platform.python_version()}")
 
         self.max_threads = max_threads
+        combinations = sorted(list(training_data[0]["times"].keys()))
+        self.idx2comb = idx2comb if idx2comb is not None else {idx:comb for idx, comb in enumerate(combinations)}
         if pre_trained_model is None:
             if not os.path.isdir(self.CACHE_DIR):
                 os.makedirs(self.CACHE_DIR)
@@ -62,17 +176,13 @@ class Autofolio_predictor(Predictor):
             pre_trained_model = os.path.join(self.CACHE_DIR, self.MODEL_NAME)
             features_file = os.path.join(self.CACHE_DIR, f"train_features.csv")
 
-            x_header = list(features.columns)
+            features = Feature_store.get(features)
+            x_header = ["inst"] + features.columns
             x_train_file = self.__create_file(features_file)
             x_train_file.write(",".join(x_header) + "\n")
-            x_train = [[str(f) for f in features[features["inst"] == datapoint["inst"]].to_numpy()[0].tolist()] for datapoint in training_data]
-            for i in range(len(training_data)):
-                inst = training_data[i]["inst"]
-                x_train[i].pop(x_train[i].index(inst))
-                x_train[i] = [inst] + x_train[i]
+            x_train = [[datapoint["inst"]] + [str(f) for f in features.row(datapoint["inst"])] for datapoint in training_data]
             self.__save(x_train, x_train_file)
             x_train_file.close()
-            combinations = sorted(list(training_data[0]["times"].keys()))
             y_header = ["inst"] + combinations
             y_train_file = self.__create_file(times_file)
             y_train_file.write(",".join(y_header) + "\n")
@@ -90,6 +200,7 @@ class Autofolio_predictor(Predictor):
         predictor = Autofolio_predictor(None, None)
         predictor.model = pretrained.model
         predictor.max_threads = pretrained.max_threads
+        predictor.idx2comb = pretrained.idx2comb
         return predictor
 
     def __create_file(self, file_name):
@@ -102,15 +213,23 @@ class Autofolio_predictor(Predictor):
         for d in data:
             file.write(f"{','.join(d)}\n")
 
+    def __get_pool(self) -> 'Autofolio_pool':
+        if self.pool is None:
+            self.pool = Autofolio_pool(self.model, self.max_threads, self.PYTHON, self.AUTOFOLIO_DIR)
+        return self.pool
+
+    def close(self) -> None:
+        """
+        Stops the AutoFolio workers. They are started again by the next prediction
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
     def __get_prediction(self, options:'list', inst:'str'):
         start = time()
-        options = [str(o) for o in options]
-        out = subprocess.run(['python3', 'AutoFolio/scripts/autofolio', '--load', self.model, '--feature_vec', f'{" ".join(options)}'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-        out = out.stdout.decode('utf-8')
-        chosen_option = re.findall(r"\[\('([a-zA-Z0-9.,-_]*)', [0-9]*\)\]", out)
-        if len(chosen_option) == 0:
-            raise Exception(out)
-        return chosen_option[0], inst, time() - start
+        chosen_option = self.__get_pool().predict(options)
+        return chosen_option, inst, time() - start
 
     def __get_dataset(self, dataset:'list') -> 'list[dict]':
         if type(dataset[0]) == float:
@@ -137,7 +256,8 @@ class Autofolio_predictor(Predictor):
         if filter != False:
             print("WARNING: predictor Autofolio cannot pre-filter option", file=stderr)
         predictions = []
-        with concurrent.futures.ThreadPoolExecutor(self.max_threads) as executor:
+        self.__get_pool()
+        with concurrent.futures.ThreadPoolExecutor(min(self.max_threads, len(dataset))) as executor:
             futures = {executor.submit(self.__get_prediction,datapoint["features"], datapoint["inst"]): datapoint["inst"] for datapoint in dataset}
 
             for future in concurrent.futures.as_completed(futures):
@@ -152,13 +272,64 @@ class Autofolio_predictor(Predictor):
             return predictions[0]
         return predictions
     
-    def predict_sequential(self, dataset:'list[dict]') -> 'list[dict]|dict':
+    def predict_batch(self, features:'np.ndarray', filter:'bool'=False) -> 'np.ndarray':
+        """
+        Given a matrix with the features of a datapoint in each row, returns the index (in idx2comb) of the chosen option of each datapoint
+        """
+        if self.idx2comb is None:
+            raise Exception("predict_batch needs idx2comb to return the indexes of the options")
+        if filter != False:
+            print("WARNING: predictor Autofolio cannot pre-filter option", file=stderr)
+        comb2idx = {v:k for k,v in self.idx2comb.items()}
+        if len(features) == 0:
+            return np.zeros(0, dtype=np.int64)
+        self.__get_pool()
+        with concurrent.futures.ThreadPoolExecutor(min(self.max_threads, len(features))) as executor:
+            results = list(executor.map(lambda row: self.__get_prediction(list(row), ""), features))
+        return np.array([comb2idx[result[0]] for result in results], dtype=np.int64)
+
+    def predict_sequential(self, dataset:'list[dict]') -> 'list[dict]':
+        """
+        Given a dataset, returns a list with the prediction of each datapoint, in the same order. All the datapoints are written to one file
+        and predicted by a single AutoFolio process, so the model is loaded once. The time of each prediction is the time of the whole batch
+        divided by the number of datapoints. A datapoint that AutoFolio could not predict has a None chosen_option and an error
+        -------
+        Parameters
+            dataset:list[dict]
+                A list containing, for each datapoint to predict, the instance name and a list of features to use for the prediction
+        """
+        if len(dataset) == 0:
+            return []
+        if not os.path.isdir(self.CACHE_DIR):
+            os.makedirs(self.CACHE_DIR)
+        input_file, output_file = [tempfile.mkstemp(suffix=suffix, dir=self.CACHE_DIR) for suffix in [".features.jsonl", ".predictions.jsonl"]]
+        os.close(input_file[0])
+        os.close(output_file[0])
+        f = open(input_file[1], "w")
+        for datapoint in dataset:
+            f.write(json.dumps({"inst": datapoint["inst"], "features": [float(v) for v in datapoint["features"]]}) + "\n")
+        f.close()
+
+        start = time()
+        out = subprocess.run([self.PYTHON, WORKER, "--autofolio", self.AUTOFOLIO_DIR, "--load", self.model, "--batch", input_file[1], "--output", output_file[1]], 
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        prediction_time = (time() - start) / len(dataset)
+        os.remove(input_file[1])
+        if out.returncode != 0:
+            os.remove(output_file[1])
+            raise Exception(f"AutoFolio failed on the batch of {len(dataset)} datapoints: {out.stdout.decode('utf-8')}")
+        f = open(output_file[1])
+        results = [json.loads(line) for line in f if line.strip() != ""]
+        f.close()
+        os.remove(output_file[1])
+        if len(results) != len(dataset):
+            raise Exception(f"AutoFolio predicted {len(results)} datapoints out of {len(dataset)}")
+
         predictions = []
-        for datapoint in tqdm(dataset):
-            try:
-                prediction = self.__get_prediction(datapoint["features"], datapoint["inst"])
-                predictions.append({"chosen_option": prediction[0], "inst": prediction[1], "time": prediction[2]})
-            except Exception as e:
-                print(f"An error occurred for text '{datapoint['inst']}': {e}", file=stderr)
+        for result in results:
+            prediction = {"chosen_option": result.get("chosen_option"), "inst": result["inst"], "time": prediction_time}
+            if "error" in result:
+                print(f"An error occurred for instance '{result['inst']}': {result['error']}", file=stderr)
+                prediction["error"] = result["error"]
+            predictions.append(prediction)
         return predictions
-    
@@ -0,0 +1,133 @@
+"""
+A long-lived AutoFolio process: it loads a model trained with AutoFolio once and then answers, on stdout, one JSON line for each
+JSON line of features read from stdin. It runs with the interpreter of AutoFolio (python 3.6), so it only uses the standard library
+and AutoFolio itself.
+
+    request:  {"features": [0.1, 0.2, ...]}
+    response: {"chosen_option": "combination", "time": 0.001} or {"error": "message"}
+
+With --batch, it instead predicts all the datapoints of a file of JSON lines ({"inst": "instance", "features": [...]}) with one
+call of the selector and writes, in the same order, a JSON line for each of them: {"inst": "instance", "chosen_option": "combination"}
+or {"inst": "instance", "error": "message"}
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import pickle
+import sys
+from time import time
+
+class Autofolio_model:
+    def __init__(self, autofolio:'str', model:'str') -> None:
+        """
+        initialize an instance of the class Autofolio_model.
+        It loads the scenario, the feature pre-processing, the pre-solver and the selector pickled by AutoFolio only once,
+        as AutoFolio.read_model_and_predict does for each call of the autofolio script
+        ---------
+        Parameters
+            autofolio:str.
+                The directory of AutoFolio (the one with the scripts folder)
+            model:str.
+                The model saved by AutoFolio with --save
+        """
+        sys.path.insert(0, os.path.abspath(autofolio))
+        from autofolio.autofolio import AutoFolio
+        self.autofolio = AutoFolio()
+        f = open(model, "br")
+        self.scenario, self.feature_pre_pipeline, self.pre_solver, self.selector, self.config = pickle.load(f)
+        f.close()
+        for pre_processing in self.feature_pre_pipeline:
+            pre_processing.logger = logging.getLogger("Feature Preprocessing")
+        if self.pre_solver:
+            self.pre_solver.logger = logging.getLogger("Aspeed PreSolving")
+        self.selector.logger = logging.getLogger("Selector")
+        # the pre-processing replaces the features of the scenario with the active ones, so the original ones are kept aside
+        self.features = list(self.scenario.features)
+
+    def predict(self, features:'list[list[float]]', instances:'list[str]') -> 'dict[str,str]':
+        """
+        Returns, for each instance, the algorithm chosen by the selector: the last one of the schedule, after the pre-solvers
+        """
+        import pandas as pd
+        if any(len(row) != len(self.features) for row in features):
+            raise Exception("the model has {} features".format(len(self.features)))
+        scenario = copy.copy(self.scenario)
+        scenario.feature_data = pd.DataFrame(features, index=instances, columns=self.features)
+        scenario.instances = instances
+        schedules = self.autofolio.predict(scenario=scenario, config=self.config, feature_pre_pipeline=self.feature_pre_pipeline,
+                                           pre_solver=self.pre_solver, selector=self.selector)
+        return {instance: str(schedules[instance][-1][0]) for instance in instances}
+
+def serve(model:'Autofolio_model', requests, responses) -> None:
+    for line in requests:
+        if line.strip() == "":
+            continue
+        start = time()
+        try:
+            request = json.loads(line)
+            response = {"chosen_option": model.predict([request["features"]], ["instance"])["instance"]}
+        except Exception as e:
+            response = {"error": "{}: {}".format(type(e).__name__, e)}
+        response["time"] = time() - start
+        responses.write(json.dumps(response) + "\n")
+        responses.flush()
+
+def predict_file(model:'Autofolio_model', input_file:'str', output_file:'str') -> 'int':
+    """
+    Predicts the datapoints of input_file all together and writes the result of each one in output_file. If the selector fails on
+    the whole batch, the datapoints are predicted one at a time so that only the ones that fail get an error. Returns the number of errors
+    """
+    f = open(input_file)
+    datapoints = [json.loads(line) for line in f if line.strip() != ""]
+    f.close()
+    results = [{"inst": datapoint["inst"]} for datapoint in datapoints]
+    valid = []
+    for i, datapoint in enumerate(datapoints):
+        if len(datapoint["features"]) != len(model.features):
+            results[i]["error"] = "the datapoint has {} features, the model {}".format(len(datapoint["features"]), len(model.features))
+        else:
+            valid.append(i)
+    # the datapoints are named by their position, as the instance names may repeat
+    try:
+        chosen_options = model.predict([datapoints[i]["features"] for i in valid], [str(i) for i in valid])
+    except Exception:
+        chosen_options = {}
+        for i in valid:
+            try:
+                chosen_options.update(model.predict([datapoints[i]["features"]], [str(i)]))
+            except Exception as e:
+                results[i]["error"] = "{}: {}".format(type(e).__name__, e)
+    for i in valid:
+        if str(i) in chosen_options:
+            results[i]["chosen_option"] = chosen_options[str(i)]
+    f = open(output_file, "w")
+    for result in results:
+        f.write(json.dumps(result) + "\n")
+    f.close()
+    return sum(1 for result in results if "error" in result)
+
+parser = argparse.ArgumentParser(description="Answers the AutoFolio predictions of the JSON lines read from stdin, or of a batch file")
+parser.add_argument("--autofolio", type=str, help="The directory of AutoFolio. Default = AutoFolio", default="AutoFolio")
+parser.add_argument("--load", type=str, help="The model saved by AutoFolio", required=True)
+parser.add_argument("--batch", type=str, help="A file of JSON lines with the datapoints to predict at once instead of reading stdin", required=False)
+parser.add_argument("--output", type=str, help="The file where the predictions of --batch are written", required=False)
+
+def main():
+    args = parser.parse_args()
+    # only the responses go to stdout: anything AutoFolio prints ends up in stderr
+    responses = sys.stdout
+    sys.stdout = sys.stderr
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    model = Autofolio_model(args.autofolio, args.load)
+    if args.batch is None:
+        serve(model, sys.stdin, responses)
+        return
+    if args.output is None:
+        raise Exception("--batch needs an --output file")
+    errors = predict_file(model, args.batch, args.output)
+    responses.write(json.dumps({"errors": errors}) + "\n")
+
+if __name__ == "__main__":
+    main()
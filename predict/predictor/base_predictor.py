@@ -1,13 +1,73 @@
+import numpy as np
+from time import time
+
 class Predictor_initializer:
     pass
 
 class Predictor:
-    def predict(self, dataset:'list[dict]|list[float]', filter:'bool'=False) -> 'list[dict]|dict':
+    def predict_batch(self, features:'np.ndarray', filter:'bool'=False) -> 'np.ndarray':
+        """
+        Given a matrix with the features of a datapoint in each row, returns the index (in idx2comb) of the chosen option of each datapoint
+        """
         raise Exception("Not implemented method")
 
+    def predict(self, dataset:'list[dict]|list[float]', filter:'bool'=False) -> 'list[dict]|dict':
+        """
+        Given a dataset, return a list containing each prediction for each datapoint and the sum of the total predicted time.
+        It is a wrapper of predict_batch: the time of each prediction is the time of the whole batch divided by the number of datapoints.
+        -------
+        Parameters
+            dataset:list[dict]
+                A list containing, for each datapoint to predict, a list of features to use for the prediction, a dictionary containing, for each option, the corresponding time
+        ------
+        Output
+            A tuple containing:
+                - a list of dicts with, for each datapoint, the chosen option and the corresponding predicted time
+                - a float corresponding to the total time of the predicted options
+        """
+        is_single = type(dataset[0]) == float
+        dataset = self.__get_dataset(dataset)
+        start = time()
+        chosen_options = self.predict_batch(np.array([datapoint["features"] for datapoint in dataset], dtype=np.float32), filter)
+        prediction_time = (time() - start) / len(dataset)
+        predictions = [{"chosen_option": self.idx2comb[int(chosen_option)], "inst": datapoint["inst"], "time": prediction_time}
+                       for chosen_option, datapoint in zip(chosen_options, dataset)]
+        if is_single:
+            return predictions[0]
+        return predictions
+
     def __get_dataset(self, dataset:'list') -> 'list[dict]':
         if type(dataset[0]) == float:
             return [{"inst":"", "features":dataset}]
         return dataset
 
+    @staticmethod
+    def options_mask(features:'np.ndarray', filter:'bool', options:'int') -> 'np.ndarray':
+        """
+        Returns a boolean matrix with, for each datapoint, the options that can be chosen. With filter, the features are the predicted
+        probabilities of each option not being competitive and the options under .5 are kept, or all of them if none is under .5
+        """
+        if not filter:
+            return np.ones((len(features), options), dtype=bool)
+        if features.shape[1] != options:
+            raise Exception(f"number of features is different from number of combinations: {features.shape[1]} != {options}")
+        mask = features < .5
+        mask[~mask.any(axis=1)] = True
+        return mask
+
+    @staticmethod
+    def order_ranks(order:'list[str]', comb2idx:'dict[str,int]') -> 'np.ndarray':
+        """
+        Compiles an ordering of the combinations into the rank of each option (indexed as in idx2comb): 0 for the first one of the ordering
+        """
+        ranks = np.full(len(comb2idx), len(order), dtype=np.int64)
+        ranks[[comb2idx[comb] for comb in order]] = np.arange(len(order))
+        return ranks
 
+    @staticmethod
+    def choose(ranks:'np.ndarray', mask:'np.ndarray') -> 'np.ndarray':
+        """
+        Returns, for each datapoint, the option of the mask with the lowest rank, that is the first option of the ordering that can be chosen.
+        ranks has either a row for each datapoint or a single row used for all of them
+        """
+        return np.argmin(np.where(mask, ranks, np.iinfo(np.int64).max), axis=1)
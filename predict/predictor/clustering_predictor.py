@@ -1,17 +1,372 @@
 from .base_predictor import Predictor, Predictor_initializer
+from .feature_store import Feature_store
 import pandas as pd
 import numpy as np
+import concurrent.futures
+import hashlib
+import json
+import os
 from sklearn.model_selection import ParameterGrid
-from sklearn.cluster import KMeans, AgglomerativeClustering
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import IncrementalPCA
+from sklearn.pipeline import Pipeline
+from threadpoolctl import threadpool_limits
 import joblib
-from time import time
+
+def array_key(array:'np.ndarray') -> 'str':
+    return hashlib.sha256(np.ascontiguousarray(array).tobytes()).hexdigest()[:16]
+
+class Clustering_cache:
+    def __init__(self, directory:'str', features_key:'str') -> None:
+        """
+        initialize an instance of the class Clustering_cache.
+        It stores on disk the clusterings fitted on a feature set, by parameters and by fit key (the hash of the rows of the training datapoints 
+        in the features and, for a warm started clustering, of its initial centroids), so that a fold or a search run again reuses them.
+        A clustering is reused only for the same datapoints and the same initialization, so the cache never changes the result of a fit.
+        ---------
+        Parameters
+            directory:str.
+                The directory of the cache
+            features_key:str.
+                The key of the feature set (see Feature_store.key)
+        """
+        self.directory = os.path.join(directory, features_key)
+
+    @staticmethod
+    def params_key(params:'dict') -> 'str':
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+    def __file(self, fit_key:'str', params:'dict') -> 'str':
+        return os.path.join(self.directory, self.params_key(params), f"{fit_key}.pkl")
+
+    def get(self, fit_key:'str', params:'dict') -> 'KMeans|None':
+        file = self.__file(fit_key, params)
+        return joblib.load(file) if os.path.exists(file) else None
+
+    def put(self, fit_key:'str', params:'dict', kmeans:'KMeans') -> None:
+        file = self.__file(fit_key, params)
+        if not os.path.isdir(os.path.dirname(file)):
+            os.makedirs(os.path.dirname(file), exist_ok=True)
+        # the workers of a search write at the same time: the file appears only when it is complete
+        joblib.dump(kmeans, f"{file}.{os.getpid()}.tmp")
+        os.replace(f"{file}.{os.getpid()}.tmp", file)
+
+def load_hyperparameters(paths:'list[str]') -> 'list[dict]':
+    """
+    Reads the hyperparameters stored in json files (e.g. data/kmeans_hyperparameters). A directory stands for all its json files
+    """
+    files = []
+    for path in paths:
+        files += sorted([os.path.join(path, f) for f in os.listdir(path) if f.endswith(".json")]) if os.path.isdir(path) else [path]
+    hyperparameters = []
+    for file in files:
+        f = open(file)
+        hyperparameters.append(json.load(f))
+        f.close()
+    return hyperparameters
+
+def load_clusterings(paths:'list[str]') -> 'list[KMeans|Pipeline]':
+    """
+    Reads the clusterings of trained kmeans predictors (e.g. the ones of other folds). A directory stands for the clustering of the predictor saved in it
+    """
+    return [joblib.load(os.path.join(path, Kmeans_predictor.MODEL_NAME) if os.path.isdir(path) else path) for path in paths]
+
+def warm_start_centers(clusterings:'list[KMeans|Pipeline]', n_features:'int', reduction:'IncrementalPCA|None' = None) -> 'dict[int,np.ndarray]':
+    """
+    Returns, for each number of clusters, the centroids of the first of the clusterings with that number of clusters, in the space of the n_features
+    features reduced by reduction. The centroids of a clustering of reduced features (a Pipeline) are first brought back to the space of the features
+    """
+    centers = {}
+    for clustering in clusterings:
+        if isinstance(clustering, Pipeline):
+            clustering_centers = clustering[0].inverse_transform(clustering[-1].cluster_centers_)
+            clustering = clustering[-1]
+        else:
+            clustering_centers = clustering.cluster_centers_
+        if clustering_centers.shape[1] != n_features:
+            raise Exception(f"a warm start has {clustering_centers.shape[1]} features, the features {n_features}")
+        if reduction is not None:
+            clustering_centers = reduction.transform(clustering_centers)
+        if not clustering.n_clusters in centers:
+            centers[clustering.n_clusters] = np.asarray(clustering_centers, dtype=np.float64)
+    return centers
+
+class Row_subset:
+    def __init__(self, matrix:'np.ndarray', indexes:'np.ndarray') -> None:
+        """
+        initialize an instance of the class Row_subset.
+        Some rows of a (memory mapped) matrix, read only when a slice of them is taken, so that they can be processed a chunk at a time
+        without copying all of them in memory.
+        ---------
+        Parameters
+            matrix:np.ndarray.
+                The matrix, e.g. the one of a Feature_store opened from a binary bundle
+            indexes:np.ndarray.
+                The indexes of the rows
+        """
+        self.matrix = matrix
+        self.indexes = indexes
+
+    def __len__(self) -> int:
+        return len(self.indexes)
+
+    def __getitem__(self, key:'slice|np.ndarray') -> 'np.ndarray|Row_subset':
+        """
+        A slice reads the rows, an array of indexes returns the subset of these rows
+        """
+        if isinstance(key, slice):
+            return self.matrix[self.indexes[key]]
+        return Row_subset(self.matrix, self.indexes[key])
+
+    def __array__(self, dtype=None, copy=None) -> 'np.ndarray':
+        rows = self.matrix[self.indexes]
+        return rows if dtype is None else rows.astype(dtype)
+
+def chunk_bounds(rows:'int', chunk_size:'int', min_size:'int' = 1) -> 'list[tuple[int,int]]':
+    """
+    Splits the rows in chunks of chunk_size rows, the last one merged with the previous one if it has less than min_size rows
+    """
+    bounds = [(start, min(start + chunk_size, rows)) for start in range(0, rows, chunk_size)]
+    if len(bounds) > 1 and bounds[-1][1] - bounds[-1][0] < min_size:
+        bounds = bounds[:-2] + [(bounds[-2][0], rows)]
+    return bounds
+
+def predict_chunks(model:'KMeans|Pipeline', features:'np.ndarray|Row_subset', chunk_size:'int' = 4096) -> 'np.ndarray':
+    if len(features) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if not isinstance(model, Pipeline):
+        return np.concatenate([model.predict(np.asarray(features[start:end], dtype=model.cluster_centers_.dtype)) for start, end in chunk_bounds(len(features), chunk_size)])
+    return np.concatenate([model.predict(features[start:end]) for start, end in chunk_bounds(len(features), chunk_size)])
+
+def fit_reduction(features:'np.ndarray|Row_subset', components:'int', chunk_size:'int' = 4096) -> 'IncrementalPCA':
+    """
+    Fits a PCA with the given number of components one chunk of rows at a time
+    """
+    reduction = IncrementalPCA(n_components=components)
+    for start, end in chunk_bounds(len(features), max(chunk_size, components), components):
+        reduction.partial_fit(features[start:end])
+    return reduction
+
+def reduce_chunks(reduction:'IncrementalPCA', features:'np.ndarray|Row_subset', chunk_size:'int' = 4096) -> 'np.ndarray':
+    return np.concatenate([reduction.transform(features[start:end]) for start, end in chunk_bounds(len(features), chunk_size)])
+
+def fit_kmeans(params:'dict', features:'np.ndarray|Row_subset', chunk_size:'int', init:'np.ndarray|None' = None, max_iter:'int|None' = None) -> 'KMeans':
+    """
+    Fits a KMeans on all the rows at once
+    """
+    if init is None:
+        return KMeans(**params).fit(np.asarray(features))
+    return KMeans(**{**params, "init": init, "n_init": 1, "max_iter": max_iter}).fit(np.asarray(features))
+
+def fit_minibatch_kmeans(params:'dict', features:'np.ndarray|Row_subset', chunk_size:'int', init:'np.ndarray|None' = None, max_iter:'int|None' = None) -> 'MiniBatchKMeans':
+    """
+    Fits a MiniBatchKMeans one chunk of rows at a time, so that a memory mapped matrix is read a chunk at a time. Each pass goes through 
+    the chunks in a random order, up to max_iter passes or until the centroids move less than tol (relative to their norm) in a pass.
+    partial_fit initializes the centroids only once, so the n_init initializations are fitted one after the other, each one with its own
+    random_state, and the one with the lowest inertia is kept
+    """
+    if init is not None:
+        params = {**params, "init": init, "n_init": 1, "max_iter": max_iter}
+    n_init = params["n_init"]
+    if n_init == "auto":
+        # as MiniBatchKMeans does
+        n_init = 1 if isinstance(params["init"], np.ndarray) or params["init"] == "k-means++" else 3
+    bounds = chunk_bounds(len(features), chunk_size, params["n_clusters"])
+    seeds = [params.get("random_state")] if n_init == 1 else np.random.default_rng(params.get("random_state")).integers(0, 2**31 - 1, n_init).tolist()
+    best, best_inertia = None, None
+    for seed in seeds:
+        kmeans = MiniBatchKMeans(**{**params, "n_init": 1, "random_state": seed}, batch_size=chunk_size)
+        rng = np.random.default_rng(seed)
+        kmeans.n_iter_ = 0
+        for _ in range(params["max_iter"]):
+            centers = kmeans.cluster_centers_.copy() if hasattr(kmeans, "cluster_centers_") else None
+            for chunk in rng.permutation(len(bounds)):
+                kmeans.partial_fit(features[bounds[chunk][0]:bounds[chunk][1]])
+            kmeans.n_iter_ += 1
+            if centers is not None and np.sum((kmeans.cluster_centers_ - centers) ** 2) <= params["tol"] * np.sum(centers ** 2):
+                break
+        if n_init == 1:
+            return kmeans
+        inertia = -sum(kmeans.score(features[start:end]) for start, end in bounds)
+        if best is None or inertia < best_inertia:
+            best, best_inertia = kmeans, inertia
+    return best
+
+# the ways of fitting the clustering: each one takes the parameters of a KMeans, the features, the size of the chunks of rows 
+# and, for the warm starts, the initial centroids and the maximum number of iterations
+CLUSTERING_BACKENDS = {
+    "kmeans": fit_kmeans,
+    "minibatch": fit_minibatch_kmeans
+}
+
+def fit_clustering(params:'dict', features:'np.ndarray|Row_subset', train_key:'str|None' = None, cache:'Clustering_cache|None' = None, 
+                   previous:'KMeans|None' = None, init:'np.ndarray|None' = None, backend:'str' = "kmeans", chunk_size:'int' = 4096) -> 'KMeans':
+    """
+    Fits a clustering with the parameters and the backend (see CLUSTERING_BACKENDS), or takes it from the cache. It is warm started from the 
+    centroids of previous, a clustering of the same datapoints with looser tol or fewer max_iter, or else from init, e.g. the centroids of the 
+    same parameters on a subset of the datapoints. A warm started clustering keeps the init, n_init and max_iter it was actually fitted with
+    """
+    if not backend in CLUSTERING_BACKENDS:
+        raise Exception(f"clustering backend {backend} unrecognised")
+    max_iter = params["max_iter"]
+    if previous is not None:
+        init = previous.cluster_centers_
+        max_iter = max(1, params["max_iter"] - previous.n_iter_)
+    fit_key = None
+    if cache is not None:
+        fit_key = train_key if init is None else f"{train_key}-{array_key(init)}-{max_iter}"
+        kmeans = cache.get(fit_key, params)
+        if kmeans is not None:
+            return kmeans
+    if init is None:
+        kmeans = CLUSTERING_BACKENDS[backend](params, features, chunk_size)
+    else:
+        kmeans = CLUSTERING_BACKENDS[backend](params, features, chunk_size, init, max_iter)
+    if cache is not None:
+        cache.put(fit_key, params, kmeans)
+    return kmeans
+
+# the data of the hyperparameter search, set once in each worker process instead of being sent with every candidate
+_search_data = None
+
+def _init_search_worker(data:'dict', threads:'int|None') -> None:
+    global _search_data
+    _search_data = data
+    if threads is not None:
+        threadpool_limits(threads)
+
+def cluster_ranks(labels:'np.ndarray', times:'np.ndarray', n_clusters:'int') -> 'np.ndarray':
+    """
+    Returns, for each cluster, the rank of each option ordering the options by their total time on the datapoints of the cluster (ties in index order)
+    """
+    stats = np.zeros((n_clusters, times.shape[1]))
+    np.add.at(stats, labels, times)
+    ranks = np.empty(stats.shape, dtype=np.int64)
+    np.put_along_axis(ranks, np.argsort(stats, axis=1, kind="stable"), np.arange(times.shape[1]), axis=1)
+    return ranks
+
+def warm_start_key(params:'dict') -> 'tuple':
+    """
+    The candidates that differ only by tol and max_iter have the same key: they are fitted one after the other, each one warm started from a looser one
+    """
+    return tuple(sorted([(k, str(v)) for k, v in params.items() if k not in ["tol", "max_iter"]]))
+
+def _evaluate_candidates(candidates:'tuple[list[dict],int,list[np.ndarray|None]]') -> 'list[tuple[float,KMeans]]':
+    """
+    Fits the clustering of each parameters (with the same warm_start_key) on the first samples training datapoints (in the order of the search) 
+    and returns the total time of the options chosen for the validation datapoints, together with the clustering. The loosest parameters are
+    warm started from their initial centroids (the ones of the previous rung of the search, if any), the others from a looser clustering
+    """
+    parameters, samples, inits = candidates
+    # the datapoints are kept in their order, so that the clustering of the last rung is fitted on the training features as they are
+    sample = np.sort(_search_data["order"][:samples])
+    features = _search_data["training_features"][sample]
+    train_key = array_key(_search_data["training_indexes"][sample]) if _search_data["cache"] is not None else None
+    fitted = []
+    results = {}
+    for i in sorted(range(len(parameters)), key=lambda i: (parameters[i]["max_iter"], -parameters[i]["tol"])):
+        params = parameters[i]
+        looser = [kmeans for p, kmeans in fitted if p["tol"] >= params["tol"] and p["max_iter"] <= params["max_iter"]]
+        kmeans = fit_clustering(params, features, train_key, _search_data["cache"], looser[-1] if len(looser) > 0 else None, inits[i],
+                                _search_data["backend"], _search_data["chunk_size"])
+        fitted.append((params, kmeans))
+        ranks = cluster_ranks(predict_chunks(kmeans, features, _search_data["chunk_size"]), _search_data["training_times"][sample], params["n_clusters"])
+        chosen_options = Predictor.choose(ranks[predict_chunks(kmeans, _search_data["validation_features"], _search_data["chunk_size"])], _search_data["validation_mask"])
+        results[i] = (float(np.sum(_search_data["validation_times"][np.arange(len(chosen_options)), chosen_options])), kmeans)
+    return [results[i] for i in range(len(parameters))]
+
+def search_clustering_parameters(parameters:'list[dict]', 
+                                 training_features:'np.ndarray|Row_subset', 
+                                 training_times:'np.ndarray',
+                                 validation_features:'np.ndarray', 
+                                 validation_times:'np.ndarray', 
+                                 validation_mask:'np.ndarray',
+                                 workers:'int|None' = None,
+                                 halving:'bool' = True,
+                                 eta:'int' = 3,
+                                 random_state:'int' = 42,
+                                 seeds:'list[dict]|None' = None,
+                                 cache:'Clustering_cache|None' = None,
+                                 training_indexes:'np.ndarray|None' = None,
+                                 backend:'str' = "kmeans",
+                                 chunk_size:'int' = 4096,
+                                 initial_centers:'dict[int,np.ndarray]|None' = None) -> 'tuple[dict,list[dict],KMeans]':
+    """
+    Returns the parameters whose clustering gives the lowest total validation time, together with the evaluations of all the candidates
+    and that clustering, the one fitted on the whole training set by the last rung, whose validation time is the one that chose it.
+    The candidates are evaluated in a pool of workers processes. With halving, the search is a successive halving: all the candidates are
+    fitted on a small random subset of the training datapoints, the best 1/eta of them on eta times more datapoints and so on, until the last
+    ones are fitted on the whole training set. Ties are broken by the order of the candidates, so the result depends only on random_state.
+    The candidates that differ only by tol and max_iter are warm started from each other, and each candidate from its centroids of the previous rung. 
+    The seeds (e.g. the hyperparameters found on other folds) are added to the candidates and never discarded by the halving. In the first rung, 
+    the seeds with a number of clusters in initial_centers (e.g. the centroids of the clusterings of other folds, see warm_start_centers) start 
+    from these centroids instead of their init. With a cache, 
+    the clusterings are stored and reused (see Clustering_cache), without changing the result; training_indexes, the rows of the training datapoints 
+    in the features, identify the datapoints of each clustering.
+    The clusterings are fitted with the backend (see CLUSTERING_BACKENDS), that reads the features chunk_size rows at a time if it can.
+    """
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    parameters = list(parameters)
+    seeds = [] if seeds is None else seeds
+    for seed in seeds:
+        if not seed in parameters:
+            parameters.append(seed)
+    protected = [parameters.index(seed) for seed in seeds]
+    data = {
+        "training_features": training_features, "training_times": training_times, "validation_features": validation_features,
+        "validation_times": validation_times, "validation_mask": validation_mask, "cache": cache, "backend": backend, "chunk_size": chunk_size,
+        "training_indexes": training_indexes if training_indexes is not None else np.arange(len(training_features)),
+        "order": np.random.default_rng(random_state).permutation(len(training_features)) if halving else np.arange(len(training_features))
+    }
+    n_train = len(training_features)
+    samples = [n_train]
+    if halving:
+        # every fit must have enough datapoints for the largest number of clusters
+        min_samples = min(n_train, 10 * max([params["n_clusters"] for params in parameters]))
+        while samples[0] // eta >= min_samples and eta ** len(samples) < len(parameters):
+            samples.insert(0, samples[0] // eta)
+
+    if workers > 1:
+        # each worker uses a single thread, to avoid oversubscribing the cores
+        executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_search_worker, initargs=(data, 1))
+        evaluate = lambda groups: executor.map(_evaluate_candidates, groups)
+    else:
+        _init_search_worker(data, None)
+        evaluate = lambda groups: map(_evaluate_candidates, groups)
+    candidates = list(range(len(parameters)))
+    initial_centers = {} if initial_centers is None else initial_centers
+    centers = {c: initial_centers[parameters[c]["n_clusters"]] for c in protected if parameters[c]["n_clusters"] in initial_centers}
+    models = {}
+    evaluations = []
+    try:
+        for rung, rung_samples in enumerate(samples):
+            groups = {}
+            for c in candidates:
+                groups.setdefault(warm_start_key(parameters[c]), []).append(c)
+            groups = list(groups.values())
+            times = {}
+            for group, results in zip(groups, evaluate([([parameters[c] for c in group], rung_samples, [centers.get(c) for c in group]) for group in groups])):
+                for c, (candidate_time, kmeans) in zip(group, results):
+                    times[c] = candidate_time
+                    centers[c] = kmeans.cluster_centers_
+                    models[c] = kmeans
+            evaluations += [{"params": parameters[c], "samples": int(rung_samples), "time": times[c]} for c in candidates]
+            ranking = sorted([(times[c], c) for c in candidates])
+            if rung == len(samples) - 1:
+                best = ranking[0][1]
+            else:
+                candidates = sorted(set([c for _, c in ranking[:-(-len(candidates) // eta)]] + protected))
+    finally:
+        if workers > 1:
+            executor.shutdown()
+    return parameters[best], evaluations, models[best]
 
 class kmeans_initializer(Predictor_initializer):
     def __init__(self, pretrained_clustering_file_path:'str', order:'dict', idx2comb:'dict') -> None:
         super().__init__()
         self.kmeans = joblib.load(pretrained_clustering_file_path)
         self.order = order
-        self.idx2comb = idx2comb
+        self.idx2comb = {int(k):v for k,v in idx2comb.items()}
 
 class Kmeans_predictor(Predictor):
 
@@ -19,9 +374,17 @@ class Kmeans_predictor(Predictor):
 
     def __init__(self, training_data:'list[dict]|None', 
                  idx2comb:'dict[int,str]|None', 
-                 features:'pd.DataFrame|None', 
+                 features:'pd.DataFrame|Feature_store|None', 
                  hyperparameters:'dict|None' = None,
-                 filter:'bool|None' = True
+                 filter:'bool|None' = True,
+                 workers:'int|None' = None,
+                 halving:'bool' = True,
+                 seeds:'list[dict]|None' = None,
+                 cache_dir:'str|None' = None,
+                 backend:'str' = "kmeans",
+                 components:'int|None' = None,
+                 chunk_size:'int' = 4096,
+                 warm_starts:'list[KMeans|Pipeline]|None' = None
         ) -> 'None':
         """
         initialize an instance of the class Recall_predictor.
@@ -31,10 +394,32 @@ class Kmeans_predictor(Predictor):
                 Indicates the data to use to create the ordering used to break ties
             idx2comb:dict[int,str].
                 A dictionary that, for each index, returns the corresponding combination
-            features:pd.DataFrame.
-                a dataframe with a column indicating the instances and a feature set for each feature
+            features:pd.DataFrame|Feature_store.
+                a dataframe with a column indicating the instances and a feature set for each feature, or a Feature_store of them
             hyperparameters:dict|None. Default=None
                 hyperparameters of the clustering model to use. If None, a greedy search will be done to find the best hyperparameters
+            filter:bool|None. Default=True
+                Whether the search evaluates the hyperparameters pre-filtering the options with the features or not
+            workers:int|None. Default=None
+                The number of processes of the hyperparameter search. If None, the number of cores
+            halving:bool. Default=True
+                Whether the hyperparameter search is a successive halving (see search_clustering_parameters) or evaluates all the candidates on the whole training set
+            seeds:list[dict]|None. Default=None
+                Hyperparameters added to the search and never discarded by the halving, e.g. the ones found on other folds (see load_hyperparameters)
+            cache_dir:str|None. Default=None
+                If given, the clusterings fitted by the search and by the predictor are stored in this directory and reused by the next searches
+                on the same features (see Clustering_cache)
+            backend:str. Default="kmeans"
+                How the clustering is fitted (see CLUSTERING_BACKENDS): kmeans fits a KMeans on all the training features at once, 
+                minibatch a MiniBatchKMeans reading chunk_size rows at a time, so that large memory mapped features are never loaded whole
+            components:int|None. Default=None
+                If given, the features are reduced to this number of components with a PCA (fitted chunk_size rows at a time) before the clustering.
+                The clustering model is then a Pipeline of the PCA and of the clustering
+            chunk_size:int. Default=4096
+                The number of rows read at a time by the minibatch backend and by the PCA
+            warm_starts:list[KMeans|Pipeline]|None. Default=None
+                Clusterings of the same features fitted on other folds (see load_clusterings). The seeds of the search with the same number 
+                of clusters as one of them start from its centroids (see search_clustering_parameters)
         -----
         Usage
         ```py
@@ -53,26 +438,58 @@ class Kmeans_predictor(Predictor):
         train = training_data[:TRAIN_ELEMENTS]
         validation = training_data[TRAIN_ELEMENTS:]
 
-        training_features = np.array([features[features["inst"] == datapoint["inst"]].to_numpy()[0][1:].tolist() for datapoint in train])
+        features = Feature_store.get(features)
+        training_indexes = features.indexes([datapoint["inst"] for datapoint in train])
+        validation_indexes = features.indexes([datapoint["inst"] for datapoint in validation])
+        reduction = None
+        if components is not None:
+            reduction = fit_reduction(Row_subset(features.matrix, training_indexes), components, chunk_size)
+            training_features = reduce_chunks(reduction, Row_subset(features.matrix, training_indexes), chunk_size)
+            validation_features = reduce_chunks(reduction, Row_subset(features.matrix, validation_indexes), chunk_size)
+        elif backend == "minibatch":
+            training_features = Row_subset(features.matrix, training_indexes)
+            validation_features = Row_subset(features.matrix, validation_indexes)
+        else:
+            training_features = features.matrix[training_indexes]
+            validation_features = features.matrix[validation_indexes]
+        cache = None
+        if cache_dir is not None:
+            cache = Clustering_cache(cache_dir, "-".join([features.key(), backend] + ([str(components)] if components is not None else [])))
         if hyperparameters is None:
-            hyperparameters = self.__get_clustering_parameters(training_features, train, validation, features, idx2comb, filter)
+            validation_mask = self.options_mask(features.matrix[validation_indexes] if filter else np.zeros((len(validation), 0)), filter, len(idx2comb))
+            initial_centers = warm_start_centers(warm_starts, features.matrix.shape[1], reduction) if warm_starts is not None else None
+            hyperparameters, clustering = self.__get_clustering_parameters(training_features, validation_features, validation_mask, train, validation, 
+                                                                           workers, halving, seeds, cache, training_indexes, backend, chunk_size, initial_centers)
+        else:
+            clustering = fit_clustering(hyperparameters, training_features, array_key(training_indexes), cache, backend=backend, chunk_size=chunk_size)
         self.clustering_parameters = hyperparameters
-        self.clustering_model = KMeans(**hyperparameters)
-        y_pred = self.clustering_model.fit_predict(training_features)
+        y_pred = predict_chunks(clustering, training_features, chunk_size)
+        self.clustering_model = clustering if reduction is None else Pipeline([("reduction", reduction), ("clustering", clustering)])
         cluster_range = range(hyperparameters["n_clusters"])
         stats = {i: {comb:0 for comb in idx2comb.values()} for i in cluster_range}
         for i in range(len(train)):
             for option in train[i]["times"].keys():
                 stats[y_pred[i]][option] += train[i]["times"][option]
         self.order = {str(i): {k:v for k, v in sorted(stats[i].items(), key=lambda item: item[1], reverse=False)} for i in cluster_range}
+        self.ranks = self.__get_ranks(self.order)
 
     def __get_clustering_parameters(self, 
-                                    training_features:'np.ndarray', 
+                                    training_features:'np.ndarray|Row_subset', 
+                                    validation_features:'np.ndarray|Row_subset', 
+                                    validation_mask:'np.ndarray', 
                                     train_data:'list[dict]', 
                                     validation_data:'list[dict]', 
-                                    features:'pd.DataFrame',
-                                    idx2comb:'dict',
-                                    filter:'bool') -> 'dict':
+                                    workers:'int|None',
+                                    halving:'bool',
+                                    seeds:'list[dict]|None',
+                                    cache:'Clustering_cache|None',
+                                    training_indexes:'np.ndarray',
+                                    backend:'str',
+                                    chunk_size:'int',
+                                    initial_centers:'dict[int,np.ndarray]|None') -> 'tuple[dict,KMeans]':
+        """
+        Returns the best hyperparameters and the clustering that the search fitted with them on the whole training set
+        """
         parameters = list(ParameterGrid({
             'n_clusters': range(2, 21),
             'init': ['k-means++', 'random'],
@@ -82,90 +499,46 @@ class Kmeans_predictor(Predictor):
             'random_state': [42],
             'verbose': [0]
         }))
-        clusters_val = []
-        for params in parameters:
-            kmeans = KMeans(**params)
-            y_pred = kmeans.fit_predict(training_features)
-            stats = {i: {comb:0 for comb in idx2comb.values()} for i in range(params["n_clusters"])}
-            for i in range(len(train_data)):
-                for option in train_data[i]["times"].keys():
-                    stats[y_pred[i]][option] += train_data[i]["times"][option]
-            order = {str(i): {k:v for k, v in sorted(stats[i].items(), key=lambda item: item[1], reverse=False)} for i in range(params["n_clusters"])}
-            time = 0
-            for datapoint in validation_data:
-                datapoint_features = features[features["inst"] == datapoint["inst"]].to_numpy()[0][1:]
-                preds = kmeans.predict(datapoint_features.reshape(1, -1))
-                datapoint_candidates = list(idx2comb.values())
-                if filter:
-                    datapoint_features = np.round(datapoint_features.tolist())
-                    datapoint_candidates = [idx2comb[idx] for idx in idx2comb.keys() if datapoint_features[idx] == 1]
-                option = self.__get_prediction(datapoint_candidates, int(preds[0]), order)
-                time += datapoint["times"][option]
-            clusters_val.append((params, time))
-
-        best_cluster_val = min(clusters_val, key=lambda x: x[1])
-        return best_cluster_val[0]
+        combinations = [self.idx2comb[i] for i in range(len(self.idx2comb))]
+        training_times = np.array([[datapoint["times"][comb] for comb in combinations] for datapoint in train_data])
+        validation_times = np.array([[datapoint["times"][comb] for comb in combinations] for datapoint in validation_data])
+        best, self.search_evaluations, clustering = search_clustering_parameters(parameters, training_features, training_times, validation_features, 
+                                                                                 validation_times, validation_mask, workers, halving, random_state=42, 
+                                                                                 seeds=seeds, cache=cache, training_indexes=training_indexes, 
+                                                                                 backend=backend, chunk_size=chunk_size, initial_centers=initial_centers)
+        return best, clustering
 
     @staticmethod 
     def from_pretrained(pretrained:'kmeans_initializer') -> 'Kmeans_predictor':
         predictor = Kmeans_predictor(None, None, None, None)
         predictor.idx2comb = pretrained.idx2comb
+        predictor.comb2idx = {v:k for k,v in pretrained.idx2comb.items()}
         predictor.order = pretrained.order
+        predictor.ranks = predictor.__get_ranks(predictor.order)
         predictor.clustering_model = pretrained.kmeans
+        clustering = pretrained.kmeans[-1] if isinstance(pretrained.kmeans, Pipeline) else pretrained.kmeans
         predictor.clustering_parameters = {
-            'n_clusters': pretrained.kmeans.n_clusters,
-            'init': pretrained.kmeans.init,
-            'max_iter': pretrained.kmeans.max_iter,
-            'tol': pretrained.kmeans.tol,
-            'n_init': pretrained.kmeans.n_init,
-            'random_state': pretrained.kmeans.random_state,
+            'n_clusters': clustering.n_clusters,
+            'init': clustering.init,
+            'max_iter': clustering.max_iter,
+            'tol': clustering.tol,
+            'n_init': clustering.n_init,
+            'random_state': clustering.random_state,
             'verbose': [0]
         }
         return predictor
 
-    def __get_dataset(self, dataset:'list') -> 'list[dict]':
-        if type(dataset[0]) == float:
-            return [{"inst":"", "features":dataset}]
-        return dataset
-
-    def __get_prediction(self, options:'list', category:'int', order:'dict|None' = None):
-
-        order = order if not order is None else self.order
-        for candidate in order[str(category)]:
-            if candidate in options:
-                return candidate
+    def __get_ranks(self, order:'dict') -> 'np.ndarray':
+        """
+        Compiles the ordering of each cluster into a matrix with a row of option ranks for each cluster
+        """
+        return np.array([self.order_ranks(list(order[str(i)].keys()), self.comb2idx) for i in range(len(order))])
 
-    def predict(self, dataset:'list[dict]|list[float]', filter:'bool'=False) -> 'list[dict]|dict':
+    def predict_batch(self, features:'np.ndarray', filter:'bool'=False) -> 'np.ndarray':
         """
-        Given a dataset, return a list containing each prediction for each datapoint and the sum of the total predicted time.
-        -------
-        Parameters
-            dataset:list[dict]
-                A list containing, for each datapoint to predict, a list of features to use for the prediction, a dictionary containing, for each option, the corresponding time
-        ------
-        Output
-            A tuple containing:
-                - a list of dicts with, for each datapoint, the chosen option and the corresponding predicted time
-                - a float corresponding to the total time of the predicted options
+        Given a matrix with the features of a datapoint in each row, returns the index (in idx2comb) of the chosen option of each datapoint.
+        With filter, the features must be the predicted probabilities of each option not being competitive
         """
+        mask = self.options_mask(features, filter, len(self.idx2comb))
+        return self.choose(self.ranks[predict_chunks(self.clustering_model, features, len(features))], mask)
 
-        is_single = type(dataset[0]) == float
-        dataset = self.__get_dataset(dataset)
-        if filter and len(dataset[0]["features"]) != len(list(self.idx2comb.keys())):
-            raise Exception(f"number of features is different from number of combinations: {len(dataset[0]['features'])} != {len(list(self.idx2comb.keys()))}")
-
-        predictions = []
-        for datapoint in dataset:
-            start = time()
-            category = self.clustering_model.predict(np.array(datapoint["features"]).reshape(1,-1))
-            options = list(self.idx2comb.values())
-            if filter:
-                options = [o for o in self.comb2idx.keys() if datapoint["features"][self.comb2idx[o]] < .5]
-                if len(options) == 0:
-                    options = list(self.idx2comb.values())
-            chosen_option = self.__get_prediction(options, int(category[0]))
-            predictions.append({"chosen_option": chosen_option, "inst": datapoint["inst"], "time": time() - start})
-
-        if is_single:
-            return predictions[0]
-        return predictions
@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+
+class Feature_store:
+    def __init__(self, instances:'list[str]', matrix:'np.ndarray', columns:'list[str]|None' = None) -> None:
+        """
+        initialize an instance of the class Feature_store.
+        It keeps the features of all the instances in a single contiguous float32 matrix, with an index from the instance names to the rows,
+        so that an instance is found in constant time instead of scanning the instance column of a DataFrame.
+        ---------
+        Parameters
+            instances:list[str].
+                The name of the instance of each row of the matrix
+            matrix:np.ndarray.
+                A matrix with a row of features for each instance
+            columns:list[str]|None. Default=None
+                The names of the features. If None, feat0, feat1, ...
+        -----
+        Usage
+        ```py
+        store = Feature_store.from_dataframe(pd.read_csv("features.csv"))
+        features = store.row("instance name")
+        batch = store.rows(["instance name", "other instance name"])
+        ```
+        """
+        # a contiguous float32 matrix (e.g. a memory mapped bundle) is used as it is, without copying nor reading it
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if self.matrix.ndim != 2 or len(self.matrix) != len(instances):
+            raise Exception(f"the matrix must have a row for each of the {len(instances)} instances, found shape {self.matrix.shape}")
+        self.instances = list(instances)
+        self.index = {inst:i for i, inst in enumerate(self.instances)}
+        if len(self.index) != len(self.instances):
+            raise Exception("the instance names are not unique")
+        self.columns = list(columns) if columns is not None else [f"feat{i}" for i in range(self.matrix.shape[1])]
+        self.__key = None
+
+    @staticmethod
+    def from_dataframe(features:'pd.DataFrame', inst_column:'str' = "inst") -> 'Feature_store':
+        """
+        Builds the store from a dataframe with a column of instance names, keeping all the other columns, in order, as features
+        """
+        if not inst_column in features.columns:
+            raise Exception(f"The features do not include a {inst_column} column.")
+        columns = [c for c in features.columns if c != inst_column]
+        return Feature_store(features[inst_column].tolist(), features[columns].to_numpy(dtype=np.float32), columns)
+
+    @staticmethod
+    def from_csv(file:'str', inst_column:'str' = "inst") -> 'Feature_store':
+        return Feature_store.from_dataframe(pd.read_csv(file), inst_column)
+
+    @staticmethod
+    def index_file(file:'str') -> 'str':
+        """
+        The file with the instance names and the feature names of a binary bundle
+        """
+        return f"{os.path.splitext(file)[0]}.index.json"
+
+    @staticmethod
+    def from_bundle(file:'str') -> 'Feature_store':
+        """
+        Opens a binary bundle: a float32 .npy matrix, memory mapped so that nothing is read until it is used, 
+        and its index file with the instance names and the feature names
+        """
+        f = open(Feature_store.index_file(file))
+        index = json.load(f)
+        f.close()
+        return Feature_store(index["instances"], np.load(file, mmap_mode="r"), index["columns"])
+
+    @staticmethod
+    def load(file:'str') -> 'Feature_store':
+        """
+        Opens a features file: a csv, a binary bundle (.npy) or a parquet file (it needs pyarrow or fastparquet), all with the same layout
+        """
+        extension = os.path.splitext(file)[1]
+        if extension == ".npy":
+            return Feature_store.from_bundle(file)
+        elif extension == ".parquet":
+            return Feature_store.from_dataframe(pd.read_parquet(file))
+        return Feature_store.from_csv(file)
+
+    def save(self, file:'str') -> None:
+        """
+        Saves the store as a binary bundle (see from_bundle) or, if the file ends with .parquet, as a parquet file
+        """
+        if os.path.splitext(file)[1] == ".parquet":
+            df = pd.DataFrame(self.matrix, columns=self.columns)
+            df.insert(0, "inst", self.instances)
+            df.to_parquet(file, index=False)
+            return
+        np.save(file, self.matrix)
+        f = open(Feature_store.index_file(file), "w")
+        json.dump({"instances": self.instances, "columns": self.columns}, f)
+        f.close()
+
+    @staticmethod
+    def get(features:'pd.DataFrame|Feature_store') -> 'Feature_store':
+        """
+        Returns the features as a store, building it if they are a dataframe
+        """
+        if isinstance(features, Feature_store):
+            return features
+        return Feature_store.from_dataframe(features)
+
+    def __len__(self) -> int:
+        return len(self.instances)
+
+    def __contains__(self, inst:'str') -> bool:
+        return inst in self.index
+
+    def key(self) -> 'str':
+        """
+        A hash of the instance names and of the features, computed once
+        """
+        if self.__key is None:
+            digest = hashlib.sha256("\n".join(self.instances).encode())
+            digest.update(self.matrix.tobytes())
+            self.__key = digest.hexdigest()[:16]
+        return self.__key
+
+    def indexes(self, instances:'list[str]') -> 'np.ndarray':
+        try:
+            return np.fromiter((self.index[inst] for inst in instances), dtype=np.int64, count=len(instances))
+        except KeyError as e:
+            raise Exception(f"instance {e.args[0]} has no features")
+
+    def row(self, inst:'str') -> 'np.ndarray':
+        """
+        Returns the features of the instance as a read only view of the matrix (no copy)
+        """
+        if not inst in self.index:
+            raise Exception(f"instance {inst} has no features")
+        row = self.matrix[self.index[inst]]
+        row.flags.writeable = False
+        return row
+
+    def rows(self, instances:'list[str]') -> 'np.ndarray':
+        """
+        Returns a matrix with the features of the instances, in the given order
+        """
+        return self.matrix[self.indexes(instances)]
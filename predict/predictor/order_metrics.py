@@ -2,21 +2,21 @@ from typing import Callable
 import numpy as np
 import pandas as pd
 from .base_predictor import Predictor, Predictor_initializer
+from .feature_store import Feature_store
 from sklearn.metrics import recall_score, precision_score, accuracy_score, f1_score
-from time import time
 
 class Metrics_initializer(Predictor_initializer):
     def __init__(self, order:'list[str]', idx2comb:'dict') -> None:
         super().__init__()
         self.order = order
-        self.idx2comb = idx2comb
-        self.comb2idx = {v:k for k,v in idx2comb.items()}
+        self.idx2comb = {int(k):v for k,v in idx2comb.items()}
+        self.comb2idx = {v:k for k,v in self.idx2comb.items()}
 
 class Metrics_predictor(Predictor):
 
     def __init__(self, training_data:'list[dict]|None', 
                  idx2comb:'dict[int,str]|None',
-                 features:'pd.DataFrame|None', 
+                 features:'pd.DataFrame|Feature_store|None', 
                  metrics_type:'Literal["recall","precision","f1","accuracy"]|Callable' = "recall"
         ) -> 'None':
         """
@@ -27,8 +27,8 @@ class Metrics_predictor(Predictor):
                 Indicates the data to use to create the ordering used to break ties
             idx2comb:dict[int,str].
                 A dictionary that, for each index, returns the corresponding combination
-            features:pd.DataFrame.
-                a dataframe with a column indicating the instances and a feature set for each feature
+            features:pd.DataFrame|Feature_store.
+                a dataframe with a column indicating the instances and a feature set for each feature, or a Feature_store of them
             metrics_type:Literal["recall","precision","f1","accuracy"]|Callable. Default = "recall"
                 Indicates the metric to maximize in the ordering.
         -----
@@ -49,17 +49,13 @@ class Metrics_predictor(Predictor):
 
         metric_value = {}
         metric = self.__get_metric(metrics_type)
-        true_values = []
-        predicted_values = []
-        for datapoint in training_data:
-            true_values.append(datapoint["trues"])
-            predicted_values.append(np.round(features[features["inst"] == datapoint["inst"]].to_numpy()[0][1:].tolist()))
-        true_values = np.array(true_values)
-        predicted_values = np.array(predicted_values)
+        true_values = np.array([datapoint["trues"] for datapoint in training_data])
+        predicted_values = np.round(Feature_store.get(features).rows([datapoint["inst"] for datapoint in training_data]))
         for i in idx2comb.keys():
             metric_value[idx2comb[i]] = metric(true_values[:,i], predicted_values[:,i])
 
         self.order = [k for k, _ in sorted(metric_value.items(), key =lambda x: x[1],  reverse=True)]
+        self.ranks = self.order_ranks(self.order, self.comb2idx)
     
 
     @staticmethod
@@ -68,6 +64,7 @@ class Metrics_predictor(Predictor):
         predictor.order = pretrained.order
         predictor.idx2comb = pretrained.idx2comb
         predictor.comb2idx = pretrained.comb2idx
+        predictor.ranks = predictor.order_ranks(predictor.order, predictor.comb2idx)
         return predictor
 
     def __get_metric(self, metric) -> 'Callable':
@@ -84,49 +81,12 @@ class Metrics_predictor(Predictor):
         else:
             raise Exception(f"metric {metric} of type {type(metric)} can't be used as a valid metric")
 
-    def __get_prediction(self, options:'list'):
-            for candidate in self.order:
-                if candidate in options:
-                    return candidate
-
-    def __get_dataset(self, dataset:'list') -> 'list[dict]':
-        if type(dataset[0]) == float:
-            return [{"inst":"", "features":dataset}]
-        return dataset
-
-    def predict(self, dataset:'list[dict]|list[float]', filter:'bool'=False) -> 'list[dict]|dict':
+    def predict_batch(self, features:'np.ndarray', filter:'bool'=False) -> 'np.ndarray':
         """
-        Given a dataset, return a list containing each prediction for each datapoint and the sum of the total predicted time.
-        -------
-        Parameters
-            dataset:list[dict]
-                A list containing, for each datapoint to predict, a list of features to use for the prediction, a dictionary containing, for each option, the corresponding time
-        ------
-        Output
-            A tuple containing:
-                - a list of dicts with, for each datapoint, the chosen option and the corresponding predicted time
-                - a float corresponding to the total time of the predicted options
+        Given a matrix with the features of a datapoint in each row, returns the index (in idx2comb) of the chosen option of each datapoint.
+        The features must be the predicted probabilities of each option not being competitive
         """
-
-        is_single = type(dataset[0]) == float
-        dataset = self.__get_dataset(dataset)
-
-        if len(dataset[0]["features"]) != len(list(self.idx2comb.keys())):
-            raise Exception(f"number of features is different from number of combinations: {len(dataset[0]['features'])} != {len(list(self.idx2comb.keys()))}")
-
-        predictions = []
-        for datapoint in dataset:
-            start = time()
-            options = list(self.idx2comb.values())
-            if filter:
-                options = [o for o in self.comb2idx.keys() if datapoint["features"][self.comb2idx[o]] < .5]
-                if len(options) == 0:
-                    options = list(self.idx2comb.values())
-            chosen_option = self.__get_prediction(options)
-            predictions.append({"chosen_option": chosen_option, "inst": datapoint["inst"], "time": time() - start})
-
-        if is_single:
-            return predictions[0]
-
-        return predictions
+        if features.shape[1] != len(self.idx2comb):
+            raise Exception(f"number of features is different from number of combinations: {features.shape[1]} != {len(self.idx2comb)}")
+        return self.choose(self.ranks, self.options_mask(features, filter, len(self.idx2comb)))
 
@@ -1,13 +1,13 @@
 from .base_predictor import Predictor, Predictor_initializer
 from typing import Callable
-from time import time
+import numpy as np
 
 class Static_ordering_initializer(Predictor_initializer):
     def __init__(self, order:'list', idx2comb:'dict') -> None:
         super().__init__()
         self.order = order
-        self.idx2comb = idx2comb
-        self.comb2idx = {v:k for k,v in idx2comb.items()}
+        self.idx2comb = {int(k):v for k,v in idx2comb.items()}
+        self.comb2idx = {v:k for k,v in self.idx2comb.items()}
 
 class Static_ordering_predictor(Predictor):
 
@@ -52,6 +52,7 @@ class Static_ordering_predictor(Predictor):
             self.order = ordering_type(training_data)
         else:
             raise Exception(f"ordering_type {ordering_type} of type {type(ordering_type)} not supported")
+        self.ranks = self.order_ranks(self.order, self.comb2idx)
 
     @staticmethod 
     def from_pretrained(pretrained:'Static_ordering_initializer') -> 'Static_ordering_predictor':
@@ -59,6 +60,7 @@ class Static_ordering_predictor(Predictor):
         predictor.idx2comb = pretrained.idx2comb
         predictor.comb2idx = pretrained.comb2idx
         predictor.order = pretrained.order
+        predictor.ranks = predictor.order_ranks(predictor.order, predictor.comb2idx)
         return predictor
 
     def __get_single_best_ordering(self, training_data:'list[dict]', idx2comb:'dict') -> 'list[str]':
@@ -77,47 +79,12 @@ class Static_ordering_predictor(Predictor):
         
         return [combination for combination, _ in sorted(order.items(), key= lambda x: x[1], reverse=True)]
 
-    def __get_prediction(self, options:'list'):
-        for candidate in self.order:
-            if candidate in options:
-                return candidate
-
-    def __get_dataset(self, dataset:'list') -> 'list[dict]':
-        if type(dataset[0]) == float:
-            return [{"inst":"", "features":dataset}]
-        return dataset
-
-    def predict(self, dataset:'list[dict]|list[float]', filter:'bool'=False) -> 'list[dict]|dixt':
+    def predict_batch(self, features:'np.ndarray', filter:'bool'=False) -> 'np.ndarray':
         """
-        Given a dataset, return a list containing each prediction for each datapoint and the sum of the total predicted time.
-        -------
-        Parameters
-            dataset:list[dict]
-                A list containing, for each datapoint to predict, a list of features to use for the prediction, a dictionary containing, for each option, the corresponding time
-        ------
-        Output
-            A tuple containing:
-                - a list of dicts with, for each datapoint, the chosen option and the corresponding predicted time
-                - a float corresponding to the total time of the predicted options
+        Given a matrix with the features of a datapoint in each row, returns the index (in idx2comb) of the chosen option of each datapoint.
+        The features must be the predicted probabilities of each option not being competitive
         """
+        if features.shape[1] != len(self.idx2comb):
+            raise Exception(f"number of features is different from number of combinations: {features.shape[1]} != {len(self.idx2comb)}")
+        return self.choose(self.ranks, self.options_mask(features, filter, len(self.idx2comb)))
 
-        is_single = type(dataset[0]) == float
-        dataset = self.__get_dataset(dataset)
-
-        if len(dataset[0]["features"]) != len(list(self.idx2comb.keys())):
-            raise Exception(f"number of features is different from number of combinations: {len(dataset[0]['features'])} != {len(list(self.idx2comb.keys()))}")
-
-        predictions = []
-        for datapoint in dataset:
-            start = time()
-            options = list(self.idx2comb.values())
-            if filter:
-                options = [o for o in self.comb2idx.keys() if datapoint["features"][self.comb2idx[o]] < .5]
-                if len(options) == 0:
-                    options = list(self.idx2comb.values())
-            chosen_option = self.__get_prediction(options)
-            predictions.append({"chosen_option": chosen_option, "inst": datapoint["inst"], "time": time() - start})
-
-        if is_single:
-            return predictions[0]
-        return predictions
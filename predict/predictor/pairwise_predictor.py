@@ -0,0 +1,132 @@
+from .base_predictor import Predictor, Predictor_initializer
+from .feature_store import Feature_store
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+import joblib
+import numpy as np
+import pandas as pd
+
+class Pairwise_initializer(Predictor_initializer):
+    def __init__(self, pretrained_model_file_path:'str', idx2comb:'dict') -> None:
+        super().__init__()
+        model = joblib.load(pretrained_model_file_path)
+        self.selector_type = model["selector_type"]
+        self.models = model["models"]
+        self.idx2comb = {int(k):v for k,v in idx2comb.items()}
+
+class Pairwise_predictor(Predictor):
+
+    MODEL_NAME = "pairwise.pkl"
+
+    def __init__(self, training_data:'list[dict]|None',
+                 idx2comb:'dict[int,str]|None',
+                 features:'pd.DataFrame|Feature_store|None',
+                 selector_type:'Literal["pairwise","regression"]' = "pairwise",
+                 n_estimators:'int' = 100,
+                 max_threads:'int|None' = None,
+                 random_state:'int' = 12345
+        ) -> 'None':
+        """
+        initialize an instance of the class Pairwise_predictor.
+        An algorithm selector trained in-process with the random forests of scikit-learn, as the selectors of AutoFolio.
+        ---------
+        Parameters
+            training_data:list[dict].
+                Indicates the data to use to train the selector
+            idx2comb:dict[int,str].
+                A dictionary that, for each index, returns the corresponding combination
+            features:pd.DataFrame|Feature_store.
+                a dataframe with a column indicating the instances and a feature set for each feature, or a Feature_store of them
+            selector_type:Literal["pairwise","regression"]. Default="pairwise"
+                The selector to train:
+                    - pairwise: a classifier for each pair of options that predicts the faster one, with each datapoint weighted by
+                      the difference of the two times. The chosen option is the one that wins the most comparisons
+                    - regression: a regressor for each option that predicts its log10 time. The chosen option is the fastest predicted one
+            n_estimators:int. Default=100
+                The number of trees of each forest
+            max_threads:int|None. Default=None
+                The number of threads of each forest (n_jobs) during the training. If None, one. The predictions use one thread per forest:
+                with many small forests, a pool of threads for each of them costs more than it saves
+            random_state:int. Default=12345
+                The seed of the forests
+        -----
+        Usage
+        ```py
+        train_data = [{"inst": "instance name", "times":{"option1":1, "option2":2}}]
+        fatures = pd.DataFrame([{"inst": "instance name", "feat1":0, "feat2":0, "feat3":1, "feat4":1}])
+        idx2comb = {0: "option1", 1:"option2"}
+        predictor = Pairwise_predictor(train_data, idx2comb, features)
+        ```
+        """
+        super().__init__()
+        if training_data is None or idx2comb is None or features is None:
+            return
+        self.idx2comb = idx2comb
+        self.comb2idx = {v:k for k,v in idx2comb.items()}
+        self.selector_type = selector_type
+
+        features = Feature_store.get(features)
+        x_train = features.rows([datapoint["inst"] for datapoint in training_data])
+        times = np.array([[datapoint["times"][idx2comb[i]] for i in range(len(idx2comb))] for datapoint in training_data], dtype=np.float64)
+        if selector_type == "pairwise":
+            self.models = []
+            for i, j in self.__pairs():
+                weights = np.abs(times[:, i] - times[:, j])
+                # two options with the same time on every datapoint (e.g. both always timing out) are a tie: they have no classifier
+                if not np.any(weights > 0):
+                    self.models.append(None)
+                    continue
+                forest = RandomForestClassifier(n_estimators=n_estimators, n_jobs=max_threads, random_state=random_state)
+                self.models.append(forest.fit(x_train, times[:, i] < times[:, j], sample_weight=weights))
+        elif selector_type == "regression":
+            log_times = np.log10(np.maximum(times, 1e-6))
+            self.models = [RandomForestRegressor(n_estimators=n_estimators, n_jobs=max_threads, random_state=random_state).fit(x_train, log_times[:, i])
+                           for i in range(len(idx2comb))]
+        else:
+            raise Exception(f"selector_type {selector_type} not supported")
+        self.__single_thread()
+
+    @staticmethod
+    def from_pretrained(pretrained:'Pairwise_initializer') -> 'Pairwise_predictor':
+        predictor = Pairwise_predictor(None, None, None)
+        predictor.idx2comb = pretrained.idx2comb
+        predictor.comb2idx = {v:k for k,v in pretrained.idx2comb.items()}
+        predictor.selector_type = pretrained.selector_type
+        predictor.models = pretrained.models
+        predictor.__single_thread()
+        return predictor
+
+    def save(self, file:'str') -> None:
+        joblib.dump({"selector_type": self.selector_type, "models": self.models}, file)
+
+    def __single_thread(self) -> None:
+        for model in self.models:
+            if model is not None:
+                model.set_params(n_jobs=1)
+
+    def __pairs(self) -> 'list[tuple[int,int]]':
+        return [(i, j) for i in range(len(self.idx2comb)) for j in range(i + 1, len(self.idx2comb))]
+
+    def __scores(self, features:'np.ndarray') -> 'np.ndarray':
+        """
+        Returns, for each datapoint, a score of each option: the lower, the better
+        """
+        if self.selector_type == "regression":
+            return np.stack([model.predict(features) for model in self.models], axis=1)
+        votes = np.zeros((len(features), len(self.idx2comb)), dtype=np.int64)
+        for (i, j), model in zip(self.__pairs(), self.models):
+            if model is None:
+                continue
+            # a pair where one option was always the faster one has a single class
+            wins = model.predict(features).astype(bool) if len(model.classes_) > 1 else np.full(len(features), bool(model.classes_[0]))
+            votes[:, i] += wins
+            votes[:, j] += ~wins
+        return -votes
+
+    def predict_batch(self, features:'np.ndarray', filter:'bool'=False) -> 'np.ndarray':
+        """
+        Given a matrix with the features of a datapoint in each row, returns the index (in idx2comb) of the chosen option of each datapoint.
+        With filter, the features must be the predicted probabilities of each option not being competitive. Ties go to the lowest index
+        """
+        if len(features) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return self.choose(self.__scores(features), self.options_mask(features, filter, len(self.idx2comb)))
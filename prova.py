@@ -9,12 +9,10 @@ dataset = json.load(f)
 f.close()
 generator = Fzn2feat_generator("../EssenceCatalog-runs/problems/csplib-prob010-SocialGolfers/conjure-mode/portfolio4/01_compact.eprime")
 features = []
-for datapoint in tqdm.tqdm(dataset):
-    start = time()
-    res = generator.generate(f"../{datapoint['instance_name']}")
-    end = time()
-    features.append({"inst":datapoint["instance_name"], "features": res, "time": end - start})
+instances = [f"../{datapoint['instance_name']}" for datapoint in dataset]
+for res in tqdm.tqdm(generator.generate_batch(instances), total=len(instances)):
+    features.append({"inst":res["inst"][3:], "features": res["features"], "time": res["time"]})
 
 f = open(f"fzn2feat_social_golfers.json", "w")
 json.dump(features, f)
-f.close()
\ No newline at end of file
+f.close()